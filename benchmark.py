@@ -0,0 +1,49 @@
+import os
+import logging
+import argparse
+from mortgages.tape import load_constraints
+from mortgages.benchmark import Benchmark, append_results
+from mortgages.synthetic import generate
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--verbose', '-v', action='count')
+parser.add_argument('--loans', type=int, nargs='*', default=[],
+    help='sizes of the synthetic tapes to benchmark, which are generated from the real one if they do not exist yet')
+parser.add_argument('--no-real', action='store_true', help='do not benchmark the real tape in data')
+parser.add_argument('--seed', type=int, default=0, help='seed of the synthetic tapes')
+parser.add_argument('--directory', type=str, default='benchmarks', help='directory of the synthetic tapes and the stage outputs')
+parser.add_argument('--builder', choices=['pulp', 'matrix'], default='matrix')
+parser.add_argument('--solve', action='store_true', help='also time the solver, starting from the greedy assignment')
+parser.add_argument('--time-limit', type=float, help='seconds the solver may spend')
+parser.add_argument('--constraints-path', '-c', type=str, default='data/ConstraintsComparability.csv')
+parser.add_argument('--results-path', type=str, default='benchmarks/results.csv',
+    help='csv file that the timings and peak memory of every stage are appended to, with the current commit')
+args = parser.parse_args()
+
+log_levels = {
+    None: logging.WARNING,
+    1: logging.INFO,
+    2: logging.DEBUG
+}
+if args.verbose is not None and args.verbose >= len(log_levels):
+    args.verbose = len(log_levels)-1
+logging.basicConfig(format='%(message)s', level=log_levels[args.verbose])
+
+constraints = load_constraints(args.constraints_path)
+instances = [] if args.no_real else [('real', 'data')]
+for num_loans in args.loans:
+    raw_directory = os.path.join(args.directory, f'loans-{num_loans}-seed-{args.seed}')
+    if not os.path.exists(os.path.join(raw_directory, 'EligiblePricingCombinations.csv')):
+        generate(raw_directory, num_loans, args.seed)
+    instances.append((f'loans-{num_loans}', raw_directory))
+
+benchmarks = []
+for instance, raw_directory in instances:
+    # the processed files of every instance go below the benchmark directory, also those of the real tape
+    benchmark = Benchmark(instance, raw_directory, os.path.join(args.directory, instance, 'processed'),
+        os.path.join(args.directory, instance, 'output'), args.builder)
+    benchmark.run(constraints, args.solve, args.time_limit)
+    benchmarks.append(benchmark)
+    for stage in benchmark.stages:
+        print(f'{instance} {stage}')
+append_results(args.results_path, benchmarks)
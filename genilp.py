@@ -1,132 +1,54 @@
-import pulp
+import os
+import sys
+import csv
 import json
 import logging
-import csv
 import argparse
-
-# Do not allow importing this script from somewhere else
-if __name__ != '__main__':
-    logging.basicConfig(format='%(message)s')
-    logging.error('Import forbidden! Exiting..')
-    exit()
-
-def sum_deals(my_deals, my_factors = None):
-    if my_factors is None:
-        my_factors = [1] * len(my_deals)
-    if type(my_factors) != list:
-        my_factors = [my_factors] * len(my_deals)
-    is_first = True
-    my_sum = ''
-    for deal, factor in zip(my_deals, my_factors):
-        if is_first:
-            if factor != 1:
-                my_sum += f'{factor} * deals[{deal.id}]'
-            else:
-                my_sum += f'deals[{deal.id}]'
-            is_first = False
-        else:
-            if factor != 1:
-                my_sum += f'\n  + {factor} * deals[{deal.id}]'
-            else:
-                my_sum += f'\n  + deals[{deal.id}]'
-    return my_sum
-
-def show_dict(items):
-    for _, item in items.items():
-        logging.debug(item)
-        logging.debug('')
-
-def show_list(items, title=None):
-    if title is not None:
-        logging.debug(title)
-
-    for item in items:
-        logging.debug(item)
-        logging.debug('')
-
-def show_all(loans, pools, constraints, buyers):
-    show_dict(loans)
-
-    show_dict(pools)
-
-    show_dict(constraints)
-
-    show_list(buyers)
-
-loan_string = '''Loan {}
-    Amount: {}
-    FICO credit score: {}
-    Debt-To-Income ratio: {}
-    Is expensive: {}
-    Is in California: {}
-    Is paid by cashout: {}
-    Is primary residence: {}'''
-
-pool_string = '''Pool {}
-    Is standard: {}
-    Is single: {}
-    Servicer: {}'''
-
-buyer_string = '''Deal {}
-    Pool: {}
-    Loan: {}
-    Price: {}'''
-
-class Loan:
-
-    def __init__(self, loan_id, amount, fico, dti, is_expensive, is_california, is_cashout, is_primary,
-        occupancy, location, property_type, purpose):
-        self.id = loan_id
-        if int(amount) == amount:
-            self.amount = int(amount)
-        else:
-            self.amount = amount
-        self.fico = fico
-        self.dti = dti
-        self.is_expensive = is_expensive
-        self.is_california = is_california
-        self.is_cashout = is_cashout
-        self.is_primary = is_primary
-
-        self.occupancy = occupancy
-        self.location = location
-        self.property_type = property_type
-        self.purpose = purpose
-
-    def __str__(self):
-        return loan_string.format(self.id, self.amount, self.fico, self.dti,
-                self.is_expensive, self.is_california, self.is_cashout, self.is_primary)
-
-class Pool:
-
-    def __init__(self, pool_id, is_standard, is_single, servicer, agency):
-        self.id = pool_id
-        self.is_standard = is_standard
-        self.is_single = is_single
-        self.servicer = servicer
-        self.agency = agency
-
-    def __str__(self):
-        return pool_string.format(self.id,
-            self.is_standard, self.is_single, self.servicer)
-
-class Deal:
-
-    def __init__(self, buyer_id, pool_id, loan_id, price):
-        self.id = buyer_id
-        self.pool_id = pool_id
-        self.loan_id = loan_id
-        self.price = price
-
-    def __str__(self):
-        return buyer_string.format(self.id, self.pool_id, self.loan_id, self.price)
-
-# MAIN PROGRAM START
-#######################################################################
+from mortgages import load_tape_arrays, load_constraints, prune, prune_arrays, write_solution, solution_rows, column_values, comparability_centers
+from mortgages.cache import default_cache_directory
+from mortgages.ingest import up_to_date
+from mortgages.trace import start_trace, span
 
 parser = argparse.ArgumentParser()
 parser.add_argument('--verbose', '-v', action='count')
+parser.add_argument('--builder', choices=['pulp', 'matrix'], default='pulp',
+    help='build PuLP expressions and write MortgagesProblem.lp, or build a sparse matrix and write MortgagesProblem.mps')
+parser.add_argument('--presolve', action='store_true',
+    help='remove dominated and forced deals, short single issuer pools and the helper rows of loans reaching c2 before building the model')
+parser.add_argument('--solve', action='store_true',
+    help='solve the model in this process and write the solution and start.json instead of the model file')
+parser.add_argument('--solver', choices=['cbc', 'cplex', 'highs'],
+    help='solver backend; the matrix builder only supports highs, the PuLP builder defaults to cbc')
+parser.add_argument('--greedy-start', action='store_true',
+    help='center c13 to c18 on a greedy assignment instead of start.json and give it to the solver as a MIP start')
+parser.add_argument('--comparability', choices=['boxed', 'exact'], default='boxed',
+    help='box c13 to c18 around the centers in start.json, or bound the distance between the agencies exactly (matrix builder only)')
+parser.add_argument('--recenter', type=int, metavar='MAX_ITERATIONS',
+    help='solve the matrix model repeatedly, centering c13 to c18 on the previous solution, until the objective stops improving')
+parser.add_argument('--decompose', type=int, metavar='MAX_ITERATIONS',
+    help='bound the matrix model by Lagrangian relaxation of the rows coupling the --blocks, solving the blocks in parallel')
+parser.add_argument('--blocks', choices=['servicer', 'agency'], default='servicer', help='subproblems of --decompose')
+parser.add_argument('--processes', type=int, default=1, help='worker processes for the subproblems of --decompose')
+parser.add_argument('--history-path', type=str, help='csv file for the timings and objectives of the --recenter or --decompose iterations')
+parser.add_argument('--time-limit', type=float,
+    help='seconds the solver may spend (per iteration with --recenter, per subproblem with --decompose)')
+parser.add_argument('--constraints-path', '-c', type=str, default='data/ConstraintsComparability.csv')
+parser.add_argument('--solution-path', '-s', type=str, default='solution/MortgagesSolution.csv')
+parser.add_argument('--combination-store', type=str, metavar='DIRECTORY',
+    help='read the deals from this combination store of ingest.py instead of data_processed, so that memory does not grow with ChooseLoan.csv')
+parser.add_argument('--database', type=str, nargs='?', const='', metavar='PATH',
+    help='read the loans, pools and deals from this SQLite database instead of data_processed, and store the solved run in it; '
+        'without a PATH, from a working copy of data/mortgages.db in .cache')
+parser.add_argument('--trace-path', type=str,
+    help='write the wall and CPU seconds, peak memory and counts of every stage and constraint family to this json file')
+parser.add_argument('--chrome-trace', action='store_true', help='write the --trace-path in the Chrome trace event format of chrome://tracing')
 args = parser.parse_args()
+if args.comparability == 'exact' and (args.builder != 'matrix' or args.recenter or args.decompose):
+    parser.error('--comparability exact needs --builder matrix and has no windows to --recenter or --decompose')
+if args.recenter and args.decompose:
+    parser.error('--recenter and --decompose cannot be combined')
+if args.database is not None and args.combination_store:
+    parser.error('--database and --combination-store cannot be combined')
 
 log_levels = {
     None: logging.WARNING,
@@ -136,303 +58,143 @@ log_levels = {
 if args.verbose is not None and args.verbose >= len(log_levels):
     args.verbose = len(log_levels)-1
 logging.basicConfig(format='%(message)s', level=log_levels[args.verbose])
-
-loans = {}
-with open('data_processed/LoansFull.csv') as loans_file:
-    loans_reader = csv.reader(loans_file)
-    next(loans_reader) # consume the column names
-    for loan_id_string, amount_string, fico_string, dti_string,\
-            is_expensive_string, is_california_string,\
-            is_cashout_string, is_primary_string,\
-            occupancy, location, property_type, purpose in loans_reader:
-
-        # parse the loan row
-        loan_id = int(loan_id_string)
-        amount = float(amount_string)
-        fico = float(fico_string)
-        dti = float(dti_string)
-        is_expensive = int(is_expensive_string == '1')
-        is_california = int(is_california_string == '1')
-        is_cashout = int(is_cashout_string == '1')
-        is_primary = int(is_primary_string == '1')
-
-        loan = Loan(loan_id, amount, fico, dti,
-            is_expensive, is_california, is_cashout, is_primary,
-            occupancy, location, property_type, purpose)
-        loans[loan_id] = loan
-
-        assert type(loan.id) == int
-        assert type(loan.amount) in [float, int]
-        assert type(loan.fico) == float
-        assert type(loan.dti) == float
-        assert type(loan.is_expensive) == int, 'is_expensive should be an integer for easy multiplication and addition'
-        assert type(loan.is_california) == int, 'is_california should be an integer for easy multiplication and addition'
-        assert type(loan.is_cashout) == int, 'is_cashout should be an integer for easy multiplication and addition'
-        assert type(loan.is_primary) == int, 'is_primary should be an integer for easy multiplication and addition'
-        assert type(loan.occupancy) == str
-        assert type(loan.location) == str
-        assert type(loan.property_type) == str
-        assert type(loan.purpose) == str
-
-pools = {}
-with open('data_processed/Pools.csv') as pools_file:
-    pools_reader = csv.reader(pools_file)
-    next(pools_reader) # consume the column names
-    for pool_id_string, issuer_type, balance_type, agency, servicer in pools_reader:
-
-        # parse the pool row
-        pool_id = int(pool_id_string[5:])
-        is_standard = (balance_type == 'Standard Balance')
-        is_single = (issuer_type == 'Single-Issuer')
-
-        pool = Pool(pool_id, is_standard, is_single, servicer, agency)
-        pools[pool_id] = pool
-
-        assert type(pool.id) == int
-        assert type(pool.is_standard) == bool
-        assert type(pool.is_single) == bool
-        assert type(pool.servicer) == str
-        assert type(pool.agency) == str
-
-constraints = {}
-with open('data/ConstraintsComparability.csv') as constraints_file:
-    constraints_reader = csv.reader(constraints_file)
-    for name, value_string in constraints_reader:
-        value = float(value_string)
-        constraints[name] = value if int(value) != value else int(value)
-
-deals = {}
-with open('data_processed/ChooseLoan.csv') as choose_pool_file:
-    pool_loans_reader = csv.reader(choose_pool_file)
-    next(pool_loans_reader) # consume the column names
-    for i, (deal_id_string, pool_id_string, loan_id_string, price_string) in enumerate(pool_loans_reader):
-        pool_id = int(pool_id_string[5:])
-        deal_id = int(deal_id_string)
-        deal = Deal(deal_id, pool_id, int(loan_id_string), float(price_string))
-        deals[deal_id] = deal
-
-        assert type(deal.id) == int
-        assert type(deal.price) == float
-        assert type(deal.pool_id) == int
-        assert type(deal.loan_id) == int
-
-assert type(loans) == dict, 'Loans should be in a dict'
-assert type(pools) == dict, 'Pools should be in a dict'
-assert type(constraints) == dict, 'Constraints should be in a dict'
-assert type(deals) == dict, 'Deals should be in a dict'
-
-# remove a couple deals to make the problem easier
-take_every_deal = 1
-for deal_id in deals:
-    if deal_id % take_every_deal > 0:
-        del deals[deal_id]
-
-# remove infeasible deals, because the corresponding pool is a single issuer pool that cannot possibly reach its lower bound on the amount
-used_pool_ids = set([deal.pool_id for _, deal in deals.items()])
-for pool_id in list(pools):
-    pool = pools[pool_id]
-    if pool.is_single:
-        pool_deals = [deal for _, deal in deals.items() if deal.pool_id == pool_id]
-        loans_sum = sum(loans[deal.loan_id].amount for deal in pool_deals)
-        if loans_sum < constraints['c2']:
-            logging.debug(f'Single issuer pool {pool_id} cannot possibly satisfy its constraint; removing all deals involving this pool..')
-            for pool_deal in pool_deals:
-                del deals[pool_deal.id]
-
-# remove unnecessary loans (may be needed if this is a reduced input)
-used_loan_ids = set([deal.loan_id for _, deal in deals.items()])
-for loan_id in list(loans):
-    if loan_id not in used_loan_ids:
-        del loans[loan_id]
-
-# remove unnecessary pools (may be needed if this is a reduced input or some single issuer pools have been removed)
-used_pool_ids = set([deal.pool_id for _, deal in deals.items()])
-for pool_id in list(pools):
-    if pool_id not in used_pool_ids:
-        del pools[pool_id]
-
-assert len(deals) > 0
-
-deal_ids = [deal.id for _, deal in deals.items()]
-variables = pulp.LpVariable.dicts('Deal', lowBound=0, upBound=1, indexs=deal_ids, cat=pulp.LpInteger)
-
-single_pool_ids = [pool_id for pool_id in pools if pools[pool_id].is_single]
-single_variables = pulp.LpVariable.dicts('SinglePool', lowBound=0, upBound=1, indexs=single_pool_ids, cat=pulp.LpInteger)
-
-program = pulp.LpProblem('MortgagesProblem', pulp.LpMaximize)
-
-# Objective function
-program += pulp.lpSum([variables[deal.id] * deal.price for _, deal in deals.items()]), 'Total Selling Price'
-
-# For each loan having at least two pools: One mutex constraint
-for loan_id in loans:
-    loan_deals = [deal for _, deal in deals.items() if deal.loan_id == loan_id]
-    if len(loan_deals) >= 2:
-        program += pulp.lpSum([variables[deal.id] for deal in loan_deals]) <= 1, f'Mutex constraint for loan {loan_id}'
-
-# For each pool having at least one high balance loan: One standard balance constraint
-# For each single issuer pool: One single issuer constraint plus as many helper constraints as this pool is allowed loans
-for pool_id, pool in pools.items():
-    pool_deals = [deal for _, deal in deals.items() if deal.pool_id == pool_id]
-    high_balance_deals = [pool_deal for pool_deal in pool_deals if loans[pool_deal.loan_id].is_expensive]
-    if pool.is_standard and high_balance_deals:
-        lhs = pulp.lpSum([loans[high_balance_deal.loan_id].amount * variables[high_balance_deal.id] for high_balance_deal in high_balance_deals])
-        rhs = pulp.lpSum([constraints['c1'] * loans[pool_deal.loan_id].amount * variables[pool_deal.id] for pool_deal in pool_deals])
-        program += lhs <= rhs, f'Standard balance constraint for pool {pool_id}'
-    if pool.is_single:
-        pool_amounts = pulp.lpSum([loans[deal.loan_id].amount * variables[deal.id] for deal in pool_deals])
-        single_inequation = pool_amounts >= constraints['c2'] * single_variables[pool_id], f'Single issuer constraint for pool {pool_id}'
-        program +=  single_inequation
-        for deal in pool_deals:
-            single_helper_inequation = single_variables[pool_id] >= variables[deal.id], f'Pool {pool_id} is not empty if loan {deal.loan_id} is sold to it'
-            program += single_helper_inequation
-
-# 5 Pingora constraints
-pingora_deals = [deal for _, deal in deals.items() if pools[deal.pool_id].servicer == 'Pingora']
-sum_pingora_amounts = pulp.lpSum([loans[deal.loan_id].amount * variables[deal.id] for deal in pingora_deals])
-c3_inequation = sum_pingora_amounts <= constraints['c3'], f'Upper bound on the total amount sold to Pingora'
-program += c3_inequation
-
-sum_pingora_expensive_amounts = pulp.lpSum([loans[deal.loan_id].is_expensive * loans[deal.loan_id].amount * variables[deal.id] for deal in pingora_deals])
-c4_inequation = sum_pingora_expensive_amounts <= constraints['c4'] * sum_pingora_amounts, f'Upper bound on high balance loans sold to Pingora'
-program += c4_inequation
-
-sum_pingora_fico_amounts = pulp.lpSum([loans[deal.loan_id].fico * loans[deal.loan_id].amount * variables[deal.id] for deal in pingora_deals])
-c5_inequation = sum_pingora_fico_amounts >= constraints['c5'] * sum_pingora_amounts, f'Lower bound on the amount-relative average FICO score of loans sold to Pingora'
-program += c5_inequation
-
-sum_pingora_dti_amounts = pulp.lpSum([loans[deal.loan_id].dti * loans[deal.loan_id].amount * variables[deal.id] for deal in pingora_deals])
-c6_inequation = sum_pingora_dti_amounts <= constraints['c6'] * sum_pingora_amounts, f'Upper bound on the amount-relative average DTI of loans sold to Pingora'
-program += c6_inequation
-
-sum_pingora_californias = pulp.lpSum([loans[deal.loan_id].is_california * variables[deal.id] for deal in pingora_deals])
-num_pingora_deals = pulp.lpSum([variables[deal.id] for deal in pingora_deals])
-c7_inequation = sum_pingora_californias <= constraints['c7'] * num_pingora_deals, f'Upper bound on the number of loans issued to buy a residence in California and sold to Pingora'
-program += c7_inequation
-
-# 5 Two Harbors constraints
-two_harbors_deals = [deal for _, deal in deals.items() if pools[deal.pool_id].servicer == 'Two Harbors']
-two_harbors_amounts = pulp.lpSum([loans[deal.loan_id].amount * variables[deal.id] for deal in two_harbors_deals])
-c8_inequation = two_harbors_amounts >= constraints['c8'], 'Lower bound on the total amount sold to Two Harbors'
-program += c8_inequation
-
-two_harbors_fico_amounts = pulp.lpSum([loans[deal.loan_id].fico * loans[deal.loan_id].amount * variables[deal.id] for deal in two_harbors_deals])
-c9_inequation = two_harbors_fico_amounts >= constraints['c9'] * two_harbors_amounts, 'Lower bound on the amount-relative average FICO score of loans sold to Two Harbors'
-program += c9_inequation
-
-two_harbors_dti_amounts = pulp.lpSum([loans[deal.loan_id].dti * loans[deal.loan_id].amount * variables[deal.id] for deal in two_harbors_deals])
-c10_inequation = two_harbors_dti_amounts <= constraints['c10'] * two_harbors_amounts, 'Upper bound on the amount-relative average DTI of loans sold to Two Harbors'
-program += c10_inequation
-
-num_two_harbors_deals = pulp.lpSum([variables[deal.id] for deal in two_harbors_deals])
-two_harbors_cashouts = pulp.lpSum([loans[deal.loan_id].is_cashout * variables[deal.id] for deal in two_harbors_deals])
-c11_inequation = two_harbors_cashouts <= constraints['c11'] * num_two_harbors_deals, 'Upper bound on the number of loans issued in cash and sold to Two Harbors'
-program += c11_inequation
-
-two_harbors_primaries = pulp.lpSum([loans[deal.loan_id].is_primary * variables[deal.id] for deal in two_harbors_deals])
-c12_inequation = two_harbors_primaries >= constraints['c12'] * num_two_harbors_deals, 'Upper bound on the number of loans issued to finance a primary residence and sold to Two Harbors'
-program += c12_inequation
+if args.trace_path:
+    trace = start_trace('genilp')
+
+constraints = load_constraints(args.constraints_path)
+# the boxed c13 to c18 rows are centered on start.json, or on the greedy assignment only if asked for
+needs_start = args.comparability == 'boxed' and not args.greedy_start and bool(constraints.keys() & {'c13', 'c14', 'c15', 'c16', 'c17', 'c18'})
+if needs_start and not os.path.exists('start.json'):
+    parser.error('start.json does not exist: center c13 to c18 on a greedy assignment with --greedy-start or use --comparability exact')
+# writing the matrix model needs only the arrays of the tape, everything else works on its Loan, Pool and Deal records
+needs_records = args.builder == 'pulp' or args.presolve or args.solve or args.greedy_start or args.recenter or args.decompose
+store = None
+tape = None
+tape_arrays = None
+if args.database is not None:
+    from mortgages.store import Store
+
+    store = Store(args.database or None)
+    if not store.prepared:
+        store.prepare()
+    tape = store.load_tape()
+    prune(tape, constraints)
+elif args.combination_store:
+    from mortgages.chunked import store_tape_arrays
+
+    tape_arrays = prune_arrays(store_tape_arrays('data', args.combination_store), constraints)
+else:
+    if not up_to_date('data', 'data_processed'):
+        logging.warning('data_processed was not derived from the files in data, run ingest.py to derive it again')
+    tape_arrays = prune_arrays(load_tape_arrays(cache_directory=default_cache_directory), constraints)
+if tape is None and needs_records:
+    tape = tape_arrays.to_tape()
+if args.presolve:
+    from mortgages.presolve import presolve
+
+    report = presolve(tape, constraints)
+    tape_arrays = None
+    logging.info(f'Presolve report:\n{report}')
 
 # Special constraints for fairness between Fanny Mae and Freddy Mac
-fannie_deals = [deal for _, deal in deals.items() if pools[deal.pool_id].agency == 'Fannie Mae']
-freddie_deals = [deal for _, deal in deals.items() if pools[deal.pool_id].agency == 'Freddie Mac']
-logging.debug(f'Have {len(deals)} deals in total')
-logging.debug(f'Have {len(fannie_deals)} Fannie Mae deals')
-logging.debug(f'Have {len(freddie_deals)} Freddie Mac deals')
-
-
-with open('start.json') as start_file:
-    start = json.load(start_file)
-
-num_fannies = pulp.lpSum([variables[deal.id] for deal in fannie_deals])
-num_freddies = pulp.lpSum([variables[deal.id] for deal in freddie_deals])
-
-# FICO
-sum_fannies = pulp.lpSum([loans[deal.loan_id].amount * variables[deal.id] for deal in fannie_deals])
-sum_freddies = pulp.lpSum([loans[deal.loan_id].amount * variables[deal.id] for deal in freddie_deals])
-sum_fico_fannies = pulp.lpSum([loans[deal.loan_id].fico * loans[deal.loan_id].amount * variables[deal.id] for deal in fannie_deals])
-sum_fico_freddies = pulp.lpSum([loans[deal.loan_id].fico * loans[deal.loan_id].amount * variables[deal.id] for deal in freddie_deals])
-lower_fico_fannie = start['c13'] * sum_fannies <= sum_fico_fannies
-upper_fico_fannie = sum_fico_fannies <= (start['c13'] + constraints['c13']) * sum_fannies
-lower_fico_freddie = start['c13'] * sum_freddies <= sum_fico_freddies
-upper_fico_freddie = sum_fico_freddies <= (start['c13'] + constraints['c13']) * sum_freddies
-
-program += lower_fico_fannie
-program += upper_fico_fannie
-program += lower_fico_freddie
-program += upper_fico_freddie
-
-# DTI
-sum_fannies = pulp.lpSum([loans[deal.loan_id].amount * variables[deal.id] for deal in fannie_deals])
-sum_freddies = pulp.lpSum([loans[deal.loan_id].amount * variables[deal.id] for deal in freddie_deals])
-sum_dti_fannies = pulp.lpSum([loans[deal.loan_id].dti * loans[deal.loan_id].amount * variables[deal.id] for deal in fannie_deals])
-sum_dti_freddies = pulp.lpSum([loans[deal.loan_id].dti * loans[deal.loan_id].amount * variables[deal.id] for deal in freddie_deals])
-lower_dti_fannie = start['c14'] * sum_fannies <= sum_dti_fannies
-upper_dti_fannie = sum_dti_fannies <= (start['c14'] + constraints['c14']) * sum_fannies
-lower_dti_freddie = start['c14'] * sum_freddies <= sum_dti_freddies
-upper_dti_freddie = sum_dti_freddies <= (start['c14'] + constraints['c14']) * sum_freddies
-
-program += lower_dti_fannie
-program += upper_dti_fannie
-program += lower_dti_freddie
-program += upper_dti_freddie
-
-
-all_locations = set([loan.location for _, loan in loans.items()])
-for i, location in enumerate(all_locations):
-    sum_location_fannies = pulp.lpSum([variables[deal.id] for deal in fannie_deals if loans[deal.loan_id].location == location])
-    sum_location_freddies = pulp.lpSum([variables[deal.id] for deal in freddie_deals if loans[deal.loan_id].location == location])
-    lower_location_fannie = start['c15'][location] * num_fannies <= sum_location_fannies, f'Lower bound on number of Fannie Mae loans bound to a residence in {location}'
-    upper_location_fannie = sum_location_fannies <= (start['c15'][location] + constraints['c15']) * num_fannies, f'Upper bound on number of Fannie Mae loans bound to a residence in {location}'
-    lower_location_freddie = start['c15'][location] * num_freddies <= sum_location_freddies, f'Lower bound on number of Freddie Mac loans bound to a residence in {location}'
-    upper_location_freddie = sum_location_freddies <= (start['c15'][location] + constraints['c15']) * num_freddies, f'Upper bound on number of Freddie Mac loans bound to a residence in {location}'
-
-    program += lower_location_fannie
-    program += upper_location_fannie
-    program += lower_location_freddie
-    program += upper_location_freddie
-
-all_occupancies = set([loan.occupancy for _, loan in loans.items()])
-for i, occupancy in enumerate(all_occupancies):
-    sum_occupancy_fannies = pulp.lpSum([variables[deal.id] for deal in fannie_deals if loans[deal.loan_id].occupancy == occupancy])
-    sum_occupancy_freddies = pulp.lpSum([variables[deal.id] for deal in freddie_deals if loans[deal.loan_id].occupancy == occupancy])
-    lower_occupancy_fannie = start['c16'][occupancy] * num_fannies <= sum_occupancy_fannies, f'Lower bound on number of Fannie Mae loans bound to a {occupancy.replace("/"," per ")} residence'
-    upper_occupancy_fannie = sum_occupancy_fannies <= (start['c16'][occupancy] + constraints['c16']) * num_fannies, f'Upper bound on number of Fannie Mae loans bound to a {occupancy.replace("/"," per ")} residence'
-    lower_occupancy_freddie = start['c16'][occupancy] * num_freddies <= sum_occupancy_freddies, f'Lower bound on number of Freddie Mac loans bound to a {occupancy.replace("/"," per ")} residence'
-    upper_occupancy_freddie = sum_occupancy_freddies <= (start['c16'][occupancy] + constraints['c16']) * num_freddies, f'Upper bound on number of Freddie Mac loans bound to a {occupancy.replace("/"," per ")} residence'
-
-    program += lower_occupancy_fannie
-    program += upper_occupancy_fannie
-    program += lower_occupancy_freddie
-    program += upper_occupancy_freddie
-
-all_purposes = set([loan.purpose for _, loan in loans.items()])
-for i, purpose in enumerate(all_purposes):
-    sum_purpose_fannies = pulp.lpSum([variables[deal.id] for deal in fannie_deals if loans[deal.loan_id].purpose == purpose])
-    sum_purpose_freddies = pulp.lpSum([variables[deal.id] for deal in freddie_deals if loans[deal.loan_id].purpose == purpose])
-    lower_purpose_fannie = start['c17'][purpose] * num_fannies <= sum_purpose_fannies, f'Lower bound on number of Fannie Mae loans given out as a {purpose.replace("/"," per ")}'
-    upper_purpose_fannie = sum_purpose_fannies <= (start['c17'][purpose] + constraints['c17']) * num_fannies, f'Upper bound on number of Fannie Mae loans given out as a {purpose.replace("/"," per ")}'
-    lower_purpose_freddie = start['c17'][purpose] * num_freddies <= sum_purpose_freddies, f'Lower bound on number of Freddie Mac loans given out as a {purpose.replace("/"," per ")}'
-    upper_purpose_freddie = sum_purpose_freddies <= (start['c17'][purpose] + constraints['c17']) * num_freddies, f'Upper bound on number of Freddie Mac loans given out as a {purpose.replace("/"," per ")}'
-
-    program += lower_purpose_fannie
-    program += upper_purpose_fannie
-    program += lower_purpose_freddie
-    program += upper_purpose_freddie
-
-all_types = set([loan.property_type for _, loan in loans.items()])
-for i, property_type in enumerate(all_types):
-    sum_property_type_fannies = pulp.lpSum([variables[deal.id] for deal in fannie_deals if loans[deal.loan_id].property_type == property_type])
-    sum_property_type_freddies = pulp.lpSum([variables[deal.id] for deal in freddie_deals if loans[deal.loan_id].property_type == property_type])
-    lower_property_type_fannie = start['c18'][property_type] * num_fannies <= sum_property_type_fannies, f'Lower bound on number of Fannie Mae loans bound to a residence of type {property_type.replace("/"," per ")}'
-    upper_property_type_fannie = sum_property_type_fannies <= (start['c18'][property_type] + constraints['c18']) * num_fannies, f'Upper bound on number of Fannie Mae loans bound to a residence of type {property_type.replace("/"," per ")}'
-    lower_property_type_freddie = start['c18'][property_type] * num_freddies <= sum_property_type_freddies, f'Lower bound on number of Freddie Mac loans bound to a residence of type {property_type.replace("/"," per ")}'
-    upper_property_type_freddie = sum_property_type_freddies <= (start['c18'][property_type] + constraints['c18']) * num_freddies, f'Upper bound on number of Freddie Mac loans bound to a residence of type {property_type.replace("/"," per ")}'
-
-    program += lower_property_type_fannie
-    program += upper_property_type_fannie
-    program += lower_property_type_freddie
-    program += upper_property_type_freddie
-
-program.writeLP('MortgagesProblem.lp')
-logging.info('Integer Linear Program written to MortgagesProblem.lp')
+if tape is not None:
+    logging.debug(f'Have {len(tape.deals)} deals in total')
+    logging.debug(f'Have {len(tape.index.agency_deals("Fannie Mae"))} Fannie Mae deals')
+    logging.debug(f'Have {len(tape.index.agency_deals("Freddie Mac"))} Freddie Mac deals')
+
+initial_values = None
+start = None
+taken_deal_ids = None
+if args.greedy_start:
+    from mortgages.heuristic import greedy_assignment
+
+    taken_deal_ids = greedy_assignment(tape, constraints).taken_deal_ids
+    start = comparability_centers(tape, taken_deal_ids, constraints, centered=True)
+    initial_values = column_values(tape, taken_deal_ids)
+    if args.comparability == 'exact':
+        from mortgages.model import TapeArrays
+        from mortgages.matrix import exact_column_values
+
+        initial_values.update(exact_column_values(TapeArrays(tape), taken_deal_ids, constraints))
+elif needs_start:
+    with open('start.json') as start_file:
+        start = json.load(start_file)
+
+if args.recenter:
+    from mortgages.recenter import search_windows
+
+    args.solve = True
+    solution, start, iterations = search_windows(tape, constraints, start, initial_values, args.time_limit,
+        args.recenter, msg=args.verbose is not None and args.verbose >= 2)
+    if args.history_path:
+        with open(args.history_path, 'w') as history_file:
+            history_csv = csv.writer(history_file)
+            history_csv.writerow(['Iteration', 'BuildSeconds', 'SolveSeconds', 'Objective', 'Status'])
+            history_csv.writerows(iteration.row() for iteration in iterations)
+elif args.decompose:
+    from mortgages.decompose import decompose
+
+    args.solve = True
+    solution, iterations = decompose(tape, constraints, start, taken_deal_ids, args.blocks, args.decompose, args.time_limit,
+        processes=args.processes)
+    if args.history_path:
+        with open(args.history_path, 'w') as history_file:
+            history_csv = csv.writer(history_file)
+            history_csv.writerow(['Iteration', 'DualBound', 'PrimalBound', 'Gap', 'ViolatedRows', 'Seconds'])
+            history_csv.writerows(iteration.row() for iteration in iterations)
+elif args.builder == 'matrix':
+    from mortgages.model import TapeArrays
+    from mortgages.matrix import build_matrix
+    from mortgages.solve import solve_matrix
+
+    model = build_matrix(tape_arrays if tape_arrays is not None else TapeArrays(tape), constraints, start, args.comparability)
+    logging.info(f'Built a {model.num_rows} x {model.num_columns} matrix with {model.matrix.nnz} nonzeros')
+    if args.solve:
+        solution = solve_matrix(model, args.solver or 'highs', args.time_limit, msg=args.verbose is not None,
+            initial_values=initial_values)
+    else:
+        from mortgages.mps import write_mps
+
+        write_mps(model, 'MortgagesProblem.mps', 'MortgagesProblem.names')
+        logging.info('Integer Linear Program written to MortgagesProblem.mps, row labels to MortgagesProblem.names')
+else:
+    from mortgages.build import build_program
+    from mortgages.solve import solve_program
+
+    model = build_program(tape, constraints, start)
+    if args.solve:
+        solution = solve_program(model, args.solver or 'cbc', args.time_limit, msg=args.verbose is not None,
+            initial_values=initial_values)
+    else:
+        with span('write'):
+            model.program.writeLP('MortgagesProblem.lp')
+        logging.info('Integer Linear Program written to MortgagesProblem.lp')
+
+if args.solve:
+    from mortgages.report import load_scoring_tables
+
+    taken_deal_ids = solution.taken_deal_ids
+    logging.info(f'Objective {solution.objective}, {len(taken_deal_ids)} loans sold')
+    assert len(taken_deal_ids) > 0
+
+    os.makedirs(os.path.dirname(args.solution_path) or '.', exist_ok=True)
+    with open(args.solution_path, 'w') as solution_file:
+        write_solution(csv.writer(solution_file), tape, taken_deal_ids)
+    logging.info(f'Solution written to {args.solution_path}')
+
+    start = comparability_centers(tape, taken_deal_ids, constraints)
+    with open('start.json', 'w') as start_file:
+        json.dump(start, start_file, indent=4)
+
+    tables = load_scoring_tables('data', default_cache_directory) if store is None else store.scoring_tables()
+    rows = solution_rows(tape, taken_deal_ids)
+    report = tables.report(constraints, rows)
+    logging.info(f'Score {report.score}, normalized score {report.normalized_score}')
+    for violation in report.violations:
+        logging.error(f'The solution violates {violation}')
+    if store is not None:
+        run_id = store.save_run(os.path.basename(args.constraints_path), rows, report, description=' '.join(sys.argv[1:]))
+        logging.info(f'Run {run_id} stored in {store.path}')
+
+if args.trace_path:
+    trace.write(args.trace_path, args.chrome_trace)
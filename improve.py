@@ -0,0 +1,54 @@
+import os
+import csv
+import logging
+import argparse
+from mortgages import load_tape, load_constraints, prune, greedy_assignment, read_solution_rows, write_solution, solution_rows
+from mortgages.cache import default_cache_directory
+from mortgages.report import load_scoring_tables
+from mortgages.local_search import LocalSearch
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--verbose', '-v', action='count')
+parser.add_argument('--constraints-path', '-c', type=str, default='data/ConstraintsComparability.csv')
+parser.add_argument('--start-path', type=str,
+    help='feasible Loan, Pool, Servicer solution to start from, e.g. written by sol2csv.py; the greedy assignment otherwise')
+parser.add_argument('--solution-path', '-s', type=str, default='solution/MortgagesSolution.csv')
+parser.add_argument('--time-budget', type=float, default=60, help='seconds the local search may spend')
+parser.add_argument('--lns-pools', type=int, default=6, help='how many pools each LNS step frees')
+parser.add_argument('--seed', type=int, default=0)
+args = parser.parse_args()
+
+log_levels = {
+    None: logging.WARNING,
+    1: logging.INFO,
+    2: logging.DEBUG
+}
+if args.verbose is not None and args.verbose >= len(log_levels):
+    args.verbose = len(log_levels)-1
+logging.basicConfig(format='%(message)s', level=log_levels[args.verbose])
+
+tape = load_tape(cache_directory=default_cache_directory)
+constraints = load_constraints(args.constraints_path)
+prune(tape, constraints)
+
+if args.start_path:
+    with open(args.start_path) as start_file:
+        taken_deal_ids = read_solution_rows(tape, [(row['Loan'], row['Pool'], row['Servicer']) for row in csv.DictReader(start_file)])
+else:
+    taken_deal_ids = greedy_assignment(tape, constraints).taken_deal_ids
+
+tables = load_scoring_tables('data', default_cache_directory)
+search = LocalSearch(tape, tables, constraints, taken_deal_ids, seed=args.seed)
+taken_deal_ids = search.improve(args.time_budget, lns_pools=args.lns_pools)
+for seconds, step, objective in search.history:
+    logging.info(f'{seconds:8.1f}s {step:>5} {objective}')
+
+os.makedirs(os.path.dirname(args.solution_path) or '.', exist_ok=True)
+with open(args.solution_path, 'w') as solution_file:
+    write_solution(csv.writer(solution_file), tape, taken_deal_ids)
+logging.info(f'Solution written to {args.solution_path}')
+
+report = tables.report(constraints, solution_rows(tape, taken_deal_ids))
+logging.info(f'Score {report.score}, normalized score {report.normalized_score}')
+for violation in report.violations:
+    logging.error(f'The solution violates {violation}')
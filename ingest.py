@@ -0,0 +1,36 @@
+import logging
+import argparse
+from mortgages.ingest import ingest
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--verbose', '-v', action='count')
+parser.add_argument('--raw-directory', type=str, default='data',
+    help='directory of LoanData.csv, PoolOptionData.csv and EligiblePricingCombinations.csv')
+parser.add_argument('--processed-directory', type=str, default='data_processed',
+    help='directory to write LoansFull.csv, Loans.csv, Pools.csv, ChooseLoan.csv and DealsInfo.csv to')
+parser.add_argument('--force', action='store_true', help='write the processed files even if the raw files have not changed')
+parser.add_argument('--combination-store', type=str, metavar='DIRECTORY',
+    help='instead of the processed files, stream the combinations into compact arrays in this directory within --memory-budget')
+parser.add_argument('--memory-budget', type=float, default=256, help='megabytes the --combination-store may take while it is built')
+parser.add_argument('--top-k', type=int, help='keep only this many best priced combinations of every loan in the --combination-store')
+parser.add_argument('--constraints-path', '-c', type=str,
+    help='drop the combinations of the single issuer pools that cannot reach the c2 of these constraints from the --combination-store')
+args = parser.parse_args()
+
+log_levels = {
+    None: logging.WARNING,
+    1: logging.INFO,
+    2: logging.DEBUG
+}
+if args.verbose is not None and args.verbose >= len(log_levels):
+    args.verbose = len(log_levels)-1
+logging.basicConfig(format='%(message)s', level=log_levels[args.verbose])
+
+if args.combination_store:
+    from mortgages import load_constraints
+    from mortgages.chunked import build_combination_store
+
+    c2 = load_constraints(args.constraints_path)['c2'] if args.constraints_path else None
+    build_combination_store(args.raw_directory, args.combination_store, int(args.memory_budget * 2**20), args.top_k, c2)
+else:
+    ingest(args.raw_directory, args.processed_directory, args.force)
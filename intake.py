@@ -0,0 +1,59 @@
+import os
+import csv
+import logging
+import argparse
+from mortgages import load_tape, load_constraints, prune, write_solution, read_solution_rows
+from mortgages.cache import default_cache_directory
+from mortgages.ingest import raw_files
+from mortgages.intake import LoanIntake, read_batch
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--verbose', '-v', action='count')
+parser.add_argument('--constraints-path', '-c', type=str, default='data/ConstraintsComparability.csv')
+parser.add_argument('--batches', type=str, nargs='+', required=True, metavar='DIRECTORY',
+    help='directories with the LoanData.csv and EligiblePricingCombinations.csv of the new loans, sold in this order')
+parser.add_argument('--latency-budget', type=float, help='seconds every batch may take until its allocation is returned')
+parser.add_argument('--pools-per-loan', type=int, default=1,
+    help='every new loan frees the loans sold to this many of its best priced pools for the re-optimization')
+parser.add_argument('--max-freed', type=int, default=200, help='at most this many sold loans are freed per batch')
+parser.add_argument('--initial-solution-path', type=str,
+    help='the allocation of the tape before the first batch in the format of MortgagesSolution.csv, by default the greedy assignment')
+parser.add_argument('--solution-path', '-s', type=str, help='csv file for the allocation after the last batch')
+parser.add_argument('--history-path', type=str, help='csv file for the sizes, timings and objectives of the batches')
+args = parser.parse_args()
+
+log_levels = {
+    None: logging.WARNING,
+    1: logging.INFO,
+    2: logging.DEBUG
+}
+if args.verbose is not None and args.verbose >= len(log_levels):
+    args.verbose = len(log_levels)-1
+logging.basicConfig(format='%(message)s', level=log_levels[args.verbose])
+
+tape = load_tape(cache_directory=default_cache_directory)
+pools = dict(tape.pools)
+constraints = load_constraints(args.constraints_path)
+prune(tape, constraints)
+
+taken_deal_ids = None
+if args.initial_solution_path:
+    with open(args.initial_solution_path) as solution_file:
+        solution_csv = csv.reader(solution_file)
+        next(solution_csv) # skip the csv heading
+        taken_deal_ids = read_solution_rows(tape, solution_csv)
+intake = LoanIntake(tape, constraints, taken_deal_ids, pools)
+
+for directory in args.batches:
+    loans, combinations = read_batch(os.path.join(directory, raw_files[0]), os.path.join(directory, raw_files[2]))
+    intake.add_batch(loans, combinations, args.latency_budget, args.pools_per_loan, args.max_freed)
+
+if args.history_path:
+    with open(args.history_path, 'w') as history_file:
+        history_csv = csv.writer(history_file)
+        history_csv.writerow(['Batch', 'Loans', 'Deals', 'FreedLoans', 'BuildSeconds', 'SolveSeconds', 'Objective', 'Status', 'Sold'])
+        history_csv.writerows(batch.row() for batch in intake.batches)
+if args.solution_path:
+    os.makedirs(os.path.dirname(args.solution_path) or '.', exist_ok=True)
+    with open(args.solution_path, 'w') as solution_file:
+        write_solution(csv.writer(solution_file), tape, intake.taken_deal_ids)
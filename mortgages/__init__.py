@@ -0,0 +1,23 @@
+'''Pooling of mortgage loans as an integer linear program
+
+The stages load, prune, build, solve, extract and score are plain functions over a parsed Tape, so that
+one process can keep a tape in memory and run many scenarios on it.'''
+from .tape import Loan, Pool, Deal, DealIndex, Tape, load_tape, load_tape_arrays, load_constraints
+from .prune import prune, prune_arrays
+from .build import PulpModel, build_program
+from .solve import Solution, solve_program, solve_matrix
+from .extract import read_taken_deal_ids, read_solution_rows, solution_rows, write_solution, column_values, comparability_centers
+from .heuristic import GreedyAssignment, greedy_assignment
+from .pipeline import run_scenario
+from .score import evaluate, score_solution
+from .report import Check, ScoreReport, ScoringTables, load_scoring_tables
+from .delta import DeltaEvaluator
+from .local_search import LocalSearch
+from .shared import SharedTape, attach_tape
+from .portfolio import Scenario, Outcome, run_portfolio
+from .store import Store
+from .model import TapeArrays
+from .parametric import ParametricModel
+from .sweep import SweepPoint, run_sweep
+from .intake import LoanIntake, read_batch
+from .chunked import build_combination_store, store_tape_arrays
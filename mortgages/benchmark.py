@@ -0,0 +1,118 @@
+import os
+import csv
+import time
+import logging
+import subprocess
+from .ingest import ingest
+from .tape import load_tape
+from .prune import prune
+from .extract import solution_rows, write_solution
+from .trace import reset_peak_memory, peak_memory
+
+results_header = ['Commit', 'Created', 'Instance', 'Loans', 'Pools', 'Deals', 'Builder', 'Stage', 'Seconds', 'PeakMegabytes']
+
+def current_commit():
+    '''Returns the short hash of the checked out commit, or an empty string outside of a git checkout'''
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+class Stage:
+    '''The wall clock seconds and the peak memory of one stage of a benchmark run'''
+
+    def __init__(self, name, seconds, peak_bytes):
+        self.name = name
+        self.seconds = seconds
+        self.peak_bytes = peak_bytes
+
+    def __str__(self):
+        return f'{self.name}: {self.seconds:.3f} seconds, {self.peak_bytes / 2**20:.1f} MB peak'
+
+class Benchmark:
+    '''Times the stages of genilp, sol2csv and the scorer on one instance
+
+    Every stage is measured on its own: the peak memory is reset before it starts, where the platform allows.'''
+
+    def __init__(self, instance, raw_directory, processed_directory, output_directory, builder='matrix'):
+        self.instance = instance
+        self.raw_directory = raw_directory
+        self.processed_directory = processed_directory
+        self.output_directory = output_directory
+        self.builder = builder
+        self.stages = []
+        self.sizes = (0, 0, 0)
+
+    def measure(self, name, function, *arguments):
+        reset_peak_memory()
+        started = time.time()
+        result = function(*arguments)
+        stage = Stage(name, time.time() - started, peak_memory())
+        logging.debug(f'{self.instance} {stage}')
+        self.stages.append(stage)
+        return result
+
+    def run(self, constraints, solve=False, time_limit=None):
+        '''Runs parse, prune, greedy, build, write, solve, extract and score; without solve, the greedy
+        assignment stands in for the solution of the extract and score stages'''
+        from .heuristic import greedy_assignment
+        from .extract import column_values, comparability_centers
+        from .report import load_scoring_tables
+
+        os.makedirs(self.output_directory, exist_ok=True)
+
+        def parse():
+            ingest(self.raw_directory, self.processed_directory)
+            return load_tape(self.processed_directory)
+
+        tape = self.measure('parse', parse)
+        self.measure('prune', prune, tape, constraints)
+        self.sizes = (len(tape.loans), len(tape.pools), len(tape.deals))
+        taken_deal_ids = self.measure('greedy', lambda: greedy_assignment(tape, constraints).taken_deal_ids)
+        start = comparability_centers(tape, taken_deal_ids, constraints, centered=True)
+
+        if self.builder == 'matrix':
+            from .model import TapeArrays
+            from .matrix import build_matrix
+            from .mps import write_mps
+            from .solve import solve_matrix
+
+            model = self.measure('build', lambda: build_matrix(TapeArrays(tape), constraints, start))
+            self.measure('write', write_mps, model, os.path.join(self.output_directory, 'MortgagesProblem.mps'))
+            solve_model = lambda: solve_matrix(model, 'highs', time_limit, initial_values=column_values(tape, taken_deal_ids))
+        else:
+            from .build import build_program
+            from .solve import solve_program
+
+            model = self.measure('build', build_program, tape, constraints, start)
+            self.measure('write', model.program.writeLP, os.path.join(self.output_directory, 'MortgagesProblem.lp'))
+            solve_model = lambda: solve_program(model, 'cbc', time_limit, initial_values=column_values(tape, taken_deal_ids))
+        if solve:
+            taken_deal_ids = self.measure('solve', solve_model).taken_deal_ids
+
+        def extract():
+            with open(os.path.join(self.output_directory, 'MortgagesSolution.csv'), 'w') as solution_file:
+                write_solution(csv.writer(solution_file), tape, taken_deal_ids)
+            return solution_rows(tape, taken_deal_ids)
+
+        rows = self.measure('extract', extract)
+        report = self.measure('score', lambda: load_scoring_tables(self.raw_directory).report(constraints, rows))
+        logging.info(f'{self.instance} score {report.score}, {len(report.violations)} violations')
+        return report
+
+    def rows(self, commit, created):
+        return [[commit, created, self.instance, *self.sizes, self.builder, stage.name, round(stage.seconds, 6),
+            round(stage.peak_bytes / 2**20, 1)] for stage in self.stages]
+
+def append_results(path, benchmarks):
+    '''Appends the stages of the benchmarks to the results csv at path, writing its header if it is new'''
+    commit = current_commit()
+    created = time.strftime('%Y-%m-%d %H:%M:%S')
+    is_new = not os.path.exists(path)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'a', newline='') as results_file:
+        results_csv = csv.writer(results_file, lineterminator='\n')
+        if is_new:
+            results_csv.writerow(results_header)
+        for benchmark in benchmarks:
+            results_csv.writerows(benchmark.rows(commit, created))
@@ -0,0 +1,147 @@
+import pulp
+import contextlib
+from .tape import agencies, comparable_categories, group_deals
+from .presolve import needs_single_link
+from .trace import span, tracing, traced
+
+class PulpModel:
+    '''The PuLP program of the mortgages problem together with its deal and single issuer pool variables'''
+
+    def __init__(self, program, variables, single_variables):
+        self.program = program
+        self.variables = variables
+        self.single_variables = single_variables
+
+@contextlib.contextmanager
+def family(name, program):
+    '''Records a constraint family as a span with the rows it adds, the variables they touch and their nonzeros'''
+    first_row = len(program.constraints)
+    with span(name, 'family') as counts:
+        yield
+        if tracing():
+            rows = list(program.constraints.values())[first_row:]
+            counts.update(rows=len(rows), nonzeros=sum(len(row) for row in rows),
+                columns=len({variable.name for row in rows for variable in row}))
+
+def add_mutex_constraints(model, tape):
+    # For each loan having at least two pools: One mutex constraint
+    for loan_id in tape.loans:
+        loan_deals = tape.index.loan_deals(loan_id)
+        if len(loan_deals) >= 2:
+            model.program += pulp.lpSum([model.variables[deal.id] for deal in loan_deals]) <= 1, f'Mutex constraint for loan {loan_id}'
+
+def add_pool_constraints(model, tape, constraints):
+    # For each pool having at least one high balance loan: One standard balance constraint
+    # For each single issuer pool: One single issuer constraint plus as many helper constraints as this pool is allowed loans
+    loans, variables, program = tape.loans, model.variables, model.program
+    for pool_id, pool in tape.pools.items():
+        pool_deals = tape.index.pool_deals(pool_id)
+        high_balance_deals = [pool_deal for pool_deal in pool_deals if loans[pool_deal.loan_id].is_expensive]
+        if pool.is_standard and high_balance_deals:
+            lhs = pulp.lpSum([loans[high_balance_deal.loan_id].amount * variables[high_balance_deal.id] for high_balance_deal in high_balance_deals])
+            rhs = pulp.lpSum([constraints['c1'] * loans[pool_deal.loan_id].amount * variables[pool_deal.id] for pool_deal in pool_deals])
+            program += lhs <= rhs, f'Standard balance constraint for pool {pool_id}'
+        if pool.is_single:
+            # amounts above c2 are cut down to c2, which leaves the integer solutions alone but tightens the relaxation
+            pool_amounts = pulp.lpSum([min(loans[deal.loan_id].amount, constraints['c2']) * variables[deal.id] for deal in pool_deals])
+            program += pool_amounts >= constraints['c2'] * model.single_variables[pool_id], f'Single issuer constraint for pool {pool_id}'
+            for deal in pool_deals:
+                if not tape.presolved_with or needs_single_link(loans[deal.loan_id].amount, constraints):
+                    program += model.single_variables[pool_id] >= variables[deal.id], f'Pool {pool_id} is not empty if loan {deal.loan_id} is sold to it'
+
+def add_pingora_constraints(model, tape, constraints):
+    # 5 Pingora constraints
+    loans, variables, program = tape.loans, model.variables, model.program
+    pingora_deals = tape.index.servicer_deals('Pingora')
+    sum_pingora_amounts = pulp.lpSum([loans[deal.loan_id].amount * variables[deal.id] for deal in pingora_deals])
+    program += sum_pingora_amounts <= constraints['c3'], 'Upper bound on the total amount sold to Pingora'
+
+    sum_pingora_expensive_amounts = pulp.lpSum([loans[deal.loan_id].is_expensive * loans[deal.loan_id].amount * variables[deal.id] for deal in pingora_deals])
+    program += sum_pingora_expensive_amounts <= constraints['c4'] * sum_pingora_amounts, 'Upper bound on high balance loans sold to Pingora'
+
+    sum_pingora_fico_amounts = pulp.lpSum([loans[deal.loan_id].fico * loans[deal.loan_id].amount * variables[deal.id] for deal in pingora_deals])
+    program += sum_pingora_fico_amounts >= constraints['c5'] * sum_pingora_amounts, 'Lower bound on the amount-relative average FICO score of loans sold to Pingora'
+
+    sum_pingora_dti_amounts = pulp.lpSum([loans[deal.loan_id].dti * loans[deal.loan_id].amount * variables[deal.id] for deal in pingora_deals])
+    program += sum_pingora_dti_amounts <= constraints['c6'] * sum_pingora_amounts, 'Upper bound on the amount-relative average DTI of loans sold to Pingora'
+
+    sum_pingora_californias = pulp.lpSum([loans[deal.loan_id].is_california * variables[deal.id] for deal in pingora_deals])
+    num_pingora_deals = pulp.lpSum([variables[deal.id] for deal in pingora_deals])
+    program += sum_pingora_californias <= constraints['c7'] * num_pingora_deals, 'Upper bound on the number of loans issued to buy a residence in California and sold to Pingora'
+
+def add_two_harbors_constraints(model, tape, constraints):
+    # 5 Two Harbors constraints
+    loans, variables, program = tape.loans, model.variables, model.program
+    two_harbors_deals = tape.index.servicer_deals('Two Harbors')
+    two_harbors_amounts = pulp.lpSum([loans[deal.loan_id].amount * variables[deal.id] for deal in two_harbors_deals])
+    program += two_harbors_amounts >= constraints['c8'], 'Lower bound on the total amount sold to Two Harbors'
+
+    two_harbors_fico_amounts = pulp.lpSum([loans[deal.loan_id].fico * loans[deal.loan_id].amount * variables[deal.id] for deal in two_harbors_deals])
+    program += two_harbors_fico_amounts >= constraints['c9'] * two_harbors_amounts, 'Lower bound on the amount-relative average FICO score of loans sold to Two Harbors'
+
+    two_harbors_dti_amounts = pulp.lpSum([loans[deal.loan_id].dti * loans[deal.loan_id].amount * variables[deal.id] for deal in two_harbors_deals])
+    program += two_harbors_dti_amounts <= constraints['c10'] * two_harbors_amounts, 'Upper bound on the amount-relative average DTI of loans sold to Two Harbors'
+
+    num_two_harbors_deals = pulp.lpSum([variables[deal.id] for deal in two_harbors_deals])
+    two_harbors_cashouts = pulp.lpSum([loans[deal.loan_id].is_cashout * variables[deal.id] for deal in two_harbors_deals])
+    program += two_harbors_cashouts <= constraints['c11'] * num_two_harbors_deals, 'Upper bound on the number of loans issued in cash and sold to Two Harbors'
+
+    two_harbors_primaries = pulp.lpSum([loans[deal.loan_id].is_primary * variables[deal.id] for deal in two_harbors_deals])
+    program += two_harbors_primaries >= constraints['c12'] * num_two_harbors_deals, 'Upper bound on the number of loans issued to finance a primary residence and sold to Two Harbors'
+
+def add_comparability_constraints(model, tape, constraints, start):
+    '''Boxes the measures of both agencies into the windows [start, start + tolerance] of c13 to c18; the
+    constraints missing from the constraints file are left out'''
+    # Special constraints for fairness between Fanny Mae and Freddy Mac
+    loans, variables, program = tape.loans, model.variables, model.program
+    for agency in agencies:
+        agency_deals = tape.index.agency_deals(agency)
+        num_agency_deals = pulp.lpSum([variables[deal.id] for deal in agency_deals])
+        sum_amounts = pulp.lpSum([loans[deal.loan_id].amount * variables[deal.id] for deal in agency_deals])
+
+        # FICO and DTI
+        for name, field in [('c13', 'fico'), ('c14', 'dti')]:
+            if name not in constraints:
+                continue
+            sum_weighted = pulp.lpSum([getattr(loans[deal.loan_id], field) * loans[deal.loan_id].amount * variables[deal.id] for deal in agency_deals])
+            program += start[name] * sum_amounts <= sum_weighted
+            program += sum_weighted <= (start[name] + constraints[name]) * sum_amounts
+
+        for name, field, description in comparable_categories:
+            if name not in constraints:
+                continue
+            value_deals = group_deals(agency_deals, lambda deal: getattr(loans[deal.loan_id], field))
+            for value in set(getattr(loan, field) for loan in loans.values()):
+                sum_value_deals = pulp.lpSum([variables[deal.id] for deal in value_deals[value]])
+                label = description.format(value.replace('/', ' per '))
+                program += start[name][value] * num_agency_deals <= sum_value_deals, f'Lower bound on number of {agency} loans {label}'
+                program += sum_value_deals <= (start[name][value] + constraints[name]) * num_agency_deals, f'Upper bound on number of {agency} loans {label}'
+
+@traced('build', lambda model, *arguments, **keywords: {'rows': len(model.program.constraints),
+    'columns': len(model.variables) + len(model.single_variables),
+    'nonzeros': sum(len(constraint) for constraint in model.program.constraints.values())})
+def build_program(tape, constraints, start):
+    '''Builds the PuLP program over the deals of the (pruned) tape'''
+    deal_ids = list(tape.deals)
+    variables = pulp.LpVariable.dicts('Deal', deal_ids, lowBound=0, upBound=1, cat=pulp.LpInteger)
+
+    single_pool_ids = [pool_id for pool_id, pool in tape.pools.items() if pool.is_single]
+    single_variables = pulp.LpVariable.dicts('SinglePool', single_pool_ids, lowBound=0, upBound=1, cat=pulp.LpInteger)
+
+    program = pulp.LpProblem('MortgagesProblem', pulp.LpMaximize)
+
+    # Objective function
+    program += pulp.lpSum([variables[deal.id] * deal.price for deal in tape.deals.values()]), 'Total Selling Price'
+
+    model = PulpModel(program, variables, single_variables)
+    with family('mutex', program):
+        add_mutex_constraints(model, tape)
+    with family('c1-c2', program):
+        add_pool_constraints(model, tape, constraints)
+    with family('c3-c7', program):
+        add_pingora_constraints(model, tape, constraints)
+    with family('c8-c12', program):
+        add_two_harbors_constraints(model, tape, constraints)
+    with family('c13-c18', program):
+        add_comparability_constraints(model, tape, constraints, start)
+    return model
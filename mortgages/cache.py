@@ -0,0 +1,55 @@
+import os
+import json
+import shutil
+import hashlib
+import logging
+import numpy
+
+# changing how the arrays are built must change this, so that old cache entries are not read
+cache_version = 2
+default_cache_directory = '.cache'
+
+def content_hash(paths, version=f'cache {cache_version}'):
+    '''Returns a hex digest over the contents of the given files and the version of what is derived from them'''
+    digest = hashlib.sha256(f'mortgages {version}'.encode())
+    for path in paths:
+        digest.update(os.path.basename(path).encode())
+        with open(path, 'rb') as input_file:
+            for chunk in iter(lambda: input_file.read(1 << 20), b''):
+                digest.update(chunk)
+    return digest.hexdigest()[:24]
+
+def write_arrays(directory, arrays, labels):
+    '''Writes one .npy file per array and the labels as json, renaming the finished directory into place so
+    that concurrent readers never see half an entry'''
+    partial = f'{directory}.{os.getpid()}.partial'
+    os.makedirs(partial, exist_ok=True)
+    for name, array in arrays.items():
+        numpy.save(os.path.join(partial, f'{name}.npy'), numpy.ascontiguousarray(array))
+    with open(os.path.join(partial, 'labels.json'), 'w') as labels_file:
+        json.dump(labels, labels_file)
+    try:
+        os.rename(partial, directory)
+    except OSError:
+        # another process has written the same entry in the meantime
+        shutil.rmtree(partial, ignore_errors=True)
+
+def read_arrays(directory):
+    '''Memory-maps the arrays of a cache entry, so that processes reading the same entry share its pages'''
+    arrays = {}
+    for file_name in os.listdir(directory):
+        if file_name.endswith('.npy'):
+            arrays[file_name[:-len('.npy')]] = numpy.load(os.path.join(directory, file_name), mmap_mode='r')
+    with open(os.path.join(directory, 'labels.json')) as labels_file:
+        labels = json.load(labels_file)
+    return arrays, labels
+
+def cached_arrays(kind, paths, build, cache_directory=default_cache_directory):
+    '''Returns the (arrays, labels) that build() makes from the given files, from the cache entry of their
+    content hash if there is one and after writing it otherwise'''
+    directory = os.path.join(cache_directory, f'{kind}-{content_hash(paths)}')
+    if not os.path.isdir(directory):
+        logging.info(f'Caching {kind} in {directory}')
+        os.makedirs(cache_directory, exist_ok=True)
+        write_arrays(directory, *build())
+    return read_arrays(directory)
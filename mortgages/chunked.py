@@ -0,0 +1,171 @@
+import os
+import csv
+import json
+import shutil
+import logging
+import itertools
+import numpy
+from numpy.lib.format import open_memmap
+from .tape import Tape
+from .ingest import raw_files, raw_loan, raw_pool, first_deal_id
+from .model import TapeArrays
+from .cache import read_arrays
+from .report import servicers
+from .trace import traced
+
+# the bytes that one combination takes while its csv row is parsed, and once it is stored as arrays; the first
+# is the peak that tracemalloc reports for the first chunk of read_combination_chunks over the rows of
+# data/EligiblePricingCombinations.csv, about 386 bytes per row at 10000 and at 40000 rows, rounded up
+parsed_row_bytes = 400
+stored_row_bytes = 17
+default_memory_budget = 256 * 2**20
+
+def chunk_size(memory_budget):
+    '''The number of combination rows parsed at once, which leaves half of the budget to what survives them'''
+    return max(1, memory_budget // (2 * parsed_row_bytes))
+
+def read_raw_records(raw_directory):
+    '''Returns the loan ids and Loan records of LoanData.csv and the pool ids and Pool records of PoolOptionData.csv'''
+    loan_ids, loans, pool_ids, pools = [], [], [], []
+    with open(os.path.join(raw_directory, raw_files[0]), newline='') as loans_file:
+        for row in csv.DictReader(loans_file):
+            loan_ids.append(row['LoanID'])
+            loans.append(raw_loan(row))
+    with open(os.path.join(raw_directory, raw_files[1]), newline='') as pools_file:
+        for row in csv.DictReader(pools_file):
+            pool_ids.append(row['Pool Option, j'])
+            pools.append(raw_pool(row))
+    return loan_ids, loans, pool_ids, pools
+
+def read_combination_chunks(path, loan_index, pool_index, size):
+    '''Reads EligiblePricingCombinations.csv size rows at a time and yields the positions of their loans and pools,
+    the codes of their servicers and their prices as arrays
+
+    Rows of unknown loans, pools or servicers are skipped.'''
+    servicer_codes = {servicer: code for code, servicer in enumerate(servicers)}
+    skipped = 0
+    with open(path, newline='') as combinations_file:
+        reader = csv.reader(combinations_file)
+        header = next(reader)
+        loan_column, pool_column, servicer_column, price_column = [header.index(name) for name in
+            ['LoanID', 'Pool Opton, j', 'Servicer, k', 'Price, P_ijk']]
+        while True:
+            rows = list(itertools.islice(reader, size))
+            if not rows:
+                break
+            loans = numpy.array([loan_index.get(row[loan_column], -1) for row in rows], dtype=numpy.int32)
+            pools = numpy.array([pool_index.get(row[pool_column], -1) for row in rows], dtype=numpy.int32)
+            codes = numpy.array([servicer_codes.get(row[servicer_column], -1) for row in rows], dtype=numpy.int8)
+            prices = numpy.array([float(row[price_column]) for row in rows], dtype=numpy.float64)
+            del rows
+            known = (loans >= 0) & (pools >= 0) & (codes >= 0)
+            skipped += len(known) - int(numpy.count_nonzero(known))
+            yield loans[known], pools[known], codes[known], prices[known]
+    if skipped:
+        logging.warning(f'Skipped {skipped} combinations of unknown loans, pools or servicers')
+
+def top_prices(loans, prices, top_k):
+    '''Returns the positions of the top_k best priced combinations of every loan in their original order; of
+    equally priced combinations the earlier ones are kept'''
+    order = numpy.lexsort((-prices, loans))
+    sorted_loans = loans[order]
+    starts = numpy.flatnonzero(numpy.r_[True, sorted_loans[1:] != sorted_loans[:-1]])
+    ranks = numpy.arange(len(order)) - numpy.repeat(starts, numpy.diff(numpy.r_[starts, len(order)]))
+    return numpy.sort(order[ranks < top_k])
+
+store_columns = [('comb_loan', numpy.int32), ('comb_pool', numpy.int32), ('comb_servicer', numpy.int8), ('comb_price', numpy.float64)]
+
+@traced('build combination store', lambda stored, *arguments, **keywords: {'combinations': stored})
+def build_combination_store(raw_directory, directory, memory_budget=default_memory_budget, top_k=None, c2=None):
+    '''Streams EligiblePricingCombinations.csv into one .npy file per column in directory; the memory that the
+    combinations take is bounded by memory_budget bytes instead of by the size of the file, only the loans and
+    pools are held in memory as a whole
+
+    With top_k only the top_k best priced combinations of every loan survive; as many survivors as the loans
+    can have are set aside from the budget first, and ValueError is raised if they do not fit into it. With c2
+    the combinations of the single issuer pools whose surviving loans cannot reach c2 together are dropped, as
+    prune does. Without top_k the file is read twice: once for the amount eligible for every pool and once to
+    write the survivors into memory-mapped files. Returns the number of stored combinations.'''
+    loan_ids, loans, pool_ids, pools = read_raw_records(raw_directory)
+    loan_index = {loan_id: position for position, loan_id in enumerate(loan_ids)}
+    pool_index = {pool_id: position for position, pool_id in enumerate(pool_ids)}
+    amount = numpy.array([loan.amount for loan in loans], dtype=numpy.float64)
+    is_single = numpy.array([pool.is_single for pool in pools], dtype=bool)
+    path = os.path.join(raw_directory, raw_files[2])
+    size = chunk_size(memory_budget)
+    if top_k is not None:
+        # merging a chunk into the survivors copies them
+        survivor_bytes = 2 * top_k * len(loans) * stored_row_bytes
+        if survivor_bytes >= memory_budget:
+            raise ValueError(f'The top {top_k} combinations of {len(loans)} loans may take {survivor_bytes} bytes, '
+                f'more than the memory budget of {memory_budget} bytes')
+        size = max(1, (memory_budget - survivor_bytes) // parsed_row_bytes)
+
+    def usable_pools(pool_amount):
+        if c2 is None:
+            return numpy.ones(len(pools), dtype=bool)
+        return ~(is_single & (pool_amount < c2))
+
+    partial = f'{directory}.{os.getpid()}.partial'
+    os.makedirs(partial, exist_ok=True)
+    if top_k is not None:
+        survivors = [numpy.zeros(0, dtype=dtype) for _, dtype in store_columns]
+        for chunk in read_combination_chunks(path, loan_index, pool_index, size):
+            merged = [numpy.concatenate([survivor, column]) for survivor, column in zip(survivors, chunk)]
+            kept = top_prices(merged[0], merged[3], top_k)
+            survivors = [column[kept] for column in merged]
+        pool_amount = numpy.bincount(survivors[1], weights=amount[survivors[0]], minlength=len(pools))
+        kept = usable_pools(pool_amount)[survivors[1]]
+        for (name, _), column in zip(store_columns, survivors):
+            numpy.save(os.path.join(partial, f'{name}.npy'), column[kept])
+        stored = int(numpy.count_nonzero(kept))
+    else:
+        pool_amount = numpy.zeros(len(pools))
+        pool_count = numpy.zeros(len(pools), dtype=numpy.int64)
+        for loan_positions, pool_positions, _, _ in read_combination_chunks(path, loan_index, pool_index, size):
+            pool_amount += numpy.bincount(pool_positions, weights=amount[loan_positions], minlength=len(pools))
+            pool_count += numpy.bincount(pool_positions, minlength=len(pools))
+        usable = usable_pools(pool_amount)
+        stored = int(pool_count[usable].sum())
+        files = [open_memmap(os.path.join(partial, f'{name}.npy'), mode='w+', dtype=dtype, shape=(stored,))
+            for name, dtype in store_columns]
+        offset = 0
+        for chunk in read_combination_chunks(path, loan_index, pool_index, size):
+            kept = usable[chunk[1]]
+            count = int(numpy.count_nonzero(kept))
+            for file, column in zip(files, chunk):
+                file[offset:offset + count] = column[kept]
+            offset += count
+        for file in files:
+            file.flush()
+        del files
+
+    with open(os.path.join(partial, 'labels.json'), 'w') as labels_file:
+        json.dump({'loan_ids': loan_ids, 'pool_ids': pool_ids, 'servicers': servicers}, labels_file)
+    shutil.rmtree(directory, ignore_errors=True)
+    os.rename(partial, directory)
+    logging.info(f'Stored {stored} combinations in {directory}')
+    return stored
+
+def load_combination_store(directory):
+    '''Memory-maps the columns of a combination store; returns them by name and the labels of their positions'''
+    return read_arrays(directory)
+
+def store_tape_arrays(raw_directory, directory):
+    '''Returns the TapeArrays of the raw loans and pools with the deals of the combination store, numbered and
+    ordered by pool like those of ChooseLoan.csv, without ever building their Deal records
+
+    The prices are not rounded to the 15 significant digits that ChooseLoan.csv holds.'''
+    loan_ids, loans, pool_ids, pools = read_raw_records(raw_directory)
+    arrays, labels = load_combination_store(directory)
+    if labels['loan_ids'] != loan_ids or labels['pool_ids'] != pool_ids:
+        raise ValueError(f'The combination store {directory} was built from other loans or pools than those in {raw_directory}')
+    tape_arrays = TapeArrays(Tape({loan.id: loan for loan in loans}, {pool.id: pool for pool in pools}))
+    # ChooseLoan.csv lists the combinations by pool id in string order and then in the order of the file
+    pool_ranks = numpy.argsort(numpy.argsort(numpy.array(pool_ids, dtype=object)))
+    order = numpy.argsort(pool_ranks[arrays['comb_pool']], kind='stable')
+    tape_arrays.deal_ids = first_deal_id + numpy.arange(len(order), dtype=numpy.int64)
+    tape_arrays.deal_loan = numpy.asarray(arrays['comb_loan'][order], dtype=numpy.int32)
+    tape_arrays.deal_pool = numpy.asarray(arrays['comb_pool'][order], dtype=numpy.int32)
+    tape_arrays.price = arrays['comb_price'][order] / 100 * tape_arrays.amount[tape_arrays.deal_loan]
+    return tape_arrays
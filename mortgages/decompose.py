@@ -0,0 +1,271 @@
+import os
+import time
+import logging
+import numpy
+import scipy.sparse
+from .extract import column_values, comparability_centers
+from .model import TapeArrays
+from .matrix import build_matrix
+from .solve import Solution, solve_matrix, run_highs
+
+# relative gap between the primal and the dual bound at which the iterations stop
+gap_tolerance = 1e-4
+
+class Block:
+    '''One subproblem: the columns of one servicer or agency together with the rows that touch only them'''
+
+    def __init__(self, name, columns, matrix, row_lower, row_upper, integrality, lower, upper):
+        self.name = name
+        self.columns = columns
+        self.matrix = matrix
+        self.row_lower = row_lower
+        self.row_upper = row_upper
+        self.integrality = integrality
+        self.lower = lower
+        self.upper = upper
+
+    def solve(self, costs, time_limit=None, relative_gap=None, start_values=None):
+        '''Maximizes costs over the block, starting from start_values if given; returns the column values and an
+        upper bound on the maximum'''
+        highs = run_highs(costs, self.matrix, self.row_lower, self.row_upper, self.integrality, self.lower, self.upper,
+            time_limit, start_values=start_values, relative_gap=relative_gap)
+        info = highs.getInfo()
+        # a primal solution status of 2 means feasible
+        if info.primal_solution_status != 2:
+            raise RuntimeError(f'The subproblem of {self.name} has no solution: {highs.modelStatusToString(highs.getModelStatus())}')
+        # a subproblem stopped early still bounds the Lagrangian function through its dual bound
+        bound = info.mip_dual_bound if numpy.isfinite(info.mip_dual_bound) else info.objective_function_value
+        return numpy.array(highs.getSolution().col_value), -bound
+
+# the blocks of a worker process, sent once when the process starts
+worker_blocks = None
+
+def init_worker(blocks):
+    global worker_blocks
+    worker_blocks = blocks
+
+def solve_worker_block(number, costs, time_limit, relative_gap, start_values):
+    return worker_blocks[number].solve(costs, time_limit, relative_gap, start_values)
+
+class Iteration:
+    '''The bounds after one subgradient step of the Lagrangian decomposition'''
+
+    def __init__(self, number, dual_bound, primal_bound, violated_rows, seconds):
+        self.number = number
+        self.dual_bound = float(dual_bound)
+        self.primal_bound = primal_bound
+        self.violated_rows = violated_rows
+        self.seconds = seconds
+
+    @property
+    def gap(self):
+        if self.primal_bound is None:
+            return numpy.inf
+        return (self.dual_bound - self.primal_bound) / max(abs(self.dual_bound), 1)
+
+    def row(self):
+        return [self.number, self.dual_bound, self.primal_bound if self.primal_bound is not None else '', f'{self.gap:.6f}',
+            self.violated_rows, f'{self.seconds:.3f}']
+
+class Decomposition:
+    '''Lagrangian relaxation of a MatrixModel whose blocks are the deals of one servicer or of one agency
+
+    Every row whose columns lie in one block stays in that block's subproblem; the rows that couple blocks,
+    that is the mutex rows of loans offered to several blocks and the c13 to c18 rows (and c3 to c12 when
+    splitting by agency), are moved into the objective with a multiplier per finite row bound. The loan
+    count columns belong to no block and are set by the sign of their reduced cost.'''
+
+    def __init__(self, model, tape_arrays, by='servicer'):
+        if model.extra_columns is not None:
+            raise ValueError('Only the boxed comparability model can be decomposed')
+        self.model = model
+        pool_groups = numpy.array(tape_arrays.categories[by], dtype=object)[tape_arrays.category_codes[by]]
+        pool_positions = {pool_id: position for position, pool_id in enumerate(tape_arrays.pool_ids.tolist())}
+        single_pools = numpy.array([pool_positions[pool_id] for pool_id in model.single_pool_ids.tolist()], dtype=numpy.int64)
+        column_groups = numpy.concatenate([pool_groups[tape_arrays.deal_pool], pool_groups[single_pools]])
+        self.block_names = sorted(set(column_groups.tolist()))
+        column_block = numpy.full(model.num_columns, -1, dtype=numpy.int64)
+        column_block[:model.num_binaries] = [self.block_names.index(group) for group in column_groups.tolist()]
+
+        # a row stays in a block if its smallest and largest column block are the same block
+        matrix = model.matrix.tocsr()
+        row_min = numpy.full(model.num_rows, -1, dtype=numpy.int64)
+        row_max = numpy.full(model.num_rows, -2, dtype=numpy.int64)
+        filled = numpy.flatnonzero(numpy.diff(matrix.indptr) > 0)
+        if len(filled) > 0:
+            blocks = column_block[matrix.indices]
+            row_min[filled] = numpy.minimum.reduceat(blocks, matrix.indptr[filled])
+            row_max[filled] = numpy.maximum.reduceat(blocks, matrix.indptr[filled])
+        kept = (row_min == row_max) & (row_min >= 0)
+
+        column_lower, column_upper = model.column_lower, model.column_upper
+        # the free columns count loans, so the number of loans bounds them
+        column_upper = numpy.where(column_block < 0, numpy.minimum(column_upper, tape_arrays.num_loans), column_upper)
+        integrality = model.integrality
+        self.blocks = []
+        for number, name in enumerate(self.block_names):
+            columns = numpy.flatnonzero(column_block == number)
+            rows = numpy.flatnonzero(kept & (row_min == number))
+            self.blocks.append(Block(name, columns, matrix[rows][:, columns], model.row_lower[rows], model.row_upper[rows],
+                integrality[columns], column_lower[columns], column_upper[columns]))
+        self.free_columns = numpy.flatnonzero(column_block < 0)
+        self.free_lower, self.free_upper = column_lower[self.free_columns], column_upper[self.free_columns]
+
+        # the relaxed rows are scaled to a largest coefficient of 1, which evens out the subgradient
+        relaxed = numpy.flatnonzero(~kept)
+        self.relaxed_rows = relaxed
+        self.relaxed_labels = [model.row_labels[row] for row in relaxed.tolist()]
+        scale = 1 / numpy.maximum(abs(matrix[relaxed]).max(axis=1).toarray().ravel(), 1e-12)
+        self.relaxed_scale = scale
+        self.relaxed = scipy.sparse.diags(scale) @ matrix[relaxed]
+        self.relaxed_lower = model.row_lower[relaxed] * scale
+        self.relaxed_upper = model.row_upper[relaxed] * scale
+        self.upper_multipliers = numpy.zeros(len(relaxed))
+        self.lower_multipliers = numpy.zeros(len(relaxed))
+        logging.info(f'Decomposed into {len(self.blocks)} blocks by {by}, relaxing {len(relaxed)} of {model.num_rows} rows')
+
+    def start_from_lp(self):
+        '''Sets the multipliers to the row duals of the LP relaxation, whose objective it returns as a first dual
+        bound; the Lagrangian bound at these multipliers is never above it'''
+        model = self.model
+        column_upper = model.column_upper.copy()
+        column_upper[self.free_columns] = self.free_upper
+        highs = run_highs(model.objective, model.matrix, model.row_lower, model.row_upper, numpy.zeros(model.num_columns),
+            model.column_lower, column_upper)
+        # HiGHS minimizes the negated objective, so a row at its upper bound has a negative dual
+        duals = numpy.array(highs.getSolution().row_dual)[self.relaxed_rows] / self.relaxed_scale
+        self.upper_multipliers = numpy.where(numpy.isfinite(self.relaxed_upper), numpy.maximum(0, -duals), 0)
+        self.lower_multipliers = numpy.where(numpy.isfinite(self.relaxed_lower), numpy.maximum(0, duals), 0)
+        return -highs.getInfo().objective_function_value
+
+    def lagrangian(self, solve_blocks, start_values=None):
+        '''Solves every subproblem under the current multipliers, starting from the column values start_values if
+        given; returns the Lagrangian bound and the column values'''
+        multipliers = self.upper_multipliers - self.lower_multipliers
+        costs = self.model.objective - self.relaxed.T @ multipliers
+        values = numpy.zeros(self.model.num_columns)
+        bound = numpy.dot(self.upper_multipliers[numpy.isfinite(self.relaxed_upper)], self.relaxed_upper[numpy.isfinite(self.relaxed_upper)]) -\
+            numpy.dot(self.lower_multipliers[numpy.isfinite(self.relaxed_lower)], self.relaxed_lower[numpy.isfinite(self.relaxed_lower)])
+        block_costs = [costs[block.columns] for block in self.blocks]
+        block_starts = [start_values[block.columns] if start_values is not None else None for block in self.blocks]
+        for block, (block_values, block_bound) in zip(self.blocks, solve_blocks(block_costs, block_starts)):
+            values[block.columns] = block_values
+            bound += block_bound
+        free_costs = costs[self.free_columns]
+        values[self.free_columns] = numpy.where(free_costs > 0, self.free_upper, self.free_lower)
+        bound += numpy.dot(free_costs, values[self.free_columns])
+        return bound, values
+
+    def step(self, values, step_size):
+        '''Moves the multipliers along the subgradient at the given values; returns the number of violated rows'''
+        activity = self.relaxed @ values
+        upper_gradient = numpy.where(numpy.isfinite(self.relaxed_upper), activity - self.relaxed_upper, 0)
+        lower_gradient = numpy.where(numpy.isfinite(self.relaxed_lower), self.relaxed_lower - activity, 0)
+        # a multiplier at zero cannot decrease further, so its part of the subgradient is dropped
+        upper_gradient[(self.upper_multipliers <= 0) & (upper_gradient < 0)] = 0
+        lower_gradient[(self.lower_multipliers <= 0) & (lower_gradient < 0)] = 0
+        norm = numpy.dot(upper_gradient, upper_gradient) + numpy.dot(lower_gradient, lower_gradient)
+        if norm > 0:
+            self.upper_multipliers = numpy.maximum(0, self.upper_multipliers + step_size / norm * upper_gradient)
+            self.lower_multipliers = numpy.maximum(0, self.lower_multipliers + step_size / norm * lower_gradient)
+        return int(numpy.count_nonzero((upper_gradient > 1e-9) | (lower_gradient > 1e-9))), norm
+
+def restricted_solve(model, tape, deal_columns, incumbent, time_limit):
+    '''Solves the model over the given deal columns only, starting from the incumbent deal ids if there are any'''
+    lower, upper = model.column_lower, model.column_upper.copy()
+    unused = numpy.ones(len(model.deal_ids), dtype=bool)
+    unused[deal_columns] = False
+    upper[:len(model.deal_ids)][unused] = 0
+    initial_values = column_values(tape, incumbent) if incumbent is not None else None
+    return solve_matrix(model, 'highs', time_limit, initial_values=initial_values, bounds=(lower, upper))
+
+def decompose(tape, constraints, start=None, incumbent=None, by='servicer', max_iterations=50, time_limit=None, relative_gap=1e-3, processes=1,
+        primal_every=5, primal_time_limit=30, theta=0.5, patience=3):
+    '''Bounds the boxed matrix model of the (pruned) tape by Lagrangian relaxation, see Decomposition
+
+    The multipliers start from the row duals of the LP relaxation. The subproblems of one iteration are solved
+    in parallel by processes worker processes, each in at most time_limit seconds or to the relative_gap; their
+    dual bounds keep the Lagrangian bound valid either way. The step size is theta times the Polyak step towards
+    the best primal bound, and theta is halved when the dual bound has not improved for patience iterations.
+    Every primal_every iterations the model is solved again over the deals that any subproblem has sold,
+    starting from the best solution, which gives the primal bound.
+
+    Without start, the windows are centered on the greedy assignment, which is also the first primal solution;
+    otherwise incumbent may give the taken deal ids of a first primal solution inside the windows. Returns the
+    best Solution and the list of Iterations; both bounds hold for the boxed model only.'''
+    tape_arrays = TapeArrays(tape)
+    primal_bound = None
+    if incumbent is not None:
+        primal_bound = sum(tape.deals[deal_id].price for deal_id in incumbent)
+    elif start is None:
+        from .heuristic import greedy_assignment
+
+        assignment = greedy_assignment(tape, constraints)
+        incumbent, primal_bound = assignment.taken_deal_ids, assignment.total_price
+        start = comparability_centers(tape, incumbent, constraints, centered=True)
+    model = build_matrix(tape_arrays, constraints, start)
+    decomposition = Decomposition(model, tape_arrays, by)
+    deal_positions = {deal_id: position for position, deal_id in enumerate(model.deal_ids.tolist())}
+    seen_deals = numpy.zeros(len(model.deal_ids), dtype=bool)
+    if incumbent is not None:
+        seen_deals[[deal_positions[deal_id] for deal_id in incumbent]] = True
+
+    executor = None
+    if processes is None or processes > 1:
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+
+        # forked workers need no importable main module, as genilp.py has none; the executor forks all of them on
+        # the first submit, which has to happen before start_from_lp runs HiGHS threads that a fork would copy
+        executor = ProcessPoolExecutor(processes or os.cpu_count(), mp_context=multiprocessing.get_context('fork'),
+            initializer=init_worker, initargs=(decomposition.blocks,))
+        executor.submit(os.getpid).result()
+        solve_blocks = lambda costs, starts: list(executor.map(solve_worker_block, range(len(costs)), costs,
+            [time_limit] * len(costs), [relative_gap] * len(costs), starts))
+    else:
+        solve_blocks = lambda costs, starts: [block.solve(block_costs, time_limit, relative_gap, block_start)
+            for block, block_costs, block_start in zip(decomposition.blocks, costs, starts)]
+
+    iterations = []
+    started = time.time()
+    dual_bound = decomposition.start_from_lp()
+    logging.info(f'LP relaxation bound {dual_bound}')
+    stalled = 0
+    try:
+        for number in range(1, max_iterations + 1):
+            start_values = None
+            if incumbent is not None:
+                incumbent_values = column_values(tape, incumbent)
+                start_values = numpy.array([incumbent_values.get(name, 0) for name in model.column_names], dtype=numpy.float64)
+            bound, values = decomposition.lagrangian(solve_blocks, start_values)
+            seen_deals |= numpy.round(values[:len(model.deal_ids)]) == 1
+            if bound < dual_bound - 1e-6 * abs(dual_bound):
+                dual_bound, stalled = bound, 0
+            else:
+                stalled += 1
+                if stalled >= patience:
+                    theta, stalled = theta / 2, 0
+
+            if number % primal_every == 0 or number == max_iterations:
+                try:
+                    solution = restricted_solve(model, tape, numpy.flatnonzero(seen_deals), incumbent, primal_time_limit)
+                    if primal_bound is None or solution.objective > primal_bound:
+                        incumbent, primal_bound = solution.taken_deal_ids, solution.objective
+                except RuntimeError as e:
+                    logging.debug(f'The restricted model found nothing: {e}')
+
+            target = primal_bound if primal_bound is not None else bound - 0.05 * abs(bound)
+            violated, norm = decomposition.step(values, theta * max(bound - target, 0))
+            iterations.append(Iteration(number, dual_bound, primal_bound, violated, time.time() - started))
+            logging.info(f'Iteration {number}: dual bound {dual_bound}, primal bound {primal_bound}, '
+                f'{violated} violated relaxed rows')
+            if iterations[-1].gap < gap_tolerance or norm == 0:
+                break
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    if incumbent is None:
+        raise RuntimeError('The decomposition found no feasible solution')
+    values = numpy.isin(model.deal_ids, incumbent).astype(numpy.float64)
+    return Solution(model.deal_ids, values, primal_bound, 'Decomposition'), iterations
@@ -0,0 +1,162 @@
+import numpy
+from .report import servicers, category_fields
+
+class DeltaEvaluator:
+    '''Keeps the running sums of a solution per pool, servicer and agency, so that the objective and the
+    number of violated checks after moving one loan are known without scoring the solution again
+
+    Loans, pools and servicers are positions into the ScoringTables, a pool of -1 means the loan is not sold.
+    The checks are the ones of ScoringTables.report, num_violations counts the violated ones among them.'''
+
+    def __init__(self, tables, constraints, loans, pools, servicer_codes):
+        self.tables = tables
+        self.constraints = constraints
+        self.prices = dict(zip(tables.comb_keys.tolist(), tables.comb_prices.tolist()))
+        # scalar lookups on lists are much faster than on numpy arrays
+        self.amount = tables.amount.tolist()
+        self.high_balance = (tables.amount * tables.high_balance).tolist()
+        self.fico = (tables.amount * tables.fico).tolist()
+        self.dti = (tables.amount * tables.dti).tolist()
+        self.is_california = tables.is_california.tolist()
+        self.is_cashout = tables.is_cashout.tolist()
+        self.is_primary = tables.is_primary.tolist()
+        self.codes = [tables.category_codes[field].tolist() for _, field in category_fields]
+        self.is_standard = tables.is_standard.tolist()
+        self.is_single = tables.is_single.tolist()
+        self.pool_agency = tables.pool_agency.tolist()
+        self.pingora = servicers.index('Pingora')
+        self.two_harbors = servicers.index('Two Harbors')
+        self.load(loans, pools, servicer_codes)
+
+    def load(self, loans, pools, servicer_codes):
+        '''Sets the running sums from scratch, which also clears the rounding errors of many moves'''
+        num_loans, num_pools = len(self.amount), len(self.tables.pool_ids)
+        self.pool_of = [-1] * num_loans
+        self.servicer_of = [-1] * num_loans
+        self.objective = 0.0
+        self.pool_sums = [[0.0, 0.0, 0] for _ in range(num_pools)]
+        # amount, amount x high balance, amount x FICO, amount x DTI, count, California, cashout, primary
+        self.servicer_sums = [[0.0] * 8 for _ in servicers]
+        # amount, amount x FICO, amount x DTI, count
+        self.agency_sums = [[0.0] * 4 for _ in range(2)]
+        self.histograms = [numpy.zeros((2, len(self.tables.categories[field]))) for _, field in category_fields]
+        for loan, pool, servicer in zip(numpy.asarray(loans).tolist(), numpy.asarray(pools).tolist(), numpy.asarray(servicer_codes).tolist()):
+            self.add(loan, pool, servicer, 1)
+        self.num_violations = sum(self.pool_violations(pool) for pool in range(num_pools)) +\
+            sum(self.servicer_violations(servicer) for servicer in range(len(servicers))) + self.comparability_violations()
+
+    def price(self, loan, pool, servicer):
+        price = self.prices.get(self.tables.key(loan, pool, servicer))
+        if price is None:
+            raise ValueError(f'Loan {self.tables.loan_ids[loan]} cannot be sold to {self.tables.pool_ids[pool]} serviced by {servicers[servicer]}')
+        return price / 100 * self.amount[loan]
+
+    def add(self, loan, pool, servicer, sign):
+        '''Adds (sign 1) or removes (sign -1) the loan sold to the pool and servicer from every running sum'''
+        # the price raises for an ineligible combination, before anything is changed
+        price = self.price(loan, pool, servicer)
+        if sign == 1:
+            self.pool_of[loan], self.servicer_of[loan] = pool, servicer
+        else:
+            self.pool_of[loan], self.servicer_of[loan] = -1, -1
+        self.objective += sign * price
+        amount = sign * self.amount[loan]
+        pool_sums = self.pool_sums[pool]
+        pool_sums[0] += amount
+        pool_sums[1] += sign * self.high_balance[loan]
+        pool_sums[2] += sign
+        sums = self.servicer_sums[servicer]
+        sums[0] += amount
+        sums[1] += sign * self.high_balance[loan]
+        sums[2] += sign * self.fico[loan]
+        sums[3] += sign * self.dti[loan]
+        sums[4] += sign
+        sums[5] += sign * self.is_california[loan]
+        sums[6] += sign * self.is_cashout[loan]
+        sums[7] += sign * self.is_primary[loan]
+        agency = self.pool_agency[pool]
+        sums = self.agency_sums[agency]
+        sums[0] += amount
+        sums[1] += sign * self.fico[loan]
+        sums[2] += sign * self.dti[loan]
+        sums[3] += sign
+        for histogram, codes in zip(self.histograms, self.codes):
+            histogram[agency, codes[loan]] += sign
+
+    def pool_violations(self, pool):
+        amount, high_balance, count = self.pool_sums[pool]
+        if count == 0:
+            return 0
+        constraints = self.constraints
+        return int('c1' in constraints and self.is_standard[pool] and high_balance / amount > constraints['c1']) +\
+            int('c2' in constraints and self.is_single[pool] and amount < constraints['c2'])
+
+    def servicer_violations(self, servicer):
+        amount, high_balance, fico, dti, count, california, cashout, primary = self.servicer_sums[servicer]
+        weighted = lambda value: value / amount if amount > 0 else 0
+        counted = lambda value: value / count if count > 0 else 0
+        if servicer == self.pingora:
+            checks = [('c3', amount, True), ('c4', weighted(high_balance), True), ('c5', weighted(fico), False),
+                ('c6', weighted(dti), True), ('c7', counted(california), True)]
+        elif servicer == self.two_harbors:
+            checks = [('c8', amount, False), ('c9', weighted(fico), False), ('c10', weighted(dti), True),
+                ('c11', counted(cashout), True), ('c12', counted(primary), False)]
+        else:
+            return 0
+        return sum(1 for name, value, upper in checks if name in self.constraints and
+            (value > self.constraints[name] if upper else value < self.constraints[name]))
+
+    def comparability_violations(self):
+        constraints = self.constraints
+        violations = 0
+        for position, name in [(1, 'c13'), (2, 'c14')]:
+            if name in constraints:
+                averages = [sums[position] / sums[0] if sums[0] > 0 else 0 for sums in self.agency_sums]
+                violations += abs(averages[0] - averages[1]) > constraints[name]
+        counts = numpy.array([max(sums[3], 1) for sums in self.agency_sums])
+        for histogram, (name, _) in zip(self.histograms, category_fields):
+            if name in constraints:
+                ratios = histogram / counts[:, None]
+                violations += int(numpy.count_nonzero(numpy.abs(ratios[0] - ratios[1]) > constraints[name]))
+        return violations
+
+    def affected_violations(self, pools, servicer_codes):
+        return sum(self.pool_violations(pool) for pool in pools) +\
+            sum(self.servicer_violations(servicer) for servicer in servicer_codes) + self.comparability_violations()
+
+    def move(self, loan, pool=-1, servicer=-1):
+        '''Sells the loan to the pool and servicer instead, or drops it with pool -1
+
+        Returns the change of the objective and of the number of violated checks. Raises ValueError and leaves
+        the solution as it is if the loan cannot be sold to the pool and servicer.'''
+        if pool >= 0:
+            self.price(loan, pool, servicer)
+        old_pool, old_servicer = self.pool_of[loan], self.servicer_of[loan]
+        pools = set(pool for pool in [old_pool, pool] if pool >= 0)
+        servicer_codes = set(servicer for servicer in [old_servicer, servicer] if servicer >= 0)
+        objective, violations = self.objective, self.affected_violations(pools, servicer_codes)
+        if old_pool >= 0:
+            self.add(loan, old_pool, old_servicer, -1)
+        if pool >= 0:
+            self.add(loan, pool, servicer, 1)
+        violation_delta = self.affected_violations(pools, servicer_codes) - violations
+        self.num_violations += violation_delta
+        return self.objective - objective, violation_delta
+
+    def delta(self, loan, pool=-1, servicer=-1):
+        '''Like move, but leaves the solution as it is'''
+        old_pool, old_servicer = self.pool_of[loan], self.servicer_of[loan]
+        objective, num_violations = self.objective, self.num_violations
+        delta = self.move(loan, pool, servicer)
+        if pool >= 0:
+            self.add(loan, pool, servicer, -1)
+        if old_pool >= 0:
+            self.add(loan, old_pool, old_servicer, 1)
+        # restoring the objective avoids rounding errors from adding and removing the same price
+        self.objective, self.num_violations = objective, num_violations
+        return delta
+
+    def solution(self):
+        '''Returns the sold loans with their pools and servicers as position arrays'''
+        loans = numpy.flatnonzero(numpy.array(self.pool_of) >= 0)
+        return loans, numpy.array(self.pool_of)[loans], numpy.array(self.servicer_of)[loans]
@@ -0,0 +1,110 @@
+import logging
+from .tape import agencies, comparable_categories
+from .trace import traced
+
+@traced('read solution', lambda taken_deal_ids, *arguments, **keywords: {'taken': len(taken_deal_ids)})
+def read_taken_deal_ids(lines):
+    '''Reads the deal ids listed below the TakenDealId heading'''
+    lines = iter(lines)
+    next(lines) # skip the csv heading
+    taken_deal_ids = []
+    for line in lines:
+        stripped = line.strip()
+        taken_deal_ids.append(int(stripped))
+    return taken_deal_ids
+
+def solution_rows(tape, taken_deal_ids):
+    '''Returns the Loan, Pool, Servicer rows of the solution file in the format the scorer expects'''
+    rows = []
+    for deal_id in taken_deal_ids:
+        deal = tape.deals[deal_id]
+        pool = tape.pools[deal.pool_id]
+        rows.append([str(deal.loan_id), 'pool_' + str(deal.pool_id), pool.servicer])
+    return rows
+
+@traced('read solution', lambda taken_deal_ids, *arguments, **keywords: {'taken': len(taken_deal_ids)})
+def read_solution_rows(tape, rows):
+    '''Returns the deal ids of Loan, Pool, Servicer rows as written by write_solution'''
+    taken_deal_ids = []
+    for loan_id, pool_id, _ in rows:
+        pool_id = int(pool_id[len('pool_'):])
+        deal_ids = [deal.id for deal in tape.index.loan_deals(int(loan_id)) if deal.pool_id == pool_id]
+        if not deal_ids:
+            raise ValueError(f'Loan {loan_id} cannot be sold to pool_{pool_id}')
+        taken_deal_ids.append(deal_ids[0])
+    return taken_deal_ids
+
+@traced('write solution', lambda _, solution_csv, tape, taken_deal_ids: {'taken': len(taken_deal_ids)})
+def write_solution(solution_csv, tape, taken_deal_ids):
+    solution_csv.writerow(['Loan', 'Pool', 'Servicer'])
+    solution_csv.writerows(solution_rows(tape, taken_deal_ids))
+
+def column_values(tape, taken_deal_ids):
+    '''Returns the values of the model columns by name for a solution that sells exactly the taken deals,
+    which the solvers take as a MIP start'''
+    values = {f'Count_{agency.replace(" ", "")}': 0 for agency in agencies}
+    for deal_id in taken_deal_ids:
+        pool = tape.pools[tape.deals[deal_id].pool_id]
+        values[f'Deal_{deal_id}'] = 1
+        if pool.is_single:
+            values[f'SinglePool_{pool.id}'] = 1
+        values[f'Count_{pool.agency.replace(" ", "")}'] += 1
+    return values
+
+def window_start(measures, tolerance, centered):
+    if not centered or tolerance is None:
+        return min(measures)
+    return min(measures) - (tolerance - abs(measures[0] - measures[1])) / 2
+
+def comparability_centers(tape, taken_deal_ids, constraints, centered=False):
+    '''Computes the c13 to c18 measures of both agencies and returns the smaller of the two as the window
+    centers for the next build
+
+    With centered the windows are shifted so that both measures lie in their middle, which keeps the
+    solution itself strictly feasible for a MIP start.'''
+    loans = tape.loans
+    taken_deals = [tape.deals[deal_id] for deal_id in taken_deal_ids]
+    logging.debug('I have sold {:,} / {:,} loans'.format(len(taken_deals), len(loans)))
+    pool_ids = set([deal.pool_id for deal in taken_deals])
+    logging.debug(f'I have sold to {len(pool_ids)} / {len(tape.pools)} different pools')
+
+    agency_loans = {agency: [] for agency in agencies}
+    for deal in taken_deals:
+        agency_loans[tape.pools[deal.pool_id].agency].append(loans[deal.loan_id])
+
+    logging.debug('----------------------------------------------------------------------------------------------------------------------')
+    logging.debug('Total number of deals: {:,}'.format(len(tape.deals)))
+    for agency in agencies:
+        logging.debug('Number of loans sold to a {} pool: {:,}'.format(agency, len(agency_loans[agency])))
+        logging.debug('Total amount sold to {} pools: {:,}'.format(agency, sum(loan.amount for loan in agency_loans[agency])))
+
+    start = {}
+    for name, field, measure in [('c13', 'fico', 'FICO score'), ('c14', 'dti', 'debt-to-income ratio')]:
+        logging.debug('-----------------------------------------------')
+        logging.debug(f'Constraint {name[1:]}')
+        averages = []
+        for agency in agencies:
+            total_amount = sum(loan.amount for loan in agency_loans[agency])
+            average = sum(getattr(loan, field) * loan.amount for loan in agency_loans[agency]) / total_amount
+            logging.debug(f'What is the amount-relative average {measure} among the loans sold to a {agency} pool: {average}')
+            averages.append(average)
+        logging.debug(f'Actual distance: {abs(averages[0] - averages[1])}')
+        logging.debug(f'Allowed distance: {constraints.get(name)}')
+        start[name] = window_start(averages, constraints.get(name), centered)
+
+    for name, field, description in comparable_categories:
+        logging.debug('-----------------------------------------------')
+        all_values = set([getattr(loan, field) for loan in loans.values()])
+        start[name] = {}
+        for i, value in enumerate(all_values):
+            logging.debug('')
+            logging.debug(f'Constraint {name[1:]} for {field.replace("_", " ")} {value} ({i+1}/{len(all_values)})')
+            ratios = []
+            for agency in agencies:
+                ratio = sum(getattr(loan, field) == value for loan in agency_loans[agency]) / len(agency_loans[agency])
+                logging.debug(f'For each loan, that is sold to a {agency} pool, how many loans are also {description.format(value)}: {ratio}')
+                ratios.append(ratio)
+            logging.debug(f'Actual distance: {abs(ratios[0] - ratios[1])}')
+            logging.debug(f'Allowed distance: {constraints.get(name)}')
+            start[name][value] = window_start(ratios, constraints.get(name), centered)
+    return start
@@ -0,0 +1,306 @@
+import logging
+from collections import defaultdict
+from .tape import agencies, comparable_categories
+from .report import servicers
+from .trace import traced
+
+# the servicer constraints as (name, servicer, loan measure, upper or lower bound, weighted by amount)
+servicer_ratios = [
+    ('c4', 'Pingora', lambda loan: loan.is_expensive, 'upper', True),
+    ('c5', 'Pingora', lambda loan: loan.fico, 'lower', True),
+    ('c6', 'Pingora', lambda loan: loan.dti, 'upper', True),
+    ('c7', 'Pingora', lambda loan: loan.is_california, 'upper', False),
+    ('c9', 'Two Harbors', lambda loan: loan.fico, 'lower', True),
+    ('c10', 'Two Harbors', lambda loan: loan.dti, 'upper', True),
+    ('c11', 'Two Harbors', lambda loan: loan.is_cashout, 'upper', False),
+    ('c12', 'Two Harbors', lambda loan: loan.is_primary, 'lower', False),
+]
+
+class GreedyAssignment:
+    '''Sells every loan to its best priced deal that has not been ruled out by a repair step
+
+    The repairs rule out pools, (loan, pool), (loan, servicer) and (loan, agency) combinations, so a loan
+    whose deal is ruled out falls back to its next best deal, or is not sold if none is left.'''
+
+    def __init__(self, tape, constraints):
+        self.tape = tape
+        self.constraints = constraints
+        self.options = {loan_id: sorted(loan_deals.values(), key=lambda deal: -deal.price)
+            for loan_id, loan_deals in tape.index.by_loan.items()}
+        self.blocked_pools = set()
+        self.banned_deals = set()
+        self.banned = defaultdict(set)
+        self.deal_of = {}
+        for loan_id in self.options:
+            self.reassign(loan_id)
+
+    def allowed(self, deal):
+        pool = self.tape.pools[deal.pool_id]
+        banned = self.banned[deal.loan_id]
+        return deal.pool_id not in self.blocked_pools and deal.id not in self.banned_deals and\
+            pool.servicer not in banned and pool.agency not in banned
+
+    def best_deal(self, loan_id):
+        for deal in self.options[loan_id]:
+            if self.allowed(deal):
+                return deal
+        return None
+
+    def reassign(self, loan_id):
+        deal = self.best_deal(loan_id)
+        if deal is None:
+            self.deal_of.pop(loan_id, None)
+        else:
+            self.deal_of[loan_id] = deal
+
+    def loss(self, loan_id, ban):
+        '''The price lost if the loan could not be sold to anything in ban anymore'''
+        self.banned[loan_id].add(ban)
+        deal = self.best_deal(loan_id)
+        self.banned[loan_id].discard(ban)
+        return self.deal_of[loan_id].price - (deal.price if deal is not None else 0)
+
+    def ban(self, loan_id, ban):
+        self.banned[loan_id].add(ban)
+        self.reassign(loan_id)
+
+    def group_by(self, key):
+        groups = defaultdict(list)
+        for loan_id, deal in self.deal_of.items():
+            groups[key(deal)].append(loan_id)
+        return groups
+
+    @property
+    def taken_deal_ids(self):
+        return [deal.id for deal in self.deal_of.values()]
+
+    @property
+    def total_price(self):
+        return sum(deal.price for deal in self.deal_of.values())
+
+    def repair_single_pools(self):
+        '''Closes the single issuer pools that do not reach c2, the smallest first'''
+        pool_loans = self.group_by(lambda deal: deal.pool_id)
+        short_pools = [(sum(self.tape.loans[loan_id].amount for loan_id in loan_ids), pool_id)
+            for pool_id, loan_ids in pool_loans.items()
+            if self.tape.pools[pool_id].is_single and
+                sum(self.tape.loans[loan_id].amount for loan_id in loan_ids) < self.constraints['c2']]
+        if not short_pools:
+            return False
+        _, pool_id = min(short_pools)
+        self.blocked_pools.add(pool_id)
+        for loan_id in pool_loans[pool_id]:
+            self.reassign(loan_id)
+        return True
+
+    def repair_balance(self):
+        '''Moves high balance loans out of standard pools that break c1, the cheapest move first'''
+        changed = False
+        loans = self.tape.loans
+        for pool_id, loan_ids in self.group_by(lambda deal: deal.pool_id).items():
+            if not self.tape.pools[pool_id].is_standard:
+                continue
+            total = sum(loans[loan_id].amount for loan_id in loan_ids)
+            expensive = sum(loans[loan_id].amount for loan_id in loan_ids if loans[loan_id].is_expensive)
+            candidates = sorted((loan_id for loan_id in loan_ids if loans[loan_id].is_expensive),
+                key=lambda loan_id: self.deal_of[loan_id].price - (self.best_other(loan_id) or 0))
+            for loan_id in candidates:
+                if expensive <= self.constraints['c1'] * total:
+                    break
+                self.banned_deals.add(self.deal_of[loan_id].id)
+                self.reassign(loan_id)
+                expensive -= loans[loan_id].amount
+                total -= loans[loan_id].amount
+                changed = True
+        return changed
+
+    def best_other(self, loan_id):
+        '''The price of the best allowed deal of the loan besides its current one'''
+        current = self.deal_of[loan_id]
+        for deal in self.options[loan_id]:
+            if deal is not current and self.allowed(deal):
+                return deal.price
+        return None
+
+    def ratio_excess(self, name, measure, bound, weighted, loan_ids):
+        '''How far the measure of the loans lies beyond the bound of the constraint, as a sum over the loans;
+        positive if the constraint is broken'''
+        loans = self.tape.loans
+        weight = (lambda loan: loan.amount) if weighted else (lambda loan: 1)
+        total = sum(weight(loans[loan_id]) for loan_id in loan_ids)
+        measured = sum(measure(loans[loan_id]) * weight(loans[loan_id]) for loan_id in loan_ids)
+        sign = 1 if bound == 'upper' else -1
+        return sign * (measured - self.constraints[name] * total)
+
+    def repair_servicer_ratios(self):
+        '''Takes loans away from a servicer whose ratio constraint is broken, the most harmful loans first'''
+        changed = False
+        loans = self.tape.loans
+        servicer_loans = self.group_by(lambda deal: self.tape.pools[deal.pool_id].servicer)
+        for name, servicer, measure, bound, weighted in servicer_ratios:
+            if name not in self.constraints:
+                continue
+            loan_ids = servicer_loans[servicer]
+            weight = (lambda loan: loan.amount) if weighted else (lambda loan: 1)
+            total = sum(weight(loans[loan_id]) for loan_id in loan_ids)
+            measured = sum(measure(loans[loan_id]) * weight(loans[loan_id]) for loan_id in loan_ids)
+            sign = 1 if bound == 'upper' else -1
+            # loans whose measure lies beyond the bound, the furthest first
+            candidates = sorted((loan_id for loan_id in loan_ids if sign * (measure(loans[loan_id]) - self.constraints[name]) > 0),
+                key=lambda loan_id: -sign * measure(loans[loan_id]))
+            for loan_id in candidates:
+                if sign * (measured - self.constraints[name] * total) <= 0:
+                    break
+                self.ban(loan_id, servicer)
+                total -= weight(loans[loan_id])
+                measured -= measure(loans[loan_id]) * weight(loans[loan_id])
+                changed = True
+        return changed
+
+    def repair_servicer_amounts(self):
+        '''Keeps the Pingora amount below c3 and lifts the Two Harbors amount up to c8'''
+        changed = False
+        loans = self.tape.loans
+        servicer_of = lambda deal: self.tape.pools[deal.pool_id].servicer
+        if 'c3' in self.constraints:
+            loan_ids = self.group_by(servicer_of)['Pingora']
+            total = sum(loans[loan_id].amount for loan_id in loan_ids)
+            for loan_id in sorted(loan_ids, key=lambda loan_id: self.loss(loan_id, 'Pingora') / loans[loan_id].amount):
+                if total <= self.constraints['c3']:
+                    break
+                self.ban(loan_id, 'Pingora')
+                total -= loans[loan_id].amount
+                changed = True
+
+        if 'c8' in self.constraints:
+            loan_ids = set(self.group_by(servicer_of)['Two Harbors'])
+            total = sum(loans[loan_id].amount for loan_id in loan_ids)
+            if total >= self.constraints['c8']:
+                return changed
+            # only loans that satisfy every Two Harbors ratio on their own are moved in
+            ratios = [ratio for ratio in servicer_ratios if ratio[1] == 'Two Harbors' and ratio[0] in self.constraints]
+            candidates = []
+            for loan_id, options in self.options.items():
+                loan = loans[loan_id]
+                if loan_id in loan_ids or any(self.ratio_excess(name, measure, bound, weighted, [loan_id]) > 0
+                        for name, _, measure, bound, weighted in ratios):
+                    continue
+                for deal in options:
+                    if servicer_of(deal) == 'Two Harbors' and self.allowed(deal):
+                        current = self.deal_of[loan_id].price if loan_id in self.deal_of else 0
+                        candidates.append(((current - deal.price) / loan.amount, loan_id))
+                        break
+            for _, loan_id in sorted(candidates):
+                if total >= self.constraints['c8']:
+                    break
+                for servicer in servicers:
+                    if servicer != 'Two Harbors':
+                        self.banned[loan_id].add(servicer)
+                self.reassign(loan_id)
+                total += loans[loan_id].amount
+                changed = True
+        return changed
+
+    def agency_measures(self):
+        '''Returns the c13 to c18 measures of both agencies as {name: {agency: value}}, with the categories
+        of c15 to c18 as (name, value) keys'''
+        loans = self.tape.loans
+        agency_loans = self.group_by(lambda deal: self.tape.pools[deal.pool_id].agency)
+        measures = defaultdict(dict)
+        for agency in agencies:
+            selected = [loans[loan_id] for loan_id in agency_loans[agency]]
+            total = sum(loan.amount for loan in selected) or 1
+            measures['c13'][agency] = sum(loan.fico * loan.amount for loan in selected) / total
+            measures['c14'][agency] = sum(loan.dti * loan.amount for loan in selected) / total
+            for name, field, _ in comparable_categories:
+                counts = defaultdict(int)
+                for loan in selected:
+                    counts[getattr(loan, field)] += 1
+                for value in set(getattr(loan, field) for loan in loans.values()):
+                    measures[(name, value)][agency] = counts[value] / max(len(selected), 1)
+        return measures
+
+    def comparability_excess(self):
+        '''Returns the violated c13 to c18 measures as (excess relative to the bound, key, values), see agency_measures'''
+        excesses = []
+        for key, values in self.agency_measures().items():
+            name = key if type(key) == str else key[0]
+            if name not in self.constraints:
+                continue
+            excess = abs(values[agencies[0]] - values[agencies[1]]) - self.constraints[name]
+            if excess > 0:
+                excesses.append((excess / self.constraints[name], key, values))
+        return excesses
+
+    def violations(self):
+        '''Returns the constraints that the assignment still breaks as readable strings'''
+        loans = self.tape.loans
+        constraints = self.constraints
+        violations = []
+        for pool_id, loan_ids in self.group_by(lambda deal: deal.pool_id).items():
+            pool = self.tape.pools[pool_id]
+            if 'c1' in constraints and pool.is_standard and self.ratio_excess('c1', lambda loan: loan.is_expensive, 'upper', True, loan_ids) > 0:
+                violations.append(f'c1 on pool_{pool_id}')
+            if 'c2' in constraints and pool.is_single and sum(loans[loan_id].amount for loan_id in loan_ids) < constraints['c2']:
+                violations.append(f'c2 on pool_{pool_id}')
+        servicer_loans = self.group_by(lambda deal: self.tape.pools[deal.pool_id].servicer)
+        servicer_amount = lambda servicer: sum(loans[loan_id].amount for loan_id in servicer_loans[servicer])
+        if 'c3' in constraints and servicer_amount('Pingora') > constraints['c3']:
+            violations.append('c3 on Pingora')
+        if 'c8' in constraints and servicer_amount('Two Harbors') < constraints['c8']:
+            violations.append('c8 on Two Harbors')
+        for name, servicer, measure, bound, weighted in servicer_ratios:
+            if name in constraints and self.ratio_excess(name, measure, bound, weighted, servicer_loans[servicer]) > 0:
+                violations.append(f'{name} on {servicer}')
+        for _, key, values in self.comparability_excess():
+            name = key if type(key) == str else f'{key[0]} for {key[1]}'
+            violations.append(f'{name}: {values[agencies[0]]} against {values[agencies[1]]}')
+        return violations
+
+    def repair_comparability(self):
+        '''Moves loans that pull one agency away from the other out of that agency, for the most violated measure'''
+        loans = self.tape.loans
+        excesses = self.comparability_excess()
+        if not excesses:
+            return False
+
+        _, key, values = max(excesses, key=lambda excess: excess[0])
+        high = max(agencies, key=lambda agency: values[agency])
+        low_value = min(values.values())
+        if type(key) == str:
+            field = 'fico' if key == 'c13' else 'dti'
+            pulls = lambda loan: getattr(loan, field) > low_value
+        else:
+            field = [field for name, field, _ in comparable_categories if name == key[0]][0]
+            pulls = lambda loan: getattr(loan, field) == key[1]
+        candidates = [loan_id for loan_id, deal in self.deal_of.items()
+            if self.tape.pools[deal.pool_id].agency == high and pulls(loans[loan_id])]
+        if not candidates:
+            return False
+        # move a few of the cheapest loans at a time, the measures are recomputed afterwards
+        for loan_id in sorted(candidates, key=lambda loan_id: self.loss(loan_id, high))[:max(1, len(candidates) // 20)]:
+            self.ban(loan_id, high)
+        return True
+
+@traced('greedy', lambda assignment, *arguments, **keywords: {'taken': len(assignment.taken_deal_ids)})
+def greedy_assignment(tape, constraints, max_rounds=1000):
+    '''Builds a feasible assignment from the tape alone: every loan goes to its best priced deal and
+    the broken constraints are repaired one at a time by giving up the cheapest deals
+
+    Returns the GreedyAssignment; constraints the repairs could not fix are logged as warnings.'''
+    assignment = GreedyAssignment(tape, constraints)
+    repairs = [assignment.repair_balance, assignment.repair_servicer_ratios, assignment.repair_servicer_amounts]
+    if 'c2' in constraints:
+        repairs.insert(0, assignment.repair_single_pools)
+    if 'c1' not in constraints:
+        repairs.remove(assignment.repair_balance)
+    for _ in range(max_rounds):
+        if any(repair() for repair in repairs):
+            continue
+        if not assignment.repair_comparability():
+            break
+    # the repairs also stop when they find no loan left to move
+    for violation in assignment.violations():
+        logging.warning(f'The greedy assignment still breaks {violation}')
+    logging.info(f'Greedy assignment sells {len(assignment.deal_of)} loans for {assignment.total_price}')
+    return assignment
@@ -0,0 +1,129 @@
+import os
+import sys
+import csv
+import json
+import logging
+from .tape import Loan, Pool
+from .cache import content_hash
+from .trace import traced
+
+raw_files = ['LoanData.csv', 'PoolOptionData.csv', 'EligiblePricingCombinations.csv']
+processed_files = ['LoansFull.csv', 'Loans.csv', 'Pools.csv', 'ChooseLoan.csv', 'DealsInfo.csv']
+manifest_file = 'ingest.json'
+# changing the derived files must change this, so that they are written again
+ingest_version = 2
+
+loans_header = ['Loan', 'Amount', 'Fico', 'Dti', 'IsExpensive', 'IsCalifornia', 'IsCashout', 'IsPrimary',
+    'PropOcc', 'PropState', 'PropType', 'Purpose']
+# Loans.csv leaves out the categories, which only the comparability constraints need
+short_loans_header = loans_header[:8]
+pools_header = ['Pool', 'IssuerType', 'BalanceType', 'Agency', 'Servicer']
+deals_header = ['DealId', 'Pool', 'Loan', 'Price']
+# DealsInfo.csv is ChooseLoan.csv without the deal ids, joined with the columns of Loans.csv
+deals_info_header = ['Pool', 'Loan', 'Price'] + short_loans_header[1:]
+
+# the deal ids of ChooseLoan.csv are its line numbers, so the first deal is number 2
+first_deal_id = 2
+
+def sql_real(value):
+    '''Formats a float the way SQLite prints a REAL, as the prices of ChooseLoan.csv were first written by SQLite'''
+    text = format(value, '.15g')
+    if '.' not in text and 'e' not in text and 'n' not in text:
+        text += '.0'
+    return text
+
+def loan_flags(row):
+    '''The IsExpensive, IsCalifornia, IsCashout and IsPrimary flags of a LoanData.csv row'''
+    return [int(row['HighBalFlag'] == 'Y'), int(row['PropState'] == 'CA'), int(row['Purpose'] == 'Cashout'), int(row['PropOcc'] == 'Primary')]
+
+def raw_loan(row):
+    '''Returns the Loan record of a LoanData.csv row, as load_loans reads it from LoansFull.csv'''
+    return Loan(int(row['LoanID']), float(row['Amount'].replace(',', '')), float(row['FICO']), float(row['DTI']), *loan_flags(row),
+        sys.intern(row['PropOcc']), sys.intern(row['PropState']), sys.intern(row['PropType']), sys.intern(row['Purpose']))
+
+def raw_pool(row):
+    '''Returns the Pool record of a PoolOptionData.csv row, as load_pools reads it from Pools.csv'''
+    return Pool(int(row['Pool Option, j'][len('pool_'):]), row['Pool Balance Type'] == 'Standard Balance',
+        row['Pool Type'] == 'Single-Issuer', sys.intern(row['Servicer']), sys.intern(row['Agency']))
+
+def ingest_loans(loan_rows, loans_csv, short_loans_csv):
+    '''Writes the LoansFull.csv and Loans.csv rows with the derived flags; returns the columns of Loans.csv by loan id'''
+    loan_columns = {}
+    loans_csv.writerow(loans_header)
+    short_loans_csv.writerow(short_loans_header)
+    for row in loan_rows:
+        columns = [row['Amount'].replace(',', ''), row['FICO'], row['DTI'], *loan_flags(row)]
+        loan_columns[row['LoanID']] = columns
+        loans_csv.writerow([row['LoanID'], *columns, row['PropOcc'], row['PropState'], row['PropType'], row['Purpose']])
+        short_loans_csv.writerow([row['LoanID'], *columns])
+    return loan_columns
+
+def ingest_pools(pool_rows, pools_csv):
+    pools_csv.writerow(pools_header)
+    for row in pool_rows:
+        pools_csv.writerow([row['Pool Option, j'], row['Pool Type'], row['Pool Balance Type'], row['Agency'], row['Servicer']])
+
+def ingest_deals(comb_rows, loan_columns, deals_csv, deals_info_csv):
+    '''Writes the ChooseLoan.csv and DealsInfo.csv rows: the combinations grouped by pool with their price times
+    amount / 100, and in DealsInfo.csv with the columns of their loan in Loans.csv'''
+    by_pool = {}
+    for row in comb_rows:
+        loan_id = row['LoanID']
+        if loan_id not in loan_columns:
+            # combinations of unknown loans have no amount to price them with
+            logging.warning(f'Skipping the combination of unknown loan {loan_id}')
+            continue
+        price = float(row['Price, P_ijk']) / 100 * float(loan_columns[loan_id][0])
+        by_pool.setdefault(row['Pool Opton, j'], []).append((loan_id, sql_real(price)))
+    deals_csv.writerow(deals_header)
+    deals_info_csv.writerow(deals_info_header)
+    deal_id = first_deal_id
+    for pool_id in sorted(by_pool):
+        for loan_id, price in by_pool[pool_id]:
+            deals_csv.writerow([deal_id, pool_id, loan_id, price])
+            deals_info_csv.writerow([pool_id, loan_id, price, *loan_columns[loan_id]])
+            deal_id += 1
+    return deal_id - first_deal_id
+
+def raw_hash(raw_directory):
+    return content_hash([os.path.join(raw_directory, name) for name in raw_files], f'ingest {ingest_version}')
+
+def up_to_date(raw_directory='data', processed_directory='data_processed'):
+    '''Whether the manifest in processed_directory records the current raw files and all processed files exist'''
+    manifest_path = os.path.join(processed_directory, manifest_file)
+    if not os.path.exists(manifest_path) or not all(os.path.exists(os.path.join(processed_directory, name)) for name in processed_files):
+        return False
+    with open(manifest_path) as manifest:
+        return json.load(manifest).get('raw_hash') == raw_hash(raw_directory)
+
+@traced('ingest', lambda written, *arguments, **keywords: {'written': int(written)})
+def ingest(raw_directory='data', processed_directory='data_processed', force=False):
+    '''Derives LoansFull.csv, Loans.csv, Pools.csv, ChooseLoan.csv and DealsInfo.csv from the raw data files,
+    reading every raw file once
+
+    Nothing is written if the manifest in processed_directory records the same raw file contents, unless
+    force is given. The files are written next to their targets and renamed into place. Returns whether
+    the files were written.'''
+    if not force and up_to_date(raw_directory, processed_directory):
+        logging.info(f'{processed_directory} is up to date with {raw_directory}')
+        return False
+
+    raw_paths = [os.path.join(raw_directory, name) for name in raw_files]
+    processed_paths = [os.path.join(processed_directory, name) for name in processed_files]
+    os.makedirs(processed_directory, exist_ok=True)
+    partial_paths = [f'{path}.partial' for path in processed_paths]
+    writer = lambda output: csv.writer(output, lineterminator='\n')
+    with open(raw_paths[0], newline='') as loans_file, open(partial_paths[0], 'w', newline='') as loans_output,\
+            open(partial_paths[1], 'w', newline='') as short_loans_output:
+        loan_columns = ingest_loans(csv.DictReader(loans_file), writer(loans_output), writer(short_loans_output))
+    with open(raw_paths[1], newline='') as pools_file, open(partial_paths[2], 'w', newline='') as pools_output:
+        ingest_pools(csv.DictReader(pools_file), writer(pools_output))
+    with open(raw_paths[2], newline='') as combs_file, open(partial_paths[3], 'w', newline='') as deals_output,\
+            open(partial_paths[4], 'w', newline='') as deals_info_output:
+        num_deals = ingest_deals(csv.DictReader(combs_file), loan_columns, writer(deals_output), writer(deals_info_output))
+    for partial_path, path in zip(partial_paths, processed_paths):
+        os.replace(partial_path, path)
+    with open(os.path.join(processed_directory, manifest_file), 'w') as manifest:
+        json.dump({'raw_hash': raw_hash(raw_directory), 'files': processed_files}, manifest, indent=4)
+    logging.info(f'Ingested {len(loan_columns)} loans and {num_deals} deals into {processed_directory}')
+    return True
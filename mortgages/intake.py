@@ -0,0 +1,156 @@
+import csv
+import time
+import logging
+import numpy
+from .tape import Deal
+from .ingest import raw_loan
+from .model import TapeArrays
+from .extract import column_values, comparability_centers
+
+# gains below this are rounding noise
+min_gain = 1e-6
+
+def read_batch(loans_path, combinations_path):
+    '''Reads new loans in the format of LoanData.csv and their combinations in the format of
+    EligiblePricingCombinations.csv; returns the Loan records and the (loan id, pool id, price) of the
+    combinations, with the price of selling the whole loan as in ChooseLoan.csv'''
+    loans = []
+    with open(loans_path, newline='') as loans_file:
+        for row in csv.DictReader(loans_file):
+            loans.append(raw_loan(row))
+    amounts = {loan.id: loan.amount for loan in loans}
+    combinations = []
+    with open(combinations_path, newline='') as combinations_file:
+        for row in csv.DictReader(combinations_file):
+            loan_id = int(row['LoanID'])
+            if loan_id not in amounts:
+                logging.warning(f'Skipping the combination of unknown loan {loan_id}')
+                continue
+            combinations.append((loan_id, int(row['Pool Opton, j'][len('pool_'):]), float(row['Price, P_ijk']) / 100 * amounts[loan_id]))
+    return loans, combinations
+
+class Batch:
+    '''The sizes, timings and outcome of selling one batch of new loans into the allocation'''
+
+    def __init__(self, number, num_loans, num_deals, num_freed, build_seconds, solve_seconds, objective, status, num_sold):
+        self.number = number
+        self.num_loans = num_loans
+        self.num_deals = num_deals
+        self.num_freed = num_freed
+        self.build_seconds = build_seconds
+        self.solve_seconds = solve_seconds
+        self.objective = objective
+        self.status = status
+        self.num_sold = num_sold
+
+    def row(self):
+        return [self.number, self.num_loans, self.num_deals, self.num_freed, f'{self.build_seconds:.3f}', f'{self.solve_seconds:.3f}',
+            self.objective, self.status, self.num_sold]
+
+class LoanIntake:
+    '''Keeps the allocation of a pruned tape in memory and sells the loans of new batches into it
+
+    A batch appends its loans and deals to the tape and to its arrays, and the matrix model is built again
+    from the arrays. It is solved with the deals of all loans fixed, except for the new loans and some of the
+    loans sold to the best priced pools of the new loans, so that the sub-MIP stays small. The c13 to c18
+    windows are centered on the allocation, so it stays feasible: if nothing better is found within the
+    latency budget, it is kept and the new loans stay unsold.'''
+
+    def __init__(self, tape, constraints, taken_deal_ids=None, pools=None):
+        '''pools are the Pool records by id that new deals may refer to, by default those of the tape; pass
+        those of the unpruned tape to allow the pools that prune removed'''
+        self.tape = tape
+        self.constraints = constraints
+        self.pools = pools if pools is not None else dict(tape.pools)
+        if taken_deal_ids is None:
+            from .heuristic import greedy_assignment
+
+            taken_deal_ids = greedy_assignment(tape, constraints).taken_deal_ids
+        self.taken_deal_ids = list(taken_deal_ids)
+        self.objective = sum(tape.deals[deal_id].price for deal_id in self.taken_deal_ids)
+        self.tape_arrays = TapeArrays(tape)
+        self.next_deal_id = max(tape.deals) + 1
+        self.batches = []
+
+    def append(self, loans, combinations):
+        '''Adds the loans and their combinations to the tape and its arrays; returns the new loans and deals'''
+        tape = self.tape
+        new_loans = [loan for loan in loans if loan.id not in tape.loans]
+        if len(new_loans) < len(loans):
+            logging.warning(f'Skipping {len(loans) - len(new_loans)} loans that are already on the tape')
+        new_loan_ids = set(loan.id for loan in new_loans)
+        for loan in new_loans:
+            tape.loans[loan.id] = loan
+
+        new_pools = []
+        deals = []
+        for loan_id, pool_id, price in combinations:
+            if loan_id not in new_loan_ids:
+                continue
+            if pool_id not in tape.pools:
+                if pool_id not in self.pools:
+                    logging.warning(f'Skipping the combination of loan {loan_id} with unknown pool_{pool_id}')
+                    continue
+                tape.pools[pool_id] = self.pools[pool_id]
+                new_pools.append(self.pools[pool_id])
+            deal = Deal(self.next_deal_id, pool_id, loan_id, price)
+            self.next_deal_id += 1
+            tape.add_deal(deal)
+            deals.append(deal)
+        self.tape_arrays.extend(new_loans, new_pools, deals)
+        return new_loans, deals
+
+    def add_batch(self, loans, combinations, latency_budget=None, pools_per_loan=1, max_freed=200):
+        '''Sells what it can of the new loans, see read_batch, within latency_budget seconds; returns the taken
+        deal ids of the updated allocation
+
+        Every new loan frees the loans sold to its pools_per_loan best priced pools, up to max_freed loans in all.'''
+        from .matrix import build_matrix
+        from .solve import solve_matrix
+
+        started = time.time()
+        loans, deals = self.append(loans, combinations)
+        # every new loan frees its best priced pools, of which the loans sold at the lowest price per amount are
+        # the ones most likely to make room
+        freed_pools = set()
+        for loan in loans:
+            loan_deals = sorted(self.tape.index.loan_deals(loan.id), key=lambda deal: deal.price, reverse=True)
+            freed_pools.update(deal.pool_id for deal in loan_deals[:pools_per_loan])
+        candidates = [self.tape.deals[deal_id] for deal_id in self.taken_deal_ids if self.tape.deals[deal_id].pool_id in freed_pools]
+        candidates.sort(key=lambda deal: deal.price / self.tape.loans[deal.loan_id].amount)
+        freed_loans = set(loan.id for loan in loans).union(deal.loan_id for deal in candidates[:max_freed])
+        freed_loans = numpy.array(sorted(freed_loans), dtype=numpy.int64)
+
+        start = comparability_centers(self.tape, self.taken_deal_ids, self.constraints, centered=True)
+        model = build_matrix(self.tape_arrays, self.constraints, start)
+        values = column_values(self.tape, self.taken_deal_ids)
+        taken = numpy.isin(model.deal_ids, self.taken_deal_ids).astype(numpy.float64)
+        fixed = ~numpy.isin(self.tape_arrays.loan_ids[self.tape_arrays.deal_loan], freed_loans)
+        lower, upper = model.column_lower.copy(), model.column_upper.copy()
+        num_deals = len(model.deal_ids)
+        lower[:num_deals][fixed] = taken[fixed]
+        upper[:num_deals][fixed] = taken[fixed]
+        build_seconds = time.time() - started
+
+        status = 'Kept'
+        remaining = latency_budget - build_seconds if latency_budget is not None else None
+        solve_time = time.time()
+        if remaining is None or remaining > 0:
+            try:
+                solution = solve_matrix(model, 'highs', remaining, initial_values=values, bounds=(lower, upper))
+                status = solution.status
+                if solution.objective > self.objective + min_gain:
+                    self.taken_deal_ids = solution.taken_deal_ids
+                    self.objective = solution.objective
+            except RuntimeError as e:
+                logging.debug(f'The batch found nothing: {e}')
+        solve_seconds = time.time() - solve_time
+
+        new_loan_ids = set(loan.id for loan in loans)
+        num_sold = sum(self.tape.deals[deal_id].loan_id in new_loan_ids for deal_id in self.taken_deal_ids)
+        batch = Batch(len(self.batches) + 1, len(loans), len(deals), len(freed_loans), build_seconds, solve_seconds, self.objective,
+            status, num_sold)
+        self.batches.append(batch)
+        logging.info(f'Batch {batch.number}: sold {num_sold} of {len(loans)} new loans, freed {len(freed_loans)} loans, '
+            f'objective {self.objective}, built in {build_seconds:.2f}s, solved in {solve_seconds:.2f}s')
+        return self.taken_deal_ids
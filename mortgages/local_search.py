@@ -0,0 +1,181 @@
+import time
+import random
+import logging
+import numpy
+from .report import servicers
+from .delta import DeltaEvaluator
+from .extract import column_values, comparability_centers
+
+# gains below this are rounding noise
+min_gain = 1e-6
+
+class LocalSearch:
+    '''Improves a feasible assignment without ever leaving the feasible region
+
+    Shift moves sell a loan to a better deal or sell an unsold loan; ejection moves do the same and move
+    another loan of the target pool or servicer out of the way; LNS steps free the loans of a few pools
+    and solve them again as a sub-MIP of the matrix model with all other deals fixed.'''
+
+    def __init__(self, tape, tables, constraints, taken_deal_ids, seed=0, ejection_candidates=8):
+        self.tape = tape
+        self.tables = tables
+        self.constraints = constraints
+        self.random = random.Random(seed)
+        self.ejection_candidates = ejection_candidates
+
+        # the deals of the tape as (loan, pool, servicer) positions of the scoring tables
+        self.positions = {}
+        self.deal_at = {}
+        self.options = {}
+        for deal in tape.deals.values():
+            position = (tables.loan_index[str(deal.loan_id)], tables.pool_index[f'pool_{deal.pool_id}'],
+                servicers.index(tape.pools[deal.pool_id].servicer))
+            self.positions[deal.id] = position
+            self.deal_at[position] = deal.id
+            self.options.setdefault(position[0], []).append((deal.price, position[1], position[2]))
+        for options in self.options.values():
+            options.sort(reverse=True)
+
+        self.evaluator = DeltaEvaluator(tables, constraints, *self.position_arrays(taken_deal_ids))
+        if self.evaluator.num_violations > 0:
+            raise ValueError(f'The local search needs a feasible start, this one violates {self.evaluator.num_violations} checks')
+        self.model = None
+        self.history = []
+
+    def position_arrays(self, taken_deal_ids):
+        positions = numpy.array([self.positions[deal_id] for deal_id in taken_deal_ids], dtype=numpy.int64).reshape(-1, 3)
+        return positions[:, 0], positions[:, 1], positions[:, 2]
+
+    @property
+    def taken_deal_ids(self):
+        evaluator = self.evaluator
+        return [self.deal_at[(loan, pool, evaluator.servicer_of[loan])]
+            for loan, pool in enumerate(evaluator.pool_of) if pool >= 0]
+
+    def current_price(self, loan):
+        pool = self.evaluator.pool_of[loan]
+        return self.evaluator.price(loan, pool, self.evaluator.servicer_of[loan]) if pool >= 0 else 0
+
+    def shift(self, loan):
+        '''Moves the loan to the best better priced deal that keeps the solution feasible, possibly by ejecting
+        another loan; returns the gain'''
+        evaluator = self.evaluator
+        current_price = self.current_price(loan)
+        blocked = None
+        for price, pool, servicer in self.options[loan]:
+            if price <= current_price + min_gain:
+                break
+            if pool == evaluator.pool_of[loan]:
+                continue
+            gain, violations = evaluator.delta(loan, pool, servicer)
+            if violations == 0:
+                evaluator.move(loan, pool, servicer)
+                return gain
+            if blocked is None:
+                blocked = (pool, servicer)
+        # only the best blocked deal is tried with an ejection, which is much more expensive
+        if blocked is not None:
+            return self.eject(loan, *blocked)
+        return 0
+
+    def eject(self, loan, pool, servicer):
+        '''Moves the loan to the pool and then one other loan of that pool or servicer elsewhere, if the two
+        moves together gain and end feasible; returns the gain'''
+        evaluator = self.evaluator
+        old_pool, old_servicer = evaluator.pool_of[loan], evaluator.servicer_of[loan]
+        candidates = [other for other, other_pool in enumerate(evaluator.pool_of) if other != loan and
+            (other_pool == pool or (other_pool >= 0 and evaluator.servicer_of[other] == servicer))]
+        pool_candidates = [other for other in candidates if evaluator.pool_of[other] == pool]
+        candidates = self.random.sample(pool_candidates, min(len(pool_candidates), self.ejection_candidates // 2)) +\
+            self.random.sample(candidates, min(len(candidates), self.ejection_candidates // 2))
+
+        gain, _ = evaluator.move(loan, pool, servicer)
+        for other in candidates:
+            moves = [(other_pool, other_servicer) for _, other_pool, other_servicer in self.options[other][:3]] + [(-1, -1)]
+            for other_pool, other_servicer in moves:
+                if other_pool == evaluator.pool_of[other] and other_servicer == evaluator.servicer_of[other]:
+                    continue
+                other_gain, violations = evaluator.delta(other, other_pool, other_servicer)
+                if gain + other_gain > min_gain and evaluator.num_violations + violations == 0:
+                    evaluator.move(other, other_pool, other_servicer)
+                    return gain + other_gain
+        evaluator.move(loan, old_pool, old_servicer)
+        return 0
+
+    def shift_pass(self, deadline):
+        '''Tries a shift of every loan in random order; returns the total gain'''
+        loans = list(self.options)
+        self.random.shuffle(loans)
+        total = 0
+        for loan in loans:
+            if time.time() > deadline:
+                break
+            total += self.shift(loan)
+        return total
+
+    def lns(self, num_pools, time_limit):
+        '''Frees the loans of a few random pools, plus the unsold loans eligible for them, and solves them again
+        with every other deal fixed; returns the gain'''
+        from .model import TapeArrays
+        from .matrix import build_matrix, recenter_matrix
+        from .solve import solve_matrix
+
+        evaluator = self.evaluator
+        taken_deal_ids = self.taken_deal_ids
+        # centered windows keep the current solution feasible, so it is a valid MIP start
+        start = comparability_centers(self.tape, taken_deal_ids, self.constraints, centered=True)
+        if self.model is None:
+            self.tape_arrays = TapeArrays(self.tape)
+            self.model = build_matrix(self.tape_arrays, self.constraints, start)
+            self.column_loans = numpy.array([self.positions[deal_id][0] for deal_id in self.model.deal_ids.tolist()])
+        else:
+            self.model = recenter_matrix(self.model, self.tape_arrays, self.constraints, start)
+
+        used_pools = sorted(set(evaluator.pool_of) - {-1})
+        freed_pools = set(self.random.sample(used_pools, min(num_pools, len(used_pools))))
+        freed_loans = [loan for loan, options in self.options.items() if evaluator.pool_of[loan] in freed_pools or
+            (evaluator.pool_of[loan] < 0 and any(pool in freed_pools for _, pool, _ in options))]
+
+        values = column_values(self.tape, taken_deal_ids)
+        taken = numpy.array([values.get(f'Deal_{deal_id}', 0) for deal_id in self.model.deal_ids.tolist()], dtype=numpy.float64)
+        fixed = ~numpy.isin(self.column_loans, freed_loans)
+        lower, upper = self.model.column_lower.copy(), self.model.column_upper.copy()
+        num_deals = len(self.model.deal_ids)
+        lower[:num_deals][fixed] = taken[fixed]
+        upper[:num_deals][fixed] = taken[fixed]
+        try:
+            solution = solve_matrix(self.model, 'highs', time_limit, initial_values=values, bounds=(lower, upper))
+        except RuntimeError as e:
+            logging.debug(f'LNS step found nothing: {e}')
+            return 0
+
+        objective = evaluator.objective
+        if solution.objective <= objective + min_gain:
+            return 0
+        evaluator.load(*self.position_arrays(solution.taken_deal_ids))
+        if evaluator.num_violations > 0:
+            # the sub-MIP can be feasible within its tolerances but not for the scorer
+            evaluator.load(*self.position_arrays(taken_deal_ids))
+            return 0
+        return evaluator.objective - objective
+
+    def improve(self, time_budget, lns_pools=6, lns_time_limit=10):
+        '''Alternates shift passes with LNS steps until time_budget seconds have passed
+
+        Returns the taken deal ids of the best solution; history holds (seconds, step, objective) records.'''
+        started = time.time()
+        deadline = started + time_budget
+        self.history.append((0.0, 'start', self.evaluator.objective))
+        steps = [('shift', lambda: self.shift_pass(deadline)),
+            ('lns', lambda: self.lns(lns_pools, min(lns_time_limit, deadline - time.time())))]
+        while time.time() < deadline:
+            for step, run in steps:
+                if time.time() >= deadline:
+                    break
+                gain = run()
+                if gain > min_gain:
+                    self.history.append((time.time() - started, step, self.evaluator.objective))
+                    logging.info(f'{step} improved the objective by {gain} to {self.evaluator.objective}')
+        # resetting the sums clears the rounding errors of the moves from the final objective
+        self.evaluator.load(*self.position_arrays(self.taken_deal_ids))
+        return self.taken_deal_ids
@@ -0,0 +1,482 @@
+import numpy
+import contextlib
+import scipy.sparse
+from .tape import agencies, comparable_categories
+from .presolve import needs_single_link
+from .trace import span, tracing, traced
+
+class RowBuilder:
+    '''Collects constraint rows as coordinate triplets together with their bounds and labels'''
+
+    def __init__(self):
+        self.num_rows = 0
+        self.rows = []
+        self.columns = []
+        self.coefficients = []
+        self.lower = []
+        self.upper = []
+        self.labels = []
+
+    def add_row(self, columns, coefficients, lower, upper, label):
+        '''Adds one row with the given nonzeros'''
+        self.add_rows(numpy.zeros(len(columns), dtype=numpy.int32), columns, coefficients,
+            [lower], [upper], [label])
+
+    def add_rows(self, rows, columns, coefficients, lower, upper, labels):
+        '''Adds len(labels) rows at once; rows numbers the new rows starting from zero'''
+        self.rows.append(numpy.asarray(rows, dtype=numpy.int32) + self.num_rows)
+        self.columns.append(numpy.asarray(columns, dtype=numpy.int32))
+        self.coefficients.append(numpy.asarray(coefficients, dtype=numpy.float64))
+        self.lower.append(numpy.broadcast_to(numpy.asarray(lower, dtype=numpy.float64), (len(labels),)))
+        self.upper.append(numpy.broadcast_to(numpy.asarray(upper, dtype=numpy.float64), (len(labels),)))
+        self.labels.extend(labels)
+        self.num_rows += len(labels)
+
+    def tocsr(self, num_columns):
+        matrix = scipy.sparse.coo_matrix(
+            (numpy.concatenate(self.coefficients), (numpy.concatenate(self.rows), numpy.concatenate(self.columns))),
+            shape=(self.num_rows, num_columns)).tocsr()
+        matrix.eliminate_zeros()
+        return matrix, numpy.concatenate(self.lower), numpy.concatenate(self.upper)
+
+@contextlib.contextmanager
+def family(name, builder):
+    '''Records a constraint family as a span with the rows it adds, the columns they touch and their nonzeros'''
+    first_block, first_row = len(builder.columns), builder.num_rows
+    with span(name, 'family') as counts:
+        yield
+        if tracing():
+            blocks = builder.columns[first_block:]
+            counts.update(rows=builder.num_rows - first_row, nonzeros=sum(len(block) for block in blocks),
+                columns=len(numpy.unique(numpy.concatenate(blocks))) if blocks else 0)
+
+class ExtraColumns:
+    '''Continuous or integer columns that follow the count columns, each with its own bounds'''
+
+    def __init__(self, first_column):
+        self.first_column = first_column
+        self.names = []
+        self.lower = []
+        self.upper = []
+        self.integrality = []
+
+    def add(self, names, lower, upper, is_integer=False):
+        '''Adds one column per name and returns their column numbers'''
+        columns = self.first_column + len(self.names) + numpy.arange(len(names))
+        self.names.extend(names)
+        self.lower.extend([lower] * len(names))
+        self.upper.extend([upper] * len(names))
+        self.integrality.extend([int(is_integer)] * len(names))
+        return columns
+
+class MatrixModel:
+    '''The mortgages problem as one sparse constraint matrix with row bounds
+
+    The columns are the deal variables, followed by one variable per single issuer pool and one loan
+    count variable per agency, and the ExtraColumns of the exact comparability rows if there are any. The deal
+    and pool columns are binary and the objective is maximized.'''
+
+    def __init__(self, deal_ids, single_pool_ids, objective, matrix, row_lower, row_upper, row_labels, first_comparability_row,
+            extra_columns=None, family_rows=None, constraints=None, start=None, presolved_with=None):
+        self.deal_ids = deal_ids
+        self.single_pool_ids = single_pool_ids
+        self.objective = objective
+        self.matrix = matrix
+        self.row_lower = row_lower
+        self.row_upper = row_upper
+        self.row_labels = row_labels
+        # the c13 to c18 rows come last, so that recenter_matrix can replace them
+        self.first_comparability_row = first_comparability_row
+        self.extra_columns = extra_columns
+        # the (first, end) rows of each constraint family and the thresholds and centers they were built with, see update_matrix
+        self.family_rows = family_rows
+        self.constraints = constraints
+        self.start = start
+        # the thresholds that presolve reduced the deals of the tape with, which the model cannot move away from
+        self.presolved_with = presolved_with or {}
+
+    @property
+    def num_rows(self):
+        return self.matrix.shape[0]
+
+    @property
+    def num_columns(self):
+        return self.matrix.shape[1]
+
+    @property
+    def num_binaries(self):
+        return len(self.deal_ids) + len(self.single_pool_ids)
+
+    @property
+    def num_base_columns(self):
+        return self.num_binaries + len(agencies)
+
+    @property
+    def column_names(self):
+        return [f'Deal_{deal_id}' for deal_id in self.deal_ids.tolist()] +\
+            [f'SinglePool_{pool_id}' for pool_id in self.single_pool_ids.tolist()] +\
+            [f'Count_{agency.replace(" ", "")}' for agency in agencies] +\
+            (self.extra_columns.names if self.extra_columns is not None else [])
+
+    def extra_array(self, base, extra_field, dtype):
+        extra = getattr(self.extra_columns, extra_field) if self.extra_columns is not None else []
+        return numpy.concatenate([base, numpy.array(extra, dtype=dtype)])
+
+    @property
+    def integrality(self):
+        base = (numpy.arange(self.num_base_columns) < self.num_binaries).astype(numpy.int8)
+        return self.extra_array(base, 'integrality', numpy.int8)
+
+    @property
+    def column_lower(self):
+        return self.extra_array(numpy.zeros(self.num_base_columns), 'lower', numpy.float64)
+
+    @property
+    def column_upper(self):
+        base = numpy.where(numpy.arange(self.num_base_columns) < self.num_binaries, 1, numpy.inf)
+        return self.extra_array(base, 'upper', numpy.float64)
+
+def add_comparability_rows(builder, tape, constraints, start, count_columns):
+    '''Adds the c13 to c18 rows boxed around the centers in start, with one loan count column per agency'''
+    num_deals = tape.num_deals
+    deal_amount = tape.amount[tape.deal_loan]
+    deal_agency = tape.agency[tape.deal_pool]
+    all_deals = numpy.arange(num_deals)
+    fico = tape.fico[tape.deal_loan]
+    dti = tape.dti[tape.deal_loan]
+
+    # Special constraints for fairness between Fanny Mae and Freddy Mac
+    for agency, count_column in zip(agencies, count_columns.tolist()):
+        agency_mask = deal_agency == tape.code('agency', agency)
+        agency_deals = all_deals[agency_mask]
+        builder.add_row(numpy.append(agency_deals, count_column), numpy.append(numpy.ones(len(agency_deals)), -1),
+            0, 0, f'Number of loans sold to {agency}')
+        for name, values, measure in [('c13', fico, 'FICO score'), ('c14', dti, 'DTI')]:
+            if name not in constraints:
+                continue
+            add_weighted_row(builder, agency_mask, (values - start[name]) * deal_amount, 0, numpy.inf,
+                f'Lower bound on the amount-relative average {measure} of {agency} loans')
+            add_weighted_row(builder, agency_mask, (values - start[name] - constraints[name]) * deal_amount, -numpy.inf, 0,
+                f'Upper bound on the amount-relative average {measure} of {agency} loans')
+        for name, field, description in comparable_categories:
+            if name not in constraints:
+                continue
+            deal_codes = tape.category_codes[field][tape.deal_loan]
+            for code, value in enumerate(tape.categories[field]):
+                value_deals = all_deals[agency_mask & (deal_codes == code)]
+                columns = numpy.append(value_deals, count_column)
+                ones = numpy.ones(len(value_deals))
+                builder.add_row(columns, numpy.append(ones, -start[name][value]), 0, numpy.inf,
+                    f'Lower bound on number of {agency} loans {description.format(value.replace("/", " per "))}')
+                builder.add_row(columns, numpy.append(ones, -start[name][value] - constraints[name]), -numpy.inf, 0,
+                    f'Upper bound on number of {agency} loans {description.format(value.replace("/", " per "))}')
+
+def recenter_matrix(model, tape, constraints, start):
+    '''Returns a copy of the MatrixModel with only its c13 to c18 rows rebuilt around the new centers'''
+    return update_matrix(model, tape, constraints, start)
+
+def count_bits(tape):
+    '''The number of bits that the loan count of an agency is expanded into'''
+    return max(1, tape.num_loans.bit_length())
+
+def add_exact_comparability_rows(builder, tape, constraints, count_columns, extra_columns):
+    '''Adds c13 to c18 as exact bounds on the distance between the measures of both agencies
+
+    |r_F - r_M| <= t holds if and only if both measures lie in [c, c + t] for some center c, so every measure
+    gets a free center column. The products of the center with the amount sold to an agency are linearized
+    per (loan, agency), whose deals add up to a binary, and the products with the loan count of an agency
+    are linearized per bit of that count. Both linearizations are exact for integer solutions.'''
+    num_deals = tape.num_deals
+    deal_amount = tape.amount[tape.deal_loan]
+    deal_agency = tape.agency[tape.deal_pool]
+    all_deals = numpy.arange(num_deals)
+    num_bits = count_bits(tape)
+    powers = 2.0 ** numpy.arange(num_bits)
+    amount_scale = tape.amount.mean()
+
+    bit_columns = {}
+    for agency, count_column in zip(agencies, count_columns.tolist()):
+        agency_deals = all_deals[deal_agency == tape.code('agency', agency)]
+        builder.add_row(numpy.append(agency_deals, count_column), numpy.append(numpy.ones(len(agency_deals)), -1),
+            0, 0, f'Number of loans sold to {agency}')
+        short_agency = agency.replace(' ', '')
+        bit_columns[agency] = extra_columns.add([f'CountBit_{short_agency}_{bit}' for bit in range(num_bits)], 0, 1, is_integer=True)
+        builder.add_row(numpy.append(bit_columns[agency], count_column), numpy.append(-powers, 1), 0, 0,
+            f'Binary expansion of the number of loans sold to {agency}')
+
+    # FICO and DTI: the center times the amount of each loan sold to the agency
+    for name, field, measure in [('c13', 'fico', 'FICO score'), ('c14', 'dti', 'DTI')]:
+        if name not in constraints:
+            continue
+        loan_values = getattr(tape, field)
+        lowest, highest = loan_values.min(), loan_values.max()
+        center = extra_columns.add([f'Center_{name}'], lowest, highest)[0]
+        values = loan_values[tape.deal_loan]
+        for agency in agencies:
+            agency_deals = all_deals[deal_agency == tape.code('agency', agency)]
+            pair_loans, deal_pairs = numpy.unique(tape.deal_loan[agency_deals], return_inverse=True)
+            short_agency = agency.replace(' ', '')
+            products = extra_columns.add([f'Product_{name}_{short_agency}_{loan_id}' for loan_id in tape.loan_ids[pair_loans].tolist()],
+                0, highest)
+            num_pairs = len(pair_loans)
+            pairs = numpy.arange(num_pairs)
+            pair_labels = [f'{measure} center times loan {loan_id} sold to {agency}' for loan_id in tape.loan_ids[pair_loans].tolist()]
+            # product <= highest * sold
+            builder.add_rows(numpy.concatenate([pairs, deal_pairs]), numpy.concatenate([products, agency_deals]),
+                numpy.concatenate([numpy.ones(num_pairs), numpy.full(len(agency_deals), -highest)]), -numpy.inf, 0, pair_labels)
+            # product <= center - lowest * (1 - sold)
+            builder.add_rows(numpy.concatenate([pairs, pairs, deal_pairs]), numpy.concatenate([products, numpy.full(num_pairs, center), agency_deals]),
+                numpy.concatenate([numpy.ones(num_pairs), -numpy.ones(num_pairs), numpy.full(len(agency_deals), -lowest)]), -numpy.inf, -lowest, pair_labels)
+            # product >= center - highest * (1 - sold)
+            builder.add_rows(numpy.concatenate([pairs, pairs, deal_pairs]), numpy.concatenate([products, numpy.full(num_pairs, center), agency_deals]),
+                numpy.concatenate([numpy.ones(num_pairs), -numpy.ones(num_pairs), numpy.full(len(agency_deals), -highest)]), -highest, numpy.inf, pair_labels)
+
+            # amounts are taken relative to the average loan, which keeps the coefficients in a sane range
+            columns = numpy.concatenate([agency_deals, products])
+            pair_amounts = tape.amount[pair_loans] / amount_scale
+            agency_amounts = deal_amount[agency_deals] / amount_scale
+            builder.add_row(columns, numpy.concatenate([values[agency_deals] * agency_amounts, -pair_amounts]), 0, numpy.inf,
+                f'Lower bound on the amount-relative average {measure} of {agency} loans')
+            builder.add_row(columns, numpy.concatenate([(values[agency_deals] - constraints[name]) * agency_amounts, -pair_amounts]),
+                -numpy.inf, 0, f'Upper bound on the amount-relative average {measure} of {agency} loans')
+
+    # categories: the center times each bit of the loan count of the agency
+    bits = numpy.arange(num_bits)
+    for name, field, description in comparable_categories:
+        if name not in constraints:
+            continue
+        deal_codes = tape.category_codes[field][tape.deal_loan]
+        for code, value in enumerate(tape.categories[field]):
+            center = extra_columns.add([f'Center_{name}_{code}'], 0, 1)[0]
+            label = description.format(value.replace('/', ' per '))
+            for agency, count_column in zip(agencies, count_columns.tolist()):
+                short_agency = agency.replace(' ', '')
+                products = extra_columns.add([f'Product_{name}_{code}_{short_agency}_{bit}' for bit in range(num_bits)], 0, 1)
+                bit_labels = [f'Center of loans {label} times bit {bit} of the {agency} loan count' for bit in range(num_bits)]
+                builder.add_rows(numpy.concatenate([bits, bits]), numpy.concatenate([products, bit_columns[agency]]),
+                    numpy.concatenate([numpy.ones(num_bits), -numpy.ones(num_bits)]), -numpy.inf, 0, bit_labels)
+                builder.add_rows(numpy.concatenate([bits, bits]), numpy.concatenate([products, numpy.full(num_bits, center)]),
+                    numpy.concatenate([numpy.ones(num_bits), -numpy.ones(num_bits)]), -numpy.inf, 0, bit_labels)
+                builder.add_rows(numpy.concatenate([bits, bits, bits]), numpy.concatenate([products, numpy.full(num_bits, center), bit_columns[agency]]),
+                    numpy.concatenate([numpy.ones(num_bits), -numpy.ones(num_bits), -numpy.ones(num_bits)]), -1, numpy.inf, bit_labels)
+
+                value_deals = all_deals[(deal_agency == tape.code('agency', agency)) & (deal_codes == code)]
+                ones = numpy.ones(len(value_deals))
+                builder.add_row(numpy.concatenate([value_deals, products]), numpy.concatenate([ones, -powers]), 0, numpy.inf,
+                    f'Lower bound on number of {agency} loans {label}')
+                builder.add_row(numpy.concatenate([value_deals, products, [count_column]]),
+                    numpy.concatenate([ones, -powers, [-constraints[name]]]), -numpy.inf, 0, f'Upper bound on number of {agency} loans {label}')
+
+def exact_column_values(tape, taken_deal_ids, constraints):
+    '''Returns the values of the center, product and count bit columns of the exact comparability rows by name
+    for a solution that sells exactly the taken deals; the other columns come from extract.column_values'''
+    taken = numpy.flatnonzero(numpy.isin(tape.deal_ids, taken_deal_ids))
+    taken_loans = tape.deal_loan[taken]
+    taken_agency = tape.agency[tape.deal_pool[taken]]
+    sold_to = {agency: taken_agency == tape.code('agency', agency) for agency in agencies}
+    num_bits = count_bits(tape)
+
+    def center(measures, lowest, tolerance):
+        # both measures lie strictly inside [center, center + tolerance] if they are feasible at all
+        return max(lowest, min(measures) - (tolerance - abs(measures[0] - measures[1])) / 2)
+
+    values = {}
+    for agency in agencies:
+        count = int(numpy.count_nonzero(sold_to[agency]))
+        for bit in range(num_bits):
+            values[f'CountBit_{agency.replace(" ", "")}_{bit}'] = (count >> bit) & 1
+
+    for name, field in [('c13', 'fico'), ('c14', 'dti')]:
+        if name not in constraints:
+            continue
+        loan_values = getattr(tape, field)
+        measures = []
+        for agency in agencies:
+            agency_loans = taken_loans[sold_to[agency]]
+            measures.append(numpy.dot(loan_values[agency_loans], tape.amount[agency_loans]) / (tape.amount[agency_loans].sum() or 1))
+        values[f'Center_{name}'] = center(measures, loan_values.min(), constraints[name])
+        for agency in agencies:
+            for loan_id in tape.loan_ids[taken_loans[sold_to[agency]]].tolist():
+                values[f'Product_{name}_{agency.replace(" ", "")}_{loan_id}'] = values[f'Center_{name}']
+
+    for name, field, _ in comparable_categories:
+        if name not in constraints:
+            continue
+        taken_codes = tape.category_codes[field][taken_loans]
+        for code in range(len(tape.categories[field])):
+            measures = [numpy.count_nonzero(taken_codes[sold_to[agency]] == code) / max(numpy.count_nonzero(sold_to[agency]), 1)
+                for agency in agencies]
+            values[f'Center_{name}_{code}'] = center(measures, 0, constraints[name])
+            for agency in agencies:
+                short_agency = agency.replace(' ', '')
+                for bit in range(num_bits):
+                    values[f'Product_{name}_{code}_{short_agency}_{bit}'] = values[f'Center_{name}_{code}'] * values[f'CountBit_{short_agency}_{bit}']
+    return values
+
+def add_weighted_row(builder, mask, coefficients, lower, upper, label):
+    '''Adds one row over the deals in mask with their coefficients'''
+    columns = numpy.flatnonzero(mask)
+    builder.add_row(columns, coefficients[mask], lower, upper, label)
+
+def add_mutex_rows(builder, tape, constraints, start):
+    # For each loan having at least two pools: One mutex constraint
+    deals_per_loan = numpy.bincount(tape.deal_loan, minlength=tape.num_loans)
+    mutex_loans = numpy.flatnonzero(deals_per_loan >= 2)
+    mutex_row = numpy.full(tape.num_loans, -1, dtype=numpy.int32)
+    mutex_row[mutex_loans] = numpy.arange(len(mutex_loans))
+    mutex_deals = numpy.flatnonzero(mutex_row[tape.deal_loan] >= 0)
+    builder.add_rows(mutex_row[tape.deal_loan[mutex_deals]], mutex_deals, numpy.ones(len(mutex_deals)),
+        -numpy.inf, 1, [f'Mutex constraint for loan {loan_id}' for loan_id in tape.loan_ids[mutex_loans].tolist()])
+
+def add_balance_rows(builder, tape, constraints, start):
+    # For each standard pool having at least one high balance loan: One standard balance constraint
+    deal_amount = tape.amount[tape.deal_loan]
+    expensive_per_pool = numpy.bincount(tape.deal_pool, weights=tape.is_expensive[tape.deal_loan], minlength=tape.num_pools)
+    balance_pools = numpy.flatnonzero(tape.is_standard & (expensive_per_pool > 0))
+    balance_row = numpy.full(tape.num_pools, -1, dtype=numpy.int32)
+    balance_row[balance_pools] = numpy.arange(len(balance_pools))
+    balance_deals = numpy.flatnonzero(balance_row[tape.deal_pool] >= 0)
+    balance_coefficients = (tape.is_expensive[tape.deal_loan] - constraints['c1']) * deal_amount
+    builder.add_rows(balance_row[tape.deal_pool[balance_deals]], balance_deals, balance_coefficients[balance_deals],
+        -numpy.inf, 0, [f'Standard balance constraint for pool {pool_id}' for pool_id in tape.pool_ids[balance_pools].tolist()])
+
+def add_single_issuer_rows(builder, tape, constraints, start):
+    # For each single issuer pool: One single issuer constraint plus as many helper constraints as this pool is allowed loans
+    num_deals = tape.num_deals
+    deal_amount = tape.amount[tape.deal_loan]
+    single_pools = numpy.flatnonzero(tape.is_single)
+    single_column = numpy.full(tape.num_pools, -1, dtype=numpy.int32)
+    single_column[single_pools] = num_deals + numpy.arange(len(single_pools))
+    single_deals = numpy.flatnonzero(single_column[tape.deal_pool] >= 0)
+    single_row = single_column[tape.deal_pool[single_deals]] - num_deals
+    # amounts above c2 are cut down to c2, which leaves the integer solutions alone but tightens the relaxation
+    builder.add_rows(
+        numpy.concatenate([single_row, numpy.arange(len(single_pools))]),
+        numpy.concatenate([single_deals, single_column[single_pools]]),
+        numpy.concatenate([numpy.minimum(deal_amount[single_deals], constraints['c2']), numpy.full(len(single_pools), -constraints['c2'])]),
+        0, numpy.inf, [f'Single issuer constraint for pool {pool_id}' for pool_id in tape.pool_ids[single_pools].tolist()])
+    if tape.presolved_with:
+        single_deals = single_deals[needs_single_link(deal_amount[single_deals], constraints)]
+    helper_rows = numpy.arange(len(single_deals))
+    builder.add_rows(
+        numpy.concatenate([helper_rows, helper_rows]),
+        numpy.concatenate([single_column[tape.deal_pool[single_deals]], single_deals]),
+        numpy.concatenate([numpy.ones(len(single_deals)), -numpy.ones(len(single_deals))]),
+        0, numpy.inf, [f'Pool {pool_id} is not empty if loan {loan_id} is sold to it' for pool_id, loan_id in
+            zip(tape.pool_ids[tape.deal_pool[single_deals]].tolist(), tape.loan_ids[tape.deal_loan[single_deals]].tolist())])
+
+def add_pingora_rows(builder, tape, constraints, start):
+    # 5 Pingora constraints
+    deal_amount = tape.amount[tape.deal_loan]
+    fico = tape.fico[tape.deal_loan]
+    dti = tape.dti[tape.deal_loan]
+    is_expensive = tape.is_expensive[tape.deal_loan]
+    pingora = tape.servicer[tape.deal_pool] == tape.code('servicer', 'Pingora')
+    add_weighted_row(builder, pingora, deal_amount, -numpy.inf, constraints['c3'], 'Upper bound on the total amount sold to Pingora')
+    add_weighted_row(builder, pingora, (is_expensive - constraints['c4']) * deal_amount, -numpy.inf, 0, 'Upper bound on high balance loans sold to Pingora')
+    add_weighted_row(builder, pingora, (fico - constraints['c5']) * deal_amount, 0, numpy.inf, 'Lower bound on the amount-relative average FICO score of loans sold to Pingora')
+    add_weighted_row(builder, pingora, (dti - constraints['c6']) * deal_amount, -numpy.inf, 0, 'Upper bound on the amount-relative average DTI of loans sold to Pingora')
+    add_weighted_row(builder, pingora, tape.is_california[tape.deal_loan] - constraints['c7'], -numpy.inf, 0,
+        'Upper bound on the number of loans issued to buy a residence in California and sold to Pingora')
+
+def add_two_harbors_rows(builder, tape, constraints, start):
+    # 5 Two Harbors constraints
+    deal_amount = tape.amount[tape.deal_loan]
+    fico = tape.fico[tape.deal_loan]
+    dti = tape.dti[tape.deal_loan]
+    two_harbors = tape.servicer[tape.deal_pool] == tape.code('servicer', 'Two Harbors')
+    add_weighted_row(builder, two_harbors, deal_amount, constraints['c8'], numpy.inf, 'Lower bound on the total amount sold to Two Harbors')
+    add_weighted_row(builder, two_harbors, (fico - constraints['c9']) * deal_amount, 0, numpy.inf, 'Lower bound on the amount-relative average FICO score of loans sold to Two Harbors')
+    add_weighted_row(builder, two_harbors, (dti - constraints['c10']) * deal_amount, -numpy.inf, 0, 'Upper bound on the amount-relative average DTI of loans sold to Two Harbors')
+    add_weighted_row(builder, two_harbors, tape.is_cashout[tape.deal_loan] - constraints['c11'], -numpy.inf, 0,
+        'Upper bound on the number of loans issued in cash and sold to Two Harbors')
+    add_weighted_row(builder, two_harbors, tape.is_primary[tape.deal_loan] - constraints['c12'], 0, numpy.inf,
+        'Upper bound on the number of loans issued to finance a primary residence and sold to Two Harbors')
+
+def count_columns(tape):
+    '''The loan count column of each agency, which follow the deal and single issuer pool columns'''
+    return tape.num_deals + int(numpy.count_nonzero(tape.is_single)) + numpy.arange(len(agencies))
+
+def add_boxed_comparability_rows(builder, tape, constraints, start):
+    add_comparability_rows(builder, tape, constraints, start, count_columns(tape))
+
+# the constraint families in the order of their rows, with the thresholds their coefficients and bounds depend on
+matrix_families = [
+    ('mutex', [], add_mutex_rows),
+    ('c1', ['c1'], add_balance_rows),
+    ('c2', ['c2'], add_single_issuer_rows),
+    ('c3-c7', ['c3', 'c4', 'c5', 'c6', 'c7'], add_pingora_rows),
+    ('c8-c12', ['c8', 'c9', 'c10', 'c11', 'c12'], add_two_harbors_rows),
+    ('c13-c18', ['c13', 'c14', 'c15', 'c16', 'c17', 'c18'], add_boxed_comparability_rows)]
+
+# the thresholds that are only the bound of the first row of their family, as (family, bound)
+bound_thresholds = {'c3': ('c3-c7', 'upper'), 'c8': ('c8-c12', 'lower')}
+
+@traced('build', lambda model, *arguments, **keywords: {'rows': model.num_rows, 'columns': model.num_columns, 'nonzeros': model.matrix.nnz})
+def build_matrix(tape, constraints, start, comparability='boxed'):
+    '''Builds the same constraints as the PuLP model of genilp.py directly as a sparse matrix
+
+    The comparability constraints c13 to c18 that are in constraints are boxed around the centers in start. Instead of repeating
+    every deal of an agency in each c15 to c18 row, these rows refer to the agency's loan count column.
+    With comparability 'exact', start is not needed, see add_exact_comparability_rows.'''
+    num_deals = tape.num_deals
+    single_pools = numpy.flatnonzero(tape.is_single)
+    builder = RowBuilder()
+    family_rows = {}
+    extra_columns = None
+    for name, _, add_rows in matrix_families:
+        first_row = builder.num_rows
+        with family(name, builder):
+            if name == 'c13-c18' and comparability == 'exact':
+                extra_columns = ExtraColumns(num_deals + len(single_pools) + len(agencies))
+                add_exact_comparability_rows(builder, tape, constraints, count_columns(tape), extra_columns)
+            else:
+                add_rows(builder, tape, constraints, start)
+        family_rows[name] = (first_row, builder.num_rows)
+
+    num_extra_columns = len(extra_columns.names) if extra_columns is not None else 0
+    matrix, row_lower, row_upper = builder.tocsr(num_deals + len(single_pools) + len(agencies) + num_extra_columns)
+    objective = numpy.concatenate([tape.price, numpy.zeros(len(single_pools) + len(agencies) + num_extra_columns)])
+    return MatrixModel(tape.deal_ids, tape.pool_ids[single_pools], objective, matrix, row_lower, row_upper, builder.labels,
+        family_rows['c13-c18'][0], extra_columns, family_rows, dict(constraints), start, dict(tape.presolved_with))
+
+def updatable(model, constraints):
+    '''Whether update_matrix can move the model to these constraints: they must name the same thresholds, and c2,
+    by which the tape was pruned, and the thresholds that presolve reduced the tape with must stay the same'''
+    return model.family_rows is not None and model.extra_columns is None and constraints.keys() == model.constraints.keys() and\
+        constraints.get('c2') == model.constraints.get('c2') and\
+        all(constraints.get(name) == value for name, value in model.presolved_with.items())
+
+def update_matrix(model, tape, constraints, start=None):
+    '''Returns a copy of the boxed MatrixModel of the tape for new thresholds and c13 to c18 centers
+
+    Only the rows of the families whose thresholds or centers changed are built again; a change of c3 or c8
+    only moves the bound of its row. Without start the centers stay those of the model. The columns and the
+    number of rows stay the same, see updatable.'''
+    if not updatable(model, constraints):
+        raise ValueError('The thresholds changed more than the coefficients and bounds of the model, it has to be built again')
+    start = model.start if start is None else start
+    changed = {name for name in constraints if constraints[name] != model.constraints[name]}
+    blocks = []
+    row_lower = model.row_lower.copy()
+    row_upper = model.row_upper.copy()
+    row_labels = list(model.row_labels)
+    for name, thresholds, add_rows in matrix_families:
+        first, end = model.family_rows[name]
+        rebuilt = changed.intersection(thresholds).difference(bound_thresholds)
+        if name == 'c13-c18' and start != model.start:
+            rebuilt.add('start')
+        if rebuilt and first < end:
+            builder = RowBuilder()
+            add_rows(builder, tape, constraints, start)
+            rows, row_lower[first:end], row_upper[first:end] = builder.tocsr(model.num_columns)
+            row_labels[first:end] = builder.labels
+            blocks.append(rows)
+            continue
+        blocks.append(model.matrix[first:end])
+        for threshold in changed.intersection(thresholds).intersection(bound_thresholds):
+            bounds = row_upper if bound_thresholds[threshold][1] == 'upper' else row_lower
+            bounds[first] = constraints[threshold]
+    return MatrixModel(model.deal_ids, model.single_pool_ids, model.objective, scipy.sparse.vstack(blocks, format='csr'),
+        row_lower, row_upper, row_labels, model.first_comparability_row, None, model.family_rows, dict(constraints), start,
+        model.presolved_with)
@@ -0,0 +1,192 @@
+import numpy
+from .tape import Loan, Pool, Deal, Tape, comparable_categories
+
+loan_columns = ['amount', 'fico', 'dti']
+loan_flags = ['is_expensive', 'is_california', 'is_cashout', 'is_primary']
+loan_categories = [field for _, field, _ in comparable_categories]
+pool_categories = ['servicer', 'agency']
+
+def intern_codes(values):
+    '''Returns the sorted distinct values and the position of every value in them as small integer codes'''
+    labels, codes = numpy.unique(numpy.array(values, dtype=object).astype(str), return_inverse=True)
+    return [str(label) for label in labels], codes.astype(numpy.int32).reshape(-1)
+
+class TapeArrays:
+    '''The loans, pools and deals as typed arrays; deals refer to their loan and pool by position
+
+    The categorical loan fields and the servicer and agency of the pools are stored as codes into the sorted
+    lists of their values in categories. This is the one layout of a tape outside of its Loan, Pool and Deal
+    records: the matrix builder works on it, and the cache and the shared memory of the portfolio store it.'''
+
+    def __init__(self, tape=None):
+        self.presolved_with = {}
+        if tape is None:
+            return
+        self.presolved_with = dict(tape.presolved_with)
+        loan_list = list(tape.loans.values())
+        pool_list = list(tape.pools.values())
+        deal_list = list(tape.deals.values())
+
+        self.loan_ids = numpy.array([loan.id for loan in loan_list], dtype=numpy.int64)
+        for field in loan_columns:
+            setattr(self, field, numpy.array([getattr(loan, field) for loan in loan_list], dtype=numpy.float64))
+        for field in loan_flags:
+            setattr(self, field, numpy.array([getattr(loan, field) for loan in loan_list], dtype=numpy.int8))
+        self.categories = {}
+        self.category_codes = {}
+        for field in loan_categories:
+            self.categories[field], self.category_codes[field] = intern_codes([getattr(loan, field) for loan in loan_list])
+
+        self.pool_ids = numpy.array([pool.id for pool in pool_list], dtype=numpy.int64)
+        self.is_standard = numpy.array([pool.is_standard for pool in pool_list], dtype=bool)
+        self.is_single = numpy.array([pool.is_single for pool in pool_list], dtype=bool)
+        for field in pool_categories:
+            self.categories[field], self.category_codes[field] = intern_codes([getattr(pool, field) for pool in pool_list])
+
+        loan_positions = {loan_id: position for position, loan_id in enumerate(self.loan_ids.tolist())}
+        pool_positions = {pool_id: position for position, pool_id in enumerate(self.pool_ids.tolist())}
+        self.deal_ids = numpy.array([deal.id for deal in deal_list], dtype=numpy.int64)
+        self.deal_loan = numpy.array([loan_positions[deal.loan_id] for deal in deal_list], dtype=numpy.int32)
+        self.deal_pool = numpy.array([pool_positions[deal.pool_id] for deal in deal_list], dtype=numpy.int32)
+        self.price = numpy.array([deal.price for deal in deal_list], dtype=numpy.float64)
+
+    def extend_categories(self, field, values):
+        '''Returns the codes of the values, adding the values that are new to the sorted labels of the field'''
+        labels = self.categories[field]
+        new_labels = sorted(set(labels).union(values))
+        positions = {label: position for position, label in enumerate(new_labels)}
+        if new_labels != labels:
+            recoded = numpy.array([positions[label] for label in labels], dtype=numpy.int32)
+            self.category_codes[field] = recoded[self.category_codes[field]]
+            self.categories[field] = new_labels
+        return numpy.array([positions[value] for value in values], dtype=numpy.int32)
+
+    def extend(self, loans, pools, deals):
+        '''Appends Loan, Pool and Deal records, so that the arrays stay those of a tape to which they were added
+
+        The deals may refer to the loans and pools appended with them as well as to those already here.'''
+        self.loan_ids = numpy.concatenate([self.loan_ids, numpy.array([loan.id for loan in loans], dtype=numpy.int64)])
+        for field in loan_columns:
+            setattr(self, field, numpy.concatenate([getattr(self, field), numpy.array([getattr(loan, field) for loan in loans], dtype=numpy.float64)]))
+        for field in loan_flags:
+            setattr(self, field, numpy.concatenate([getattr(self, field), numpy.array([getattr(loan, field) for loan in loans], dtype=numpy.int8)]))
+        for field in loan_categories:
+            codes = self.extend_categories(field, [getattr(loan, field) for loan in loans])
+            self.category_codes[field] = numpy.concatenate([self.category_codes[field], codes])
+
+        self.pool_ids = numpy.concatenate([self.pool_ids, numpy.array([pool.id for pool in pools], dtype=numpy.int64)])
+        self.is_standard = numpy.concatenate([self.is_standard, numpy.array([pool.is_standard for pool in pools], dtype=bool)])
+        self.is_single = numpy.concatenate([self.is_single, numpy.array([pool.is_single for pool in pools], dtype=bool)])
+        for field in pool_categories:
+            codes = self.extend_categories(field, [getattr(pool, field) for pool in pools])
+            self.category_codes[field] = numpy.concatenate([self.category_codes[field], codes])
+
+        loan_positions = {loan_id: position for position, loan_id in enumerate(self.loan_ids.tolist())}
+        pool_positions = {pool_id: position for position, pool_id in enumerate(self.pool_ids.tolist())}
+        self.deal_ids = numpy.concatenate([self.deal_ids, numpy.array([deal.id for deal in deals], dtype=numpy.int64)])
+        self.deal_loan = numpy.concatenate([self.deal_loan, numpy.array([loan_positions[deal.loan_id] for deal in deals], dtype=numpy.int32)])
+        self.deal_pool = numpy.concatenate([self.deal_pool, numpy.array([pool_positions[deal.pool_id] for deal in deals], dtype=numpy.int32)])
+        self.price = numpy.concatenate([self.price, numpy.array([deal.price for deal in deals], dtype=numpy.float64)])
+
+    @property
+    def num_loans(self):
+        return len(self.loan_ids)
+
+    @property
+    def num_pools(self):
+        return len(self.pool_ids)
+
+    @property
+    def num_deals(self):
+        return len(self.deal_ids)
+
+    @property
+    def servicer(self):
+        '''The servicer code of every pool'''
+        return self.category_codes['servicer']
+
+    @property
+    def agency(self):
+        '''The agency code of every pool'''
+        return self.category_codes['agency']
+
+    def code(self, field, value):
+        '''Returns the code of a value of a categorical field, or -1 if no loan or pool has that value'''
+        labels = self.categories[field]
+        return labels.index(value) if value in labels else -1
+
+    def select(self, deals):
+        '''Returns the TapeArrays of the deals at the given ascending positions and of the loans and pools they
+        refer to, with only the category values of those loans and pools, as the TapeArrays of a pruned Tape have'''
+        selected = TapeArrays()
+        selected.presolved_with = dict(self.presolved_with)
+        loans = numpy.unique(self.deal_loan[deals])
+        pools = numpy.unique(self.deal_pool[deals])
+        selected.loan_ids = self.loan_ids[loans]
+        for field in loan_columns + loan_flags:
+            setattr(selected, field, getattr(self, field)[loans])
+        selected.pool_ids = self.pool_ids[pools]
+        selected.is_standard = self.is_standard[pools]
+        selected.is_single = self.is_single[pools]
+        selected.categories = {}
+        selected.category_codes = {}
+        for fields, positions in [(loan_categories, loans), (pool_categories, pools)]:
+            for field in fields:
+                used, codes = numpy.unique(self.category_codes[field][positions], return_inverse=True)
+                selected.categories[field] = [self.categories[field][code] for code in used.tolist()]
+                selected.category_codes[field] = codes.astype(numpy.int32).reshape(-1)
+
+        loan_positions = numpy.full(self.num_loans, -1, dtype=numpy.int32)
+        loan_positions[loans] = numpy.arange(len(loans))
+        pool_positions = numpy.full(self.num_pools, -1, dtype=numpy.int32)
+        pool_positions[pools] = numpy.arange(len(pools))
+        selected.deal_ids = self.deal_ids[deals]
+        selected.deal_loan = loan_positions[self.deal_loan[deals]]
+        selected.deal_pool = pool_positions[self.deal_pool[deals]]
+        selected.price = self.price[deals]
+        return selected
+
+    def to_arrays(self):
+        '''Returns the arrays by name and the category labels, see from_arrays'''
+        arrays = {name: getattr(self, name) for name in ['loan_ids'] + loan_columns + loan_flags +
+            ['pool_ids', 'is_standard', 'is_single', 'deal_ids', 'deal_loan', 'deal_pool', 'price']}
+        for field, codes in self.category_codes.items():
+            arrays[f'code_{field}'] = codes
+        return arrays, self.categories
+
+    @classmethod
+    def from_arrays(cls, arrays, labels):
+        '''Wraps the arrays of to_arrays, for example memory-mapped ones, without copying them'''
+        tape_arrays = cls()
+        for name, array in arrays.items():
+            if not name.startswith('code_'):
+                setattr(tape_arrays, name, array)
+        tape_arrays.categories = dict(labels)
+        tape_arrays.category_codes = {field: arrays[f'code_{field}'] for field in labels}
+        return tape_arrays
+
+    def to_tape(self):
+        '''Builds the Loan, Pool and Deal records of the arrays, with one shared string per category value'''
+        loans = {}
+        columns = [getattr(self, field).tolist() for field in loan_columns + loan_flags]
+        categories = [[self.categories[field][code] for code in self.category_codes[field].tolist()]
+            for field in ['occupancy', 'location', 'property_type', 'purpose']]
+        for position, loan_id in enumerate(self.loan_ids.tolist()):
+            amount, fico, dti, is_expensive, is_california, is_cashout, is_primary = [column[position] for column in columns]
+            occupancy, location, property_type, purpose = [column[position] for column in categories]
+            loans[loan_id] = Loan(loan_id, amount, fico, dti, int(is_expensive), int(is_california), int(is_cashout),
+                int(is_primary), occupancy, location, property_type, purpose)
+
+        pools = {}
+        servicers, agencies = self.categories['servicer'], self.categories['agency']
+        for pool_id, is_standard, is_single, servicer, agency in zip(self.pool_ids.tolist(), self.is_standard.tolist(),
+                self.is_single.tolist(), self.servicer.tolist(), self.agency.tolist()):
+            pools[pool_id] = Pool(pool_id, is_standard, is_single, servicers[servicer], agencies[agency])
+
+        tape = Tape(loans, pools)
+        loan_ids, pool_ids = self.loan_ids.tolist(), self.pool_ids.tolist()
+        for deal_id, loan, pool, price in zip(self.deal_ids.tolist(), self.deal_loan.tolist(), self.deal_pool.tolist(),
+                self.price.tolist()):
+            tape.add_deal(Deal(deal_id, pool_ids[pool], loan_ids[loan], price))
+        tape.presolved_with = dict(self.presolved_with)
+        return tape
@@ -0,0 +1,88 @@
+import csv
+import numpy
+from .trace import traced
+
+# how many columns are formatted before their lines are handed to the file
+columns_per_chunk = 1024
+
+def format_entries(name, entries):
+    '''Formats the (row name, value) entries of one column, two entries per line as free MPS allows'''
+    lines = []
+    for first in range(0, len(entries), 2):
+        line = f' {name}'
+        for row, value in entries[first:first + 2]:
+            line += f' {row} {value:.12g}'
+        lines.append(line + '\n')
+    return lines
+
+@traced('write')
+def write_mps(model, mps_path, names_path=None, problem_name='MortgagesProblem'):
+    '''Streams a MatrixModel to a free MPS file column by column
+
+    Rows get compact names R0, R1, ..; if names_path is given, a CSV file mapping every compact row name
+    to its descriptive label is written next to it. Columns keep their Deal_ and SinglePool_ names, so that
+    solution files can be read back as before. The objective row holds the negated selling prices.'''
+    matrix = model.matrix.tocsc()
+    matrix.sort_indices()
+    column_names = model.column_names
+    integrality = model.integrality.tolist()
+    row_lower = model.row_lower
+    row_upper = model.row_upper
+
+    with open(mps_path, 'w') as mps_file:
+        # CBC does not read an OBJSENSE section, so the negated selling price is minimized instead
+        mps_file.write(f'NAME {problem_name}\n')
+        mps_file.write('* SENSE: maximize, objective coefficients are negated\n')
+
+        mps_file.write('ROWS\n N obj\n')
+        row_types = numpy.where(numpy.isinf(row_lower), 'L', numpy.where(numpy.isinf(row_upper), 'G',
+            numpy.where(row_lower == row_upper, 'E', 'L')))
+        mps_file.writelines(f' {row_type} R{row}\n' for row, row_type in enumerate(row_types.tolist()))
+
+        mps_file.write('COLUMNS\n')
+        objective = (-model.objective).tolist()
+        is_integer = False
+        for first_column in range(0, model.num_columns, columns_per_chunk):
+            lines = []
+            for column in range(first_column, min(first_column + columns_per_chunk, model.num_columns)):
+                if integrality[column] != is_integer:
+                    is_integer = integrality[column]
+                    lines.append(f" MARKER 'MARKER' '{'INTORG' if is_integer else 'INTEND'}'\n")
+                entries = [('obj', objective[column])] if objective[column] != 0 else []
+                start, end = matrix.indptr[column], matrix.indptr[column + 1]
+                entries.extend((f'R{row}', value) for row, value in
+                    zip(matrix.indices[start:end].tolist(), matrix.data[start:end].tolist()))
+                lines.extend(format_entries(column_names[column], entries))
+            mps_file.writelines(lines)
+        if is_integer:
+            mps_file.write(" MARKER 'MARKER' 'INTEND'\n")
+
+        mps_file.write('RHS\n')
+        rhs = numpy.where(numpy.isinf(row_upper), row_lower, row_upper)
+        nonzero_rows = numpy.flatnonzero(rhs != 0)
+        mps_file.writelines(format_entries('RHS', [(f'R{row}', value) for row, value in
+            zip(nonzero_rows.tolist(), rhs[nonzero_rows].tolist())]))
+
+        ranged_rows = numpy.flatnonzero(~numpy.isinf(row_lower) & ~numpy.isinf(row_upper) & (row_lower != row_upper))
+        if len(ranged_rows) > 0:
+            mps_file.write('RANGES\n')
+            mps_file.writelines(format_entries('RNG', [(f'R{row}', value) for row, value in
+                zip(ranged_rows.tolist(), (row_upper - row_lower)[ranged_rows].tolist())]))
+
+        # columns without a bound line are continuous and nonnegative
+        mps_file.write('BOUNDS\n')
+        for name, is_integer, lower, upper in zip(column_names, integrality, model.column_lower.tolist(), model.column_upper.tolist()):
+            if is_integer and lower == 0 and upper == 1:
+                mps_file.write(f' BV BND {name}\n')
+                continue
+            if lower != 0:
+                mps_file.write(f' LO BND {name} {lower:.12g}\n')
+            if upper != numpy.inf:
+                mps_file.write(f' UP BND {name} {upper:.12g}\n')
+        mps_file.write('ENDATA\n')
+
+    if names_path is not None:
+        with open(names_path, 'w') as names_file:
+            names_writer = csv.writer(names_file)
+            names_writer.writerow(['Row', 'Label'])
+            names_writer.writerows((f'R{row}', label) for row, label in enumerate(model.row_labels))
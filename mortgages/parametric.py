@@ -0,0 +1,80 @@
+import logging
+import numpy
+from .model import TapeArrays
+from .matrix import build_matrix, update_matrix, updatable
+from .solve import pass_highs_model, run_passed_highs, highs_solution
+from .trace import traced
+
+class ParametricModel:
+    '''The boxed matrix model of a pruned tape, kept in HiGHS between solves of scenarios that differ in their thresholds
+
+    update only changes the coefficients and row bounds that the new thresholds or c13 to c18 centers touch, in
+    the model here and in HiGHS, and every solve starts from the solution of the previous one. The thresholds
+    must keep naming the same constraints, and c2 and the thresholds of a presolved tape must stay the ones the
+    tape was reduced with; other changes build the model again, see updatable. The tape is a pruned Tape or its
+    TapeArrays.'''
+
+    def __init__(self, tape, constraints, start, msg=False):
+        self.tape_arrays = tape if isinstance(tape, TapeArrays) else TapeArrays(tape)
+        self.msg = msg
+        self.column_values = None
+        self.updates = 0
+        self.rebuilds = 0
+        self.build(constraints, start)
+
+    def build(self, constraints, start):
+        self.model = build_matrix(self.tape_arrays, constraints, start)
+        self.highs = pass_highs_model(self.model.objective, self.model.matrix, self.model.row_lower, self.model.row_upper,
+            self.model.integrality, self.model.column_lower, self.model.column_upper, msg=self.msg)
+
+    @property
+    def constraints(self):
+        return self.model.constraints
+
+    @property
+    def start(self):
+        return self.model.start
+
+    @traced('update', lambda changes, *arguments, **keywords: {'bounds': changes[0], 'coefficients': changes[1]} if changes else {})
+    def update(self, constraints, start=None):
+        '''Moves the model to the new thresholds and, if given, c13 to c18 centers; returns the number of changed row
+        bounds and coefficients, or None if the model had to be built again'''
+        if constraints.get('c2') != self.constraints.get('c2'):
+            raise ValueError(f'The tape was pruned with c2 {self.constraints.get("c2")}, not {constraints.get("c2")}')
+        for name, value in self.tape_arrays.presolved_with.items():
+            if constraints.get(name) != value:
+                raise ValueError(f'The tape was presolved with {name} {value}, not {constraints.get(name)}')
+        if not updatable(self.model, constraints):
+            logging.info('The constraints changed more than their thresholds, building the model again')
+            self.build(constraints, self.start if start is None else start)
+            self.rebuilds += 1
+            return None
+
+        old, new = self.model, update_matrix(self.model, self.tape_arrays, constraints, start)
+        rows = numpy.flatnonzero((new.row_lower != old.row_lower) | (new.row_upper != old.row_upper))
+        if len(rows) > 0:
+            self.highs.changeRowsBounds(len(rows), rows.astype(numpy.int32), new.row_lower[rows], new.row_upper[rows])
+        difference = (new.matrix - old.matrix).tocsr()
+        difference.eliminate_zeros()
+        difference = difference.tocoo()
+        # indexing with no positions at all returns a sparse matrix instead of the values
+        values = numpy.asarray(new.matrix[difference.row, difference.col]).reshape(-1) if difference.nnz else numpy.zeros(0)
+        for row, column, value in zip(difference.row.tolist(), difference.col.tolist(), values.tolist()):
+            self.highs.changeCoeff(row, column, value)
+        logging.debug(f'Updated {len(rows)} row bounds and {len(values)} coefficients')
+        self.model = new
+        self.updates += 1
+        return len(rows), len(values)
+
+    def solve(self, time_limit=None, relative_gap=None, initial_values=None):
+        '''Solves the current model, starting from the column values by name if given and otherwise from the
+        solution of the previous solve; returns its Solution'''
+        self.highs.setOptionValue('time_limit', float(time_limit) if time_limit is not None else numpy.inf)
+        self.highs.setOptionValue('mip_rel_gap', float(relative_gap) if relative_gap is not None else 1e-4)
+        start_values = self.column_values
+        if initial_values is not None:
+            start_values = [initial_values.get(name, 0) for name in self.model.column_names]
+        run_passed_highs(self.highs, start_values)
+        solution = highs_solution(self.highs, self.model)
+        self.column_values = list(self.highs.getSolution().col_value)
+        return solution
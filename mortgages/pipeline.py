@@ -0,0 +1,45 @@
+from .prune import prune_arrays
+
+def run_scenario(tape_arrays, constraints, start, builder='matrix', backend=None, time_limit=None, presolve=False, warm_start=False,
+        initial_values=None):
+    '''Runs prune, build and solve for one set of constraints on the TapeArrays of the parsed tape, which it leaves as they are
+
+    Returns the Solution. Without a backend, the matrix model is solved with HiGHS and the PuLP program with CBC.
+    With warm_start the solver starts from initial_values, the column values by name, or if they are None from the
+    greedy assignment, whose comparability centers replace start if it is None. Constraints with c13 to c18 raise
+    ValueError if neither gives the centers. Loan, Pool and Deal records are only built for the PuLP program,
+    presolve and the greedy assignment.'''
+    if start is None and (not warm_start or initial_values is not None) and constraints.keys() & {'c13', 'c14', 'c15', 'c16', 'c17', 'c18'}:
+        raise ValueError('The c13 to c18 constraints need start, or warm_start without initial_values')
+    tape_arrays = prune_arrays(tape_arrays, constraints)
+    tape = None
+    if builder == 'pulp' or presolve or (warm_start and initial_values is None):
+        tape = tape_arrays.to_tape()
+    if presolve:
+        from .presolve import presolve as presolve_tape
+
+        presolve_tape(tape, constraints)
+        tape_arrays = None
+    if not warm_start:
+        initial_values = None
+    elif initial_values is None:
+        from .heuristic import greedy_assignment
+        from .extract import column_values, comparability_centers
+
+        taken_deal_ids = greedy_assignment(tape, constraints).taken_deal_ids
+        initial_values = column_values(tape, taken_deal_ids)
+        if start is None:
+            start = comparability_centers(tape, taken_deal_ids, constraints, centered=True)
+    if builder == 'matrix':
+        from .model import TapeArrays
+        from .matrix import build_matrix
+        from .solve import solve_matrix
+
+        model = build_matrix(tape_arrays if tape_arrays is not None else TapeArrays(tape), constraints, start)
+        return solve_matrix(model, backend or 'highs', time_limit, initial_values=initial_values)
+
+    from .build import build_program
+    from .solve import solve_program
+
+    model = build_program(tape, constraints, start)
+    return solve_program(model, backend or 'cbc', time_limit, initial_values=initial_values)
@@ -0,0 +1,174 @@
+import os
+import time
+import logging
+import multiprocessing
+from multiprocessing.connection import wait
+from .shared import SharedTape, attach_tape
+from .prune import prune
+from .pipeline import run_scenario
+
+summary_header = ['Scenario', 'Configuration', 'Status', 'Objective', 'Normalized', 'Violations', 'Seconds', 'Winner']
+
+class Scenario:
+    '''One set of constraints solved with one solver configuration
+
+    Scenarios with the same name are configurations that race on the same constraints; the summary marks
+    one winner per name. The settings are those of run_scenario.'''
+
+    def __init__(self, name, constraints, start=None, builder='matrix', backend=None, time_limit=None, presolve=False,
+            warm_start=True, initial_values=None):
+        self.name = name
+        self.constraints = constraints
+        self.start = start
+        self.builder = builder
+        self.backend = backend
+        self.time_limit = time_limit
+        self.presolve = presolve
+        self.warm_start = warm_start
+        self.initial_values = initial_values
+
+    @property
+    def configuration(self):
+        backend = self.backend or ('highs' if self.builder == 'matrix' else 'cbc')
+        flags = [flag for flag, used in [('presolve', self.presolve), ('warm', self.warm_start)] if used]
+        return '+'.join([f'{self.builder}/{backend}'] + flags)
+
+class Outcome:
+    '''What became of one Scenario: the solution found, or the error or cancellation that stopped it'''
+
+    def __init__(self, scenario, status, objective=None, taken_deal_ids=None, seconds=None, error=None):
+        self.scenario = scenario
+        self.status = status
+        self.objective = objective
+        self.taken_deal_ids = taken_deal_ids
+        self.seconds = seconds
+        self.error = error
+        self.report = None
+        self.winner = False
+
+    @property
+    def solved(self):
+        return self.taken_deal_ids is not None and (self.report is None or self.report.feasible)
+
+    def row(self):
+        normalized = f'{self.report.normalized_score:.3f}' if self.report is not None else ''
+        violations = len(self.report.violations) if self.report is not None else ''
+        seconds = f'{self.seconds:.1f}' if self.seconds is not None else ''
+        return [self.scenario.name, self.scenario.configuration, self.error or self.status,
+            self.objective if self.objective is not None else '', normalized, violations, seconds, '*' if self.winner else '']
+
+def solve_worker(descriptor, scenario, connection):
+    '''Runs one Scenario on the shared tape and sends back (status, objective, taken deal ids, seconds, error)'''
+    started = time.time()
+    try:
+        solution = run_scenario(attach_tape(descriptor), scenario.constraints, scenario.start, scenario.builder,
+            scenario.backend, scenario.time_limit, scenario.presolve, scenario.warm_start, scenario.initial_values)
+        connection.send((solution.status, solution.objective, solution.taken_deal_ids, time.time() - started, None))
+    except Exception as e:
+        connection.send((None, None, None, time.time() - started, f'{type(e).__name__}: {e}'))
+    connection.close()
+
+def greedy_starts(tape, scenarios):
+    '''Gives the warm scenarios without presolve the column values of the greedy assignment of their name, and its
+    centers if they have no start
+
+    The assignment is found once per name on the records of this process, so that the workers of these scenarios
+    need only the arrays of the tape; presolve changes the deals, so its scenarios find their own.'''
+    from .heuristic import greedy_assignment
+    from .extract import column_values, comparability_centers
+
+    assignments = {}
+    for scenario in scenarios:
+        if not scenario.warm_start or scenario.presolve or scenario.initial_values is not None:
+            continue
+        if scenario.name not in assignments:
+            pruned = tape.copy()
+            prune(pruned, scenario.constraints)
+            taken_deal_ids = greedy_assignment(pruned, scenario.constraints).taken_deal_ids
+            assignments[scenario.name] = (column_values(pruned, taken_deal_ids),
+                comparability_centers(pruned, taken_deal_ids, scenario.constraints, centered=True))
+        scenario.initial_values, centers = assignments[scenario.name]
+        if scenario.start is None:
+            scenario.start = centers
+
+def run_portfolio(tape, scenarios, processes=None, race='best', tables=None):
+    '''Solves the scenarios in parallel worker processes, which read the arrays of the tape from shared memory
+    after the greedy warm starts are found here, see greedy_starts
+
+    With race 'first', the first configuration of a name to find a solution wins and the other configurations
+    of that name are stopped; with 'best', all of them finish and the highest objective wins. Given the
+    ScoringTables, every solution is scored and only feasible ones can win. Returns one Outcome per scenario.'''
+    if race not in ['first', 'best']:
+        raise ValueError(f'Unknown race {race}, expected first or best')
+    processes = processes or os.cpu_count()
+    greedy_starts(tape, scenarios)
+    # spawned workers start clean instead of inheriting the solver threads of this process
+    context = multiprocessing.get_context('spawn')
+    outcomes = [None] * len(scenarios)
+    decided = set()
+    with SharedTape(tape) as shared:
+        pending = list(range(len(scenarios)))
+        running = {}
+        while pending or running:
+            while pending and len(running) < processes:
+                number = pending.pop(0)
+                if scenarios[number].name in decided:
+                    outcomes[number] = Outcome(scenarios[number], 'Cancelled')
+                    continue
+                receiver, sender = context.Pipe(duplex=False)
+                process = context.Process(target=solve_worker, args=(shared.descriptor, scenarios[number], sender), daemon=True)
+                process.start()
+                sender.close()
+                running[number] = (process, receiver)
+                logging.info(f'Started {scenarios[number].name} with {scenarios[number].configuration}')
+            if not running:
+                continue
+
+            ready = wait([receiver for _, receiver in running.values()])
+            for number in [number for number, (_, receiver) in running.items() if receiver in ready]:
+                if number not in running:
+                    # stopped because another configuration of its name won the race
+                    continue
+                process, receiver = running.pop(number)
+                try:
+                    outcome = Outcome(scenarios[number], *receiver.recv())
+                except EOFError:
+                    process.join()
+                    outcome = Outcome(scenarios[number], None, error=f'Worker died with exit code {process.exitcode}')
+                receiver.close()
+                process.join()
+                if tables is not None and outcome.taken_deal_ids is not None:
+                    from .extract import solution_rows
+
+                    outcome.report = tables.report(outcome.scenario.constraints, solution_rows(tape, outcome.taken_deal_ids))
+                outcomes[number] = outcome
+                logging.info(f'Finished {outcome.scenario.name} with {outcome.scenario.configuration}: '
+                    f'{outcome.error or outcome.status}')
+
+                if race == 'first' and outcome.solved and outcome.scenario.name not in decided:
+                    decided.add(outcome.scenario.name)
+                    outcome.winner = True
+                    for other in [other for other in running if scenarios[other].name == outcome.scenario.name]:
+                        process, receiver = running.pop(other)
+                        process.terminate()
+                        process.join()
+                        receiver.close()
+                        outcomes[other] = Outcome(scenarios[other], 'Cancelled')
+
+    if race == 'best':
+        best = {}
+        for outcome in outcomes:
+            if outcome.solved and (outcome.scenario.name not in best or outcome.objective > best[outcome.scenario.name].objective):
+                best[outcome.scenario.name] = outcome
+        for outcome in best.values():
+            outcome.winner = True
+    return outcomes
+
+def summary_rows(outcomes):
+    return [summary_header] + [outcome.row() for outcome in outcomes]
+
+def format_summary(outcomes):
+    '''Returns the summary rows as a text table with aligned columns'''
+    rows = [[str(value) for value in row] for row in summary_rows(outcomes)]
+    widths = [max(len(row[column]) for row in rows) for column in range(len(summary_header))]
+    return '\n'.join('  '.join(value.ljust(width) for value, width in zip(row, widths)).rstrip() for row in rows)
@@ -0,0 +1,107 @@
+import logging
+from .prune import remove_short_single_pools, remove_unused
+
+# the thresholds that the rules reduce the deals with
+presolve_thresholds = ['c1', 'c2']
+
+def needs_single_link(amount, constraints):
+    '''Whether selling a loan of this amount to a single issuer pool needs the helper row that switches the
+    pool on; a loan reaching c2 on its own satisfies the single issuer constraint anyway
+
+    The builders only leave out the other helper rows for a presolved tape.'''
+    return amount < constraints['c2']
+
+class PresolveReport:
+    '''How many rows and columns each presolve rule removed from the model'''
+
+    def __init__(self):
+        self.removed = {}
+
+    def add(self, rule, rows=0, columns=0):
+        removed_rows, removed_columns = self.removed.get(rule, (0, 0))
+        self.removed[rule] = (removed_rows + rows, removed_columns + columns)
+
+    def __str__(self):
+        return '\n'.join(f'{rule}: {rows} rows, {columns} columns removed' for rule, (rows, columns) in self.removed.items())
+
+def has_balance_row(tape, pool):
+    '''Whether the pool gets a standard balance constraint (c1)'''
+    return pool.is_standard and any(tape.loans[deal.loan_id].is_expensive for deal in tape.index.pool_deals(pool.id))
+
+def remove_dominated_deals(tape, report):
+    '''Keeps only the best priced deal of a loan among multi issuer pools without pool constraints that
+    share servicer, agency and balance type; these pools are interchangeable for every other constraint'''
+    free_pool_ids = set(pool_id for pool_id, pool in tape.pools.items()
+        if not pool.is_single and not has_balance_row(tape, pool))
+    removed = 0
+    for loan_id in list(tape.index.by_loan):
+        best_deals = {}
+        for deal in tape.index.loan_deals(loan_id):
+            if deal.pool_id not in free_pool_ids:
+                continue
+            pool = tape.pools[deal.pool_id]
+            key = (pool.servicer, pool.agency, pool.is_standard)
+            best_deal = best_deals.get(key)
+            if best_deal is None:
+                best_deals[key] = deal
+                continue
+            if deal.price > best_deal.price:
+                best_deals[key] = deal
+                deal = best_deal
+            tape.remove_deal(deal.id)
+            removed += 1
+    report.add('dominated deals', columns=removed)
+    return removed
+
+def remove_unbalanced_deals(tape, constraints, report):
+    '''Removes the high balance deals of standard pools that would break c1 even if all standard balance
+    loans eligible for the pool were sold to it as well'''
+    if 'c1' not in constraints:
+        return 0
+    removed = 0
+    removed_rows = 0
+    for pool_id, pool in tape.pools.items():
+        if not pool.is_standard or pool_id not in tape.index.by_pool:
+            continue
+        pool_deals = tape.index.pool_deals(pool_id)
+        standard_amount = sum(tape.loans[deal.loan_id].amount for deal in pool_deals if not tape.loans[deal.loan_id].is_expensive)
+        expensive_deals = [deal for deal in pool_deals if tape.loans[deal.loan_id].is_expensive]
+        for deal in expensive_deals:
+            if tape.loans[deal.loan_id].amount * (1 - constraints['c1']) > constraints['c1'] * standard_amount:
+                tape.remove_deal(deal.id)
+                removed += 1
+        if expensive_deals and not has_balance_row(tape, pool):
+            removed_rows += 1
+    report.add('forced by c1', rows=removed_rows, columns=removed)
+    return removed
+
+def remove_short_pools(tape, constraints, report):
+    '''Removes the single issuer pools that can no longer reach c2, with their single issuer and helper rows'''
+    removed_deals = len(tape.deals)
+    removed_pools = len(remove_short_single_pools(tape, constraints))
+    removed_deals -= len(tape.deals)
+    report.add('single issuer amount', rows=removed_pools + removed_deals, columns=removed_pools + removed_deals)
+    return removed_deals
+
+def presolve(tape, constraints):
+    '''Reduces the pruned tape with rules specific to this problem until none of them applies anymore
+
+    Returns a PresolveReport. The tape remembers the thresholds it was reduced with, see matrix.updatable.'''
+    report = PresolveReport()
+    while True:
+        removed = remove_dominated_deals(tape, report)
+        removed += remove_unbalanced_deals(tape, constraints, report)
+        removed += remove_short_pools(tape, constraints, report)
+        if removed == 0:
+            break
+    remove_unused(tape)
+    tape.presolved_with = {name: constraints[name] for name in presolve_thresholds if name in constraints}
+
+    # the builders leave out the helper rows of a presolved tape that are not needed, see needs_single_link
+    loose_links = sum(1 for pool_id, pool in tape.pools.items() if pool.is_single
+        for deal in tape.index.pool_deals(pool_id) if not needs_single_link(tape.loans[deal.loan_id].amount, constraints))
+    report.add('single issuer links', rows=loose_links)
+
+    assert len(tape.deals) > 0
+    logging.info(f'Presolve left {len(tape.deals)} deals, {len(tape.loans)} loans and {len(tape.pools)} pools')
+    return report
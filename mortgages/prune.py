@@ -0,0 +1,59 @@
+import logging
+import numpy
+from .trace import traced
+
+def remove_short_single_pools(tape, constraints):
+    '''Removes the deals of single issuer pools whose eligible loans cannot reach the c2 amount together
+
+    Returns the removed pool ids.'''
+    removed_pool_ids = []
+    for pool_id, pool in tape.pools.items():
+        if pool.is_single and pool_id in tape.index.by_pool:
+            pool_deals = tape.index.pool_deals(pool_id)
+            loans_sum = sum(tape.loans[deal.loan_id].amount for deal in pool_deals)
+            if loans_sum < constraints['c2']:
+                logging.debug(f'Single issuer pool {pool_id} cannot possibly satisfy its constraint; removing all deals involving this pool..')
+                for pool_deal in pool_deals:
+                    tape.remove_deal(pool_deal.id)
+                removed_pool_ids.append(pool_id)
+    return removed_pool_ids
+
+def remove_unused(tape):
+    '''Removes the loans and pools that are left without deals'''
+    # remove unnecessary loans (may be needed if this is a reduced input)
+    for loan_id in list(tape.loans):
+        if loan_id not in tape.index.by_loan:
+            del tape.loans[loan_id]
+
+    # remove unnecessary pools (may be needed if this is a reduced input or some single issuer pools have been removed)
+    for pool_id in list(tape.pools):
+        if pool_id not in tape.index.by_pool:
+            del tape.pools[pool_id]
+
+@traced('prune', lambda _, tape, *arguments, **keywords: {'loans': len(tape.loans), 'pools': len(tape.pools), 'deals': len(tape.deals)})
+def prune(tape, constraints, take_every_deal=1):
+    '''Removes the deals that cannot be part of any solution and then the loans and pools left without deals
+
+    With take_every_deal > 1 only every so many deals are kept to make the problem easier.'''
+    for deal_id in list(tape.deals):
+        if deal_id % take_every_deal > 0:
+            tape.remove_deal(deal_id)
+
+    # remove infeasible deals, because the corresponding pool is a single issuer pool that cannot possibly reach its lower bound on the amount
+    remove_short_single_pools(tape, constraints)
+    remove_unused(tape)
+
+    assert len(tape.deals) > 0
+
+@traced('prune', lambda pruned, *arguments, **keywords: {'loans': pruned.num_loans, 'pools': pruned.num_pools, 'deals': pruned.num_deals})
+def prune_arrays(tape, constraints, take_every_deal=1):
+    '''Like prune, but on TapeArrays, which it leaves as they are; returns the TapeArrays of the pruned tape'''
+    kept = tape.deal_ids % take_every_deal == 0
+    pool_amount = numpy.bincount(tape.deal_pool[kept], weights=tape.amount[tape.deal_loan[kept]], minlength=tape.num_pools)
+    pool_deals = numpy.bincount(tape.deal_pool[kept], minlength=tape.num_pools)
+    short_pools = tape.is_single & (pool_deals > 0) & (pool_amount < constraints['c2'])
+    logging.debug(f'{numpy.count_nonzero(short_pools)} single issuer pools cannot possibly satisfy their constraint; removing all deals involving them..')
+    kept &= ~short_pools[tape.deal_pool]
+
+    assert kept.any()
+    return tape.select(numpy.flatnonzero(kept))
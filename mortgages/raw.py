@@ -1,4 +1,8 @@
+import sys
+from .trace import traced
+
 class Loan:
+    __slots__ = ['i', 'Li', 'HighBalFlag', 'FICO', 'DTI', 'state', 'purpose', 'occupancy', 'property_type']
 
     def __init__(self, row):
         self.i = row['LoanID']
@@ -7,24 +11,26 @@ class Loan:
         self.HighBalFlag = int(row['HighBalFlag'] == 'Y')
         self.FICO = float(row['FICO'])
         self.DTI = float(row['DTI'])
-        self.state = row['PropState']
-        self.purpose = row['Purpose']
-        self.occupancy = row['PropOcc']
-        self.property_type = row['PropType']
+        self.state = sys.intern(row['PropState'])
+        self.purpose = sys.intern(row['Purpose'])
+        self.occupancy = sys.intern(row['PropOcc'])
+        self.property_type = sys.intern(row['PropType'])
 
 
 class Pool:
+    __slots__ = ['j', 'pool_type', 'balance_type', 'agency']
 
     def __init__(self, row):
         self.j = row['Pool Option, j']
         self.pool_type = row['Pool Type']
         assert self.pool_type in ['Multi-Issuer', 'Single-Issuer']
         self.balance_type = row['Pool Balance Type']
-        self.agency = row['Agency']
+        self.agency = sys.intern(row['Agency'])
 
 
 import csv
 
+@traced('parse loans', lambda loans, *arguments, **keywords: {'loans': len(loans)})
 def load_loans(filename):
     loans = {}
     try:
@@ -41,6 +47,7 @@ def load_loans(filename):
     return loans
 
 
+@traced('parse pools', lambda pools, *arguments, **keywords: {'pools': len(pools)})
 def load_pools(filename):
     pools = {}
     try:
@@ -57,6 +64,7 @@ def load_pools(filename):
     return pools
 
 
+@traced('parse combinations', lambda combs, *arguments, **keywords: {'combinations': len(combs)})
 def load_combs(filename):
     combs = {}
     try:
@@ -0,0 +1,60 @@
+import time
+import logging
+from .extract import column_values, comparability_centers
+from .parametric import ParametricModel
+
+class Iteration:
+    '''The timings and the objective of one solve of the comparability window search'''
+
+    def __init__(self, number, build_seconds, solve_seconds, objective, status):
+        self.number = number
+        self.build_seconds = build_seconds
+        self.solve_seconds = solve_seconds
+        self.objective = objective
+        self.status = status
+
+    def row(self):
+        return [self.number, f'{self.build_seconds:.3f}', f'{self.solve_seconds:.3f}', self.objective, self.status]
+
+def search_windows(tape, constraints, start=None, initial_values=None, time_limit=None, max_iterations=10, min_improvement=1.0,
+        msg=False):
+    '''Solves the matrix model of the (pruned) tape again and again, each time with the c13 to c18 windows
+    centered on the previous solution and that solution as the MIP start, until the objective improves by
+    less than min_improvement; the model stays in HiGHS and only its c13 to c18 rows are updated
+
+    Without start, the first windows are centered on the greedy assignment, which is also the first MIP start.
+    Returns the best Solution, the centers it was solved with and the list of Iterations.'''
+    if start is None:
+        from .heuristic import greedy_assignment
+
+        taken_deal_ids = greedy_assignment(tape, constraints).taken_deal_ids
+        start = comparability_centers(tape, taken_deal_ids, constraints, centered=True)
+        initial_values = column_values(tape, taken_deal_ids)
+
+    model = None
+    best, best_start = None, start
+    iterations = []
+    for number in range(1, max_iterations + 1):
+        build_time = time.time()
+        if model is None:
+            model = ParametricModel(tape, constraints, start, msg)
+        else:
+            model.update(constraints, start)
+        build_time = time.time() - build_time
+
+        solve_time = time.time()
+        solution = model.solve(time_limit, initial_values=initial_values)
+        solve_time = time.time() - solve_time
+        iterations.append(Iteration(number, build_time, solve_time, solution.objective, solution.status))
+        logging.info(f'Iteration {number}: objective {solution.objective}, built in {build_time:.1f}s, solved in {solve_time:.1f}s')
+
+        improved = best is None or solution.objective >= best.objective + min_improvement
+        if best is None or solution.objective > best.objective:
+            best, best_start = solution, start
+        if not improved:
+            break
+
+        # the solution lies strictly inside the new windows, so it stays a feasible MIP start
+        start = comparability_centers(tape, solution.taken_deal_ids, constraints, centered=True)
+        initial_values = None
+    return best, best_start, iterations
@@ -0,0 +1,259 @@
+import numpy
+from .model import intern_codes
+from .trace import traced
+
+# the agencies in the order of agentA and agentB in score_solution
+report_agencies = ['Freddie Mac', 'Fannie Mae']
+servicers = ['Pingora', 'Retained', 'Two Harbors']
+category_fields = [('c15', 'state'), ('c16', 'occupancy'), ('c17', 'purpose'), ('c18', 'property_type')]
+
+class Check:
+    '''One evaluated constraint: the measured value against its limit; a negative slack is a violation'''
+
+    def __init__(self, name, subject, value, limit, slack):
+        self.name = name
+        self.subject = subject
+        self.value = value
+        self.limit = limit
+        self.slack = slack
+
+    def __str__(self):
+        return f'{self.name} on {self.subject}: {self.value} against {self.limit} (slack {self.slack})'
+
+class ScoreReport:
+    '''The score of a solution together with every constraint check that was made on it'''
+
+    def __init__(self, score, normalized_score, checks):
+        self.score = score
+        self.normalized_score = normalized_score
+        self.checks = checks
+
+    @property
+    def violations(self):
+        return [check for check in self.checks if check.slack < 0]
+
+    @property
+    def feasible(self):
+        return not self.violations
+
+    def __str__(self):
+        lines = [f'Score = {self.score}', f'Normalized Score = {self.normalized_score}']
+        lines.extend(str(violation) for violation in self.violations)
+        return '\n'.join(lines)
+
+def scoring_arrays(loans, pools, combs):
+    '''Turns the string keyed dictionaries of mortgages.raw into the arrays and labels of ScoringTables'''
+    loan_ids = list(loans)
+    loan_index = {loan_id: position for position, loan_id in enumerate(loan_ids)}
+    loan_list = list(loans.values())
+    arrays = {
+        'amount': numpy.array([loan.Li for loan in loan_list], dtype=numpy.float64),
+        'high_balance': numpy.array([loan.HighBalFlag for loan in loan_list], dtype=numpy.float64),
+        'fico': numpy.array([loan.FICO for loan in loan_list], dtype=numpy.float64),
+        'dti': numpy.array([loan.DTI for loan in loan_list], dtype=numpy.float64),
+        'is_california': numpy.array([loan.state == 'CA' for loan in loan_list], dtype=numpy.float64),
+        'is_cashout': numpy.array([loan.purpose == 'Cashout' for loan in loan_list], dtype=numpy.float64),
+        'is_primary': numpy.array([loan.occupancy == 'Primary' for loan in loan_list], dtype=numpy.float64),
+    }
+    categories = {}
+    for _, field in category_fields:
+        categories[field], arrays[f'code_{field}'] = intern_codes([getattr(loan, field) for loan in loan_list])
+
+    pool_ids = list(pools)
+    pool_index = {pool_id: position for position, pool_id in enumerate(pool_ids)}
+    pool_list = list(pools.values())
+    arrays['is_standard'] = numpy.array([pool.balance_type.find('Standard') != -1 for pool in pool_list])
+    arrays['is_single'] = numpy.array([pool.pool_type == 'Single-Issuer' for pool in pool_list])
+    arrays['pool_agency'] = numpy.array([report_agencies.index(pool.agency) for pool in pool_list])
+
+    # a combination (loan, pool, servicer) is looked up by its key in the sorted key array
+    keys = numpy.array([(loan_index[i] * len(pool_ids) + pool_index[j]) * len(servicers) + servicers.index(k) for i, j, k in combs],
+        dtype=numpy.int64)
+    prices = numpy.array([float(price) for price in combs.values()])
+    order = numpy.argsort(keys)
+    arrays['comb_keys'] = keys[order]
+    arrays['comb_prices'] = prices[order]
+    return arrays, {'loan_ids': loan_ids, 'pool_ids': pool_ids, 'categories': categories}
+
+def streamed_scoring_arrays(loans, pools, combinations_path, memory_budget=None):
+    '''Like scoring_arrays, but streams the combinations from EligiblePricingCombinations.csv in chunks instead of
+    taking the dictionary of load_combs, which holds every price as a string'''
+    from .chunked import read_combination_chunks, chunk_size, default_memory_budget
+
+    arrays, labels = scoring_arrays(loans, pools, {})
+    loan_index = {loan_id: position for position, loan_id in enumerate(labels['loan_ids'])}
+    pool_index = {pool_id: position for position, pool_id in enumerate(labels['pool_ids'])}
+    keys, prices = [], []
+    for comb_loans, comb_pools, comb_servicers, comb_prices in read_combination_chunks(combinations_path, loan_index, pool_index,
+            chunk_size(memory_budget or default_memory_budget)):
+        keys.append((comb_loans.astype(numpy.int64) * len(pool_index) + comb_pools) * len(servicers) + comb_servicers)
+        prices.append(comb_prices)
+    keys = numpy.concatenate(keys) if keys else numpy.zeros(0, dtype=numpy.int64)
+    prices = numpy.concatenate(prices) if prices else numpy.zeros(0)
+    order = numpy.argsort(keys, kind='stable')
+    arrays['comb_keys'] = keys[order]
+    arrays['comb_prices'] = prices[order]
+    if numpy.any(arrays['comb_keys'][1:] == arrays['comb_keys'][:-1]):
+        raise ValueError(f'{combinations_path} lists a combination of loan, pool and servicer more than once')
+    return arrays, labels
+
+class ScoringTables:
+    '''The loans, pools and pricing combinations of the scorer as arrays, built once and reused for every report
+
+    Takes the string keyed dictionaries of mortgages.raw, or their arrays with from_arrays, see load_scoring_tables
+    for the cached way to get them. Solutions are given as positions into loan_ids, pool_ids and servicers, see encode.'''
+
+    def __init__(self, loans, pools, combs):
+        self.set_arrays(*scoring_arrays(loans, pools, combs))
+
+    @classmethod
+    def from_arrays(cls, arrays, labels):
+        '''Makes the tables from the arrays and labels of scoring_arrays, for example memory-mapped ones'''
+        tables = cls.__new__(cls)
+        tables.set_arrays(arrays, labels)
+        return tables
+
+    def set_arrays(self, arrays, labels):
+        # every attribute is set here, so that the tables of __init__ and of from_arrays are the same
+        self.loan_ids = labels['loan_ids']
+        self.loan_index = {loan_id: position for position, loan_id in enumerate(self.loan_ids)}
+        self.amount = arrays['amount']
+        self.high_balance = arrays['high_balance']
+        self.fico = arrays['fico']
+        self.dti = arrays['dti']
+        self.is_california = arrays['is_california']
+        self.is_cashout = arrays['is_cashout']
+        self.is_primary = arrays['is_primary']
+        self.categories = labels['categories']
+        self.category_codes = {field: arrays[f'code_{field}'] for _, field in category_fields}
+
+        self.pool_ids = labels['pool_ids']
+        self.pool_index = {pool_id: position for position, pool_id in enumerate(self.pool_ids)}
+        self.is_standard = arrays['is_standard']
+        self.is_single = arrays['is_single']
+        self.pool_agency = arrays['pool_agency']
+        self.comb_keys = arrays['comb_keys']
+        self.comb_prices = arrays['comb_prices']
+
+        comb_loans = self.comb_keys // (len(self.pool_ids) * len(servicers))
+        min_price = numpy.full(len(self.loan_ids), numpy.inf)
+        max_price = numpy.full(len(self.loan_ids), -numpy.inf)
+        numpy.minimum.at(min_price, comb_loans, self.comb_prices)
+        numpy.maximum.at(max_price, comb_loans, self.comb_prices)
+        has_combs = numpy.isfinite(min_price)
+        self.norm_min = float(numpy.dot(min_price[has_combs] / 100, self.amount[has_combs]))
+        self.norm_max = float(numpy.dot(max_price[has_combs] / 100, self.amount[has_combs]))
+
+    def key(self, loan, pool, servicer):
+        return (loan * len(self.pool_ids) + pool) * len(servicers) + servicer
+
+    def encode(self, rows):
+        '''Turns (loan, pool, servicer) rows into position arrays; unknown ids get position -1'''
+        loans = numpy.array([self.loan_index.get(i, -1) for i, _, _ in rows], dtype=numpy.int64)
+        pools = numpy.array([self.pool_index.get(j, -1) for _, j, _ in rows], dtype=numpy.int64)
+        servicer_codes = numpy.array([servicers.index(k) if k in servicers else -1 for _, _, k in rows], dtype=numpy.int64)
+        return loans, pools, servicer_codes
+
+    @traced('score', lambda report, *arguments, **keywords: {'checks': len(report.checks), 'violations': len(report.violations)})
+    def report(self, constraints, rows):
+        return self.report_arrays(constraints, *self.encode(rows))
+
+    def report_arrays(self, constraints, loans, pools, servicer_codes):
+        '''Computes every c1 to c18 measure of the solution with grouped sums and checks it
+
+        Rows that are no pricing combination and repeated loans are reported and left out of the measures.'''
+        checks = []
+        def check(name, subject, value, limit, upper):
+            checks.append(Check(name, subject, float(value), limit, float(limit - value if upper else value - limit)))
+
+        known = (loans >= 0) & (pools >= 0) & (servicer_codes >= 0)
+        keys = self.key(loans, pools, servicer_codes)
+        found = numpy.minimum(numpy.searchsorted(self.comb_keys, keys), len(self.comb_keys) - 1)
+        valid = known & (self.comb_keys[found] == keys)
+        for row in numpy.flatnonzero(~valid).tolist():
+            checks.append(Check('combination', f'row {row}', 0, 1, -1))
+        loans, pools, servicer_codes, found = loans[valid], pools[valid], servicer_codes[valid], found[valid]
+        _, first = numpy.unique(loans, return_index=True)
+        if len(first) < len(loans):
+            repeated = numpy.setdiff1d(numpy.arange(len(loans)), first)
+            for loan in loans[repeated].tolist():
+                checks.append(Check('duplicate', f'loan {self.loan_ids[loan]}', 0, 1, -1))
+            first.sort()
+            loans, pools, servicer_codes, found = loans[first], pools[first], servicer_codes[first], found[first]
+
+        amount = self.amount[loans]
+        score = float(numpy.dot(self.comb_prices[found] / 100, amount))
+
+        # c1 and c2 per used pool
+        num_pools = len(self.pool_ids)
+        pool_amount = numpy.bincount(pools, weights=amount, minlength=num_pools)
+        pool_high = numpy.bincount(pools, weights=amount * self.high_balance[loans], minlength=num_pools)
+        used = pool_amount > 0
+        if 'c1' in constraints:
+            for pool in numpy.flatnonzero(used & self.is_standard).tolist():
+                check('c1', self.pool_ids[pool], pool_high[pool] / pool_amount[pool], constraints['c1'], True)
+        if 'c2' in constraints:
+            for pool in numpy.flatnonzero(used & self.is_single).tolist():
+                check('c2', self.pool_ids[pool], pool_amount[pool], constraints['c2'], False)
+
+        # c3 to c12 per servicer
+        def servicer_measures(servicer):
+            selected = loans[servicer_codes == servicers.index(servicer)]
+            total = self.amount[selected].sum()
+            count = len(selected)
+            weighted = lambda values: numpy.dot(values[selected], self.amount[selected]) / total if total > 0 else 0
+            counted = lambda values: values[selected].sum() / count if count > 0 else 0
+            return total, weighted, counted
+
+        total, weighted, counted = servicer_measures('Pingora')
+        for name, value, upper in [('c3', lambda: total, True), ('c4', lambda: weighted(self.high_balance), True),
+                ('c5', lambda: weighted(self.fico), False), ('c6', lambda: weighted(self.dti), True),
+                ('c7', lambda: counted(self.is_california), True)]:
+            if name in constraints:
+                check(name, 'Pingora', value(), constraints[name], upper)
+        total, weighted, counted = servicer_measures('Two Harbors')
+        for name, value, upper in [('c8', lambda: total, False), ('c9', lambda: weighted(self.fico), False),
+                ('c10', lambda: weighted(self.dti), True), ('c11', lambda: counted(self.is_cashout), True),
+                ('c12', lambda: counted(self.is_primary), False)]:
+            if name in constraints:
+                check(name, 'Two Harbors', value(), constraints[name], upper)
+
+        # c13 to c18 between the agencies
+        agency = self.pool_agency[pools]
+        agency_amount = numpy.bincount(agency, weights=amount, minlength=2)
+        agency_count = numpy.bincount(agency, minlength=2)
+        for name, values, field in [('c13', self.fico, 'FICO'), ('c14', self.dti, 'DTI')]:
+            if name in constraints:
+                sums = numpy.bincount(agency, weights=amount * values[loans], minlength=2)
+                averages = numpy.divide(sums, agency_amount, out=numpy.zeros(2), where=agency_amount > 0)
+                check(name, field, abs(averages[0] - averages[1]), constraints[name], True)
+        for name, field in category_fields:
+            if name not in constraints:
+                continue
+            num_values = len(self.categories[field])
+            counts = numpy.bincount(agency * num_values + self.category_codes[field][loans], minlength=2 * num_values)
+            ratios = counts.reshape(2, num_values) / numpy.maximum(agency_count, 1)[:, None]
+            distances = numpy.abs(ratios[0] - ratios[1])
+            for code, value in enumerate(self.categories[field]):
+                check(name, f'{field} {value}', distances[code], constraints[name], True)
+
+        normalized_score = (score - self.norm_min) / (self.norm_max - self.norm_min) * 100
+        return ScoreReport(score, normalized_score, checks)
+
+@traced('parse scoring tables', lambda tables, *arguments, **keywords: {'loans': len(tables.loan_ids), 'pools': len(tables.pool_ids), 'combinations': len(tables.comb_keys)})
+def load_scoring_tables(directory='data', cache_directory=None):
+    '''Reads LoanData.csv, PoolOptionData.csv and EligiblePricingCombinations.csv from the given directory
+
+    With a cache_directory, the arrays are memory-mapped from the cache entry of the file contents and the
+    files are only parsed when there is no such entry yet. The combinations are streamed, see streamed_scoring_arrays.'''
+    from .raw import load_loans, load_pools
+
+    paths = [f'{directory}/LoanData.csv', f'{directory}/PoolOptionData.csv', f'{directory}/EligiblePricingCombinations.csv']
+    build = lambda: streamed_scoring_arrays(load_loans(paths[0]), load_pools(paths[1]), paths[2])
+    if cache_directory is None:
+        arrays, labels = build()
+    else:
+        from .cache import cached_arrays
+
+        arrays, labels = cached_arrays('scoring', paths, build, cache_directory)
+    return ScoringTables.from_arrays(arrays, labels)
@@ -0,0 +1,52 @@
+import numpy
+from multiprocessing import shared_memory
+from .model import TapeArrays
+
+def tape_to_arrays(tape):
+    '''Returns the arrays and category labels of the TapeArrays of the tape'''
+    return TapeArrays(tape).to_arrays()
+
+class SharedTape:
+    '''The arrays of a tape in one block of shared memory, so that worker processes read the parsed tape
+    instead of parsing the CSV files again or receiving a pickled copy
+
+    The descriptor is small and picklable; attach_tape turns it back into TapeArrays in the worker. The block
+    is freed by close, or on leaving the with statement.'''
+
+    def __init__(self, tape):
+        arrays, labels = tape_to_arrays(tape)
+        layout = []
+        size = 0
+        for name, array in arrays.items():
+            # every array starts at a multiple of 8 bytes
+            size = (size + 7) // 8 * 8
+            layout.append((name, array.dtype.str, array.shape, size))
+            size += array.nbytes
+        self.memory = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        for name, dtype, shape, offset in layout:
+            numpy.ndarray(shape, dtype=dtype, buffer=self.memory.buf, offset=offset)[...] = arrays[name]
+        self.descriptor = (self.memory.name, layout, labels)
+
+    def close(self):
+        self.memory.close()
+        self.memory.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+def attach_tape(descriptor):
+    '''Returns the TapeArrays over the shared memory block of a SharedTape in another process, without copying it
+
+    The worker builds Loan, Pool and Deal records with to_tape only for the stages that need them. The block
+    stays mapped as long as the TapeArrays refer to it.'''
+    name, layout, labels = descriptor
+    memory = shared_memory.SharedMemory(name=name)
+    arrays = {array_name: numpy.ndarray(shape, dtype=dtype, buffer=memory.buf, offset=offset)
+        for array_name, dtype, shape, offset in layout}
+    tape_arrays = TapeArrays.from_arrays(arrays, labels)
+    # the views must be gone before the block can be closed, so the block lives as long as they do
+    tape_arrays.shared_memory = memory
+    return tape_arrays
@@ -0,0 +1,72 @@
+import itertools
+import xml.etree.ElementTree
+
+deal_prefix = 'Deal_'
+
+def taken_deal_id(name, value, tolerance):
+    '''Returns the deal id of a Deal_ variable whose value is within tolerance of one, otherwise None'''
+    if name.startswith(deal_prefix) and abs(float(value) - 1) <= tolerance:
+        return int(name[len(deal_prefix):])
+    return None
+
+def read_cplex_xml(solution_file, tolerance=1e-6):
+    '''Yields the taken deal ids of a CPLEX .sol XML file while walking its <variable> elements'''
+    path = []
+    for event, element in xml.etree.ElementTree.iterparse(solution_file, events=('start', 'end')):
+        if event == 'start':
+            path.append(element)
+            continue
+        path.pop()
+        if element.tag == 'variable':
+            deal_id = taken_deal_id(element.get('name'), element.get('value'), tolerance)
+            if deal_id is not None:
+                yield deal_id
+            # drop the parsed variables from their parent, so that memory stays flat
+            path[-1].clear()
+
+def read_cbc_text(lines, tolerance=1e-6):
+    '''Yields the taken deal ids of a CBC solution file: a status line followed by index, name, value lines'''
+    for line in itertools.islice(lines, 1, None):
+        fields = line.split()
+        # infeasible rows and columns are marked with ** in front of the index
+        if fields and fields[0] == '**':
+            fields = fields[1:]
+        if len(fields) >= 3:
+            deal_id = taken_deal_id(fields[1], fields[2], tolerance)
+            if deal_id is not None:
+                yield deal_id
+
+def read_highs_text(lines, tolerance=1e-6):
+    '''Yields the taken deal ids of a HiGHS solution file from the name, value lines below # Columns'''
+    lines = iter(lines)
+    for line in lines:
+        if line.startswith('# Columns'):
+            break
+    for line in lines:
+        if line.startswith('#'):
+            break
+        fields = line.split()
+        if len(fields) >= 2:
+            deal_id = taken_deal_id(fields[0], fields[1], tolerance)
+            if deal_id is not None:
+                yield deal_id
+
+def read_taken_deals(solution_file, solution_format='auto', tolerance=1e-6):
+    '''Yields the taken deal ids of a binary solution file written by CPLEX, CBC or HiGHS
+
+    With solution_format 'auto' the format is recognized from the first line of the file.'''
+    if solution_format == 'auto':
+        first_line = solution_file.peek(64).lstrip()
+        if first_line.startswith(b'<'):
+            solution_format = 'cplex'
+        elif first_line.startswith(b'Model status'):
+            solution_format = 'highs'
+        else:
+            solution_format = 'cbc'
+
+    if solution_format == 'cplex':
+        return read_cplex_xml(solution_file, tolerance)
+    lines = (line.decode() for line in solution_file)
+    if solution_format == 'highs':
+        return read_highs_text(lines, tolerance)
+    return read_cbc_text(lines, tolerance)
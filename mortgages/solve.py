@@ -0,0 +1,150 @@
+import logging
+import numpy
+import pulp
+from .trace import traced
+
+# the PuLP solvers that can serve each backend, in order of preference
+pulp_backends = {
+    'cbc': ['PULP_CBC_CMD', 'COIN_CMD'],
+    'cplex': ['CPLEX_PY', 'CPLEX_CMD'],
+    'highs': ['HiGHS', 'HiGHS_CMD'],
+}
+
+class Solution:
+    '''The values of the deal variables after a solve, in the order of deal_ids'''
+
+    def __init__(self, deal_ids, values, objective, status):
+        self.deal_ids = deal_ids
+        self.values = values
+        self.objective = objective
+        self.status = status
+
+    @property
+    def taken_deal_ids(self):
+        return self.deal_ids[numpy.round(self.values) == 1].tolist()
+
+def pulp_solver(backend, time_limit=None, msg=False, warm_start=False):
+    '''Returns the first PuLP solver of the backend that is installed'''
+    options = {'timeLimit': time_limit, 'msg': msg}
+    # the HiGHS interfaces of PuLP take no MIP start
+    if warm_start and backend != 'highs':
+        options['warmStart'] = True
+    elif warm_start:
+        logging.warning(f'PuLP cannot pass a MIP start to {backend}, solving without it')
+    available = pulp.listSolvers(onlyAvailable=True)
+    for name in pulp_backends[backend]:
+        if name in available:
+            return pulp.getSolver(name, **options)
+    raise RuntimeError(f'No {backend} solver is available to PuLP')
+
+@traced('solve', lambda solution, *arguments, **keywords: {'objective': solution.objective, 'taken': len(solution.taken_deal_ids)})
+def solve_program(model, backend='cbc', time_limit=None, msg=False, initial_values=None):
+    '''Solves the PuLP program in this process and returns the values of its deal variables
+
+    initial_values maps variable names to the values of a MIP start, see extract.column_values.'''
+    if initial_values is not None:
+        for variable in model.program.variables():
+            variable.setInitialValue(initial_values.get(variable.name, 0))
+    status = model.program.solve(pulp_solver(backend, time_limit, msg, warm_start=initial_values is not None))
+    logging.info(f'Solver status: {pulp.LpStatus[status]}, {pulp.LpSolution[model.program.sol_status]}')
+    if model.program.sol_status not in [pulp.LpSolutionOptimal, pulp.LpSolutionIntegerFeasible]:
+        raise RuntimeError(f'{backend} found no solution: {pulp.LpSolution[model.program.sol_status]}')
+    deal_ids = numpy.array(list(model.variables), dtype=numpy.int64)
+    values = numpy.array([variable.varValue or 0 for variable in model.variables.values()], dtype=numpy.float64)
+    return Solution(deal_ids, values, pulp.value(model.program.objective), pulp.LpSolution[model.program.sol_status])
+
+@traced('solve', lambda solution, *arguments, **keywords: {'objective': solution.objective, 'taken': len(solution.taken_deal_ids)})
+def solve_matrix(model, backend='highs', time_limit=None, msg=False, initial_values=None, bounds=None):
+    '''Solves the MatrixModel with HiGHS through scipy and returns the values of its deal columns
+
+    scipy takes no MIP start, so with initial_values the model is passed to highspy instead. bounds are
+    (lower, upper) column bound arrays that replace those of the model, e.g. to fix columns.'''
+    import scipy.optimize
+
+    if backend != 'highs':
+        raise ValueError(f'The matrix model can only be solved with HiGHS, not with {backend}')
+    if initial_values is not None:
+        return solve_matrix_highspy(model, time_limit, msg, initial_values, bounds)
+    column_lower, column_upper = bounds if bounds is not None else (model.column_lower, model.column_upper)
+    options = {'disp': msg}
+    if time_limit is not None:
+        options['time_limit'] = time_limit
+    result = scipy.optimize.milp(-model.objective,
+        integrality=model.integrality,
+        bounds=scipy.optimize.Bounds(column_lower, column_upper),
+        constraints=scipy.optimize.LinearConstraint(model.matrix, model.row_lower, model.row_upper),
+        options=options)
+    logging.info(f'Solver status: {result.message}')
+    if result.x is None:
+        raise RuntimeError(f'HiGHS found no solution: {result.message}')
+    values = result.x[:len(model.deal_ids)]
+    return Solution(model.deal_ids, values, -result.fun, result.message)
+
+def pass_highs_model(objective, matrix, row_lower, row_upper, integrality, column_lower, column_upper, time_limit=None, msg=False,
+        relative_gap=None):
+    '''Returns a Highs object that holds the maximization of the objective, ready to run'''
+    import highspy
+
+    matrix = matrix.tocsc()
+    lp = highspy.HighsLp()
+    lp.num_col_ = matrix.shape[1]
+    lp.num_row_ = matrix.shape[0]
+    lp.col_cost_ = -objective
+    lp.col_lower_ = column_lower
+    lp.col_upper_ = column_upper
+    lp.row_lower_ = row_lower
+    lp.row_upper_ = row_upper
+    lp.a_matrix_.format_ = highspy.MatrixFormat.kColwise
+    lp.a_matrix_.start_ = matrix.indptr
+    lp.a_matrix_.index_ = matrix.indices
+    lp.a_matrix_.value_ = matrix.data
+    lp.integrality_ = [highspy.HighsVarType.kInteger if integral else highspy.HighsVarType.kContinuous
+        for integral in integrality]
+
+    highs = highspy.Highs()
+    highs.setOptionValue('output_flag', msg)
+    if time_limit is not None:
+        highs.setOptionValue('time_limit', float(time_limit))
+    if relative_gap is not None:
+        highs.setOptionValue('mip_rel_gap', float(relative_gap))
+    highs.passModel(lp)
+    return highs
+
+def run_passed_highs(highs, start_values=None):
+    '''Runs the Highs object, starting from the column values start_values if given'''
+    import highspy
+
+    if start_values is not None:
+        start = highspy.HighsSolution()
+        start.col_value = [float(value) for value in start_values]
+        highs.setSolution(start)
+    highs.run()
+    return highs
+
+def run_highs(objective, matrix, row_lower, row_upper, integrality, column_lower, column_upper, time_limit=None, msg=False,
+        start_values=None, relative_gap=None):
+    '''Maximizes the objective with highspy, starting from the column values start_values if given; returns the
+    Highs object after the run'''
+    highs = pass_highs_model(objective, matrix, row_lower, row_upper, integrality, column_lower, column_upper, time_limit, msg,
+        relative_gap)
+    return run_passed_highs(highs, start_values)
+
+def solve_matrix_highspy(model, time_limit=None, msg=False, initial_values=None, bounds=None):
+    '''Solves the MatrixModel with highspy, starting from the column values by name if given'''
+    column_lower, column_upper = bounds if bounds is not None else (model.column_lower, model.column_upper)
+    start_values = None
+    if initial_values is not None:
+        start_values = [initial_values.get(name, 0) for name in model.column_names]
+    highs = run_highs(model.objective, model.matrix, model.row_lower, model.row_upper, model.integrality, column_lower, column_upper,
+        time_limit, msg, start_values)
+    return highs_solution(highs, model)
+
+def highs_solution(highs, model):
+    '''Returns the Solution of the MatrixModel after a run of the Highs object'''
+    message = highs.modelStatusToString(highs.getModelStatus())
+    logging.info(f'Solver status: {message}')
+    # a primal solution status of 2 means feasible
+    if highs.getInfo().primal_solution_status != 2:
+        raise RuntimeError(f'HiGHS found no solution: {message}')
+    values = numpy.array(highs.getSolution().col_value[:len(model.deal_ids)])
+    return Solution(model.deal_ids, values, -highs.getInfo().objective_function_value, message)
@@ -0,0 +1,172 @@
+import os
+import time
+import shutil
+import logging
+import sqlite3
+from .tape import Loan, Pool, Deal, Tape
+from .ingest import first_deal_id, sql_real
+
+# the deals with their servicer, agency and price, numbered as in ChooseLoan.csv; built by Store.prepare
+schema = '''
+CREATE INDEX IF NOT EXISTS LoanDataByLoan ON LoanData (LoanID);
+CREATE INDEX IF NOT EXISTS PoolOptionDataByPool ON PoolOptionData (PoolOptionj);
+CREATE INDEX IF NOT EXISTS CombinationsByLoan ON EligiblePricingCombinations (LoanID);
+CREATE INDEX IF NOT EXISTS CombinationsByPool ON EligiblePricingCombinations (PoolOptonj);
+
+DROP TABLE IF EXISTS Deals;
+CREATE TABLE Deals AS SELECT
+    ROW_NUMBER() OVER (ORDER BY EligiblePricingCombinations.PoolOptonj, EligiblePricingCombinations.rowid) + {first_deal_id} - 1 AS DealId,
+    EligiblePricingCombinations.PoolOptonj AS Pool,
+    EligiblePricingCombinations.LoanID AS Loan,
+    PoolOptionData.Servicer AS Servicer,
+    PoolOptionData.Agency AS Agency,
+    EligiblePricingCombinations.PriceP_ijk / 100 * LoanData.Amount AS Price
+    FROM EligiblePricingCombinations
+    INNER JOIN LoanData ON EligiblePricingCombinations.LoanID = LoanData.LoanID
+    INNER JOIN PoolOptionData ON EligiblePricingCombinations.PoolOptonj = PoolOptionData.PoolOptionj;
+CREATE UNIQUE INDEX DealsById ON Deals (DealId);
+CREATE INDEX DealsByLoan ON Deals (Loan);
+CREATE INDEX DealsByPool ON Deals (Pool);
+CREATE INDEX DealsByServicer ON Deals (Servicer, Agency);
+CREATE INDEX DealsByAgency ON Deals (Agency);
+
+CREATE TABLE IF NOT EXISTS Runs (
+    RunId INTEGER PRIMARY KEY,
+    Created TEXT,
+    Constraints TEXT,
+    Description TEXT,
+    Score REAL,
+    NormalizedScore REAL,
+    Violations INTEGER);
+CREATE TABLE IF NOT EXISTS RunSolutions (
+    RunId INTEGER REFERENCES Runs (RunId),
+    Loan TEXT,
+    Pool TEXT,
+    Servicer TEXT);
+CREATE INDEX IF NOT EXISTS RunSolutionsByRun ON RunSolutions (RunId);
+'''.format(first_deal_id=first_deal_id)
+
+# the committed database, and the ignored working copy of it that Store writes to unless given another path
+source_database = 'data/mortgages.db'
+default_database = '.cache/mortgages.db'
+
+# the columns that deals can be selected and grouped by
+deal_groups = ['Loan', 'Pool', 'Servicer', 'Agency']
+
+def working_copy(source=source_database, path=default_database):
+    '''Returns path, copied from source on first use, so that the Deals table and the runs do not change the committed database'''
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        shutil.copyfile(source, path)
+        logging.info(f'Copied {source} to {path}')
+    return path
+
+class Store:
+    '''The loans, pools and pricing combinations of an SQLite database like data/mortgages.db, together with the
+    solutions and scores of earlier runs
+
+    Without a path, the store is the working copy of data/mortgages.db in .cache, see working_copy.
+    prepare must have been called once on the database, and again after its raw tables have changed.'''
+
+    def __init__(self, path=None):
+        self.path = path if path is not None else working_copy()
+        self.connection = sqlite3.connect(self.path)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+    @property
+    def prepared(self):
+        return self.connection.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = 'Deals'").fetchone()[0] > 0
+
+    def prepare(self):
+        '''Creates the indexes, the Deals table and the tables of the runs'''
+        with self.connection:
+            self.connection.executescript(schema)
+
+    def load_tape(self):
+        '''Returns the same Tape as tape.load_tape on the files that ingest derives from the raw tables'''
+        loans = {}
+        for loan_id, amount, fico, dti, is_expensive, is_california, is_cashout, is_primary, occupancy, location, property_type, purpose in\
+                self.connection.execute('''SELECT LoanID, REPLACE(Amount, ',', ''), FICO, DTI, HighBalFlag = 'Y', PropState = 'CA',
+                    Purpose = 'Cashout', PropOcc = 'Primary', PropOcc, PropState, PropType, Purpose FROM LoanData'''):
+            loans[int(loan_id)] = Loan(int(loan_id), float(amount), float(fico), float(dti), is_expensive, is_california, is_cashout,
+                is_primary, occupancy, location, property_type, purpose)
+        pools = {}
+        for pool_id, issuer_type, balance_type, agency, servicer in self.connection.execute(
+                'SELECT PoolOptionj, PoolType, PoolBalanceType, Agency, Servicer FROM PoolOptionData'):
+            pools[int(pool_id[5:])] = Pool(int(pool_id[5:]), balance_type == 'Standard Balance', issuer_type == 'Single-Issuer', servicer, agency)
+        tape = Tape(loans, pools)
+        # the prices go through the text of ChooseLoan.csv, so that both tapes agree to the last digit
+        for deal_id, pool_id, loan_id, price in self.connection.execute('SELECT DealId, Pool, Loan, Price FROM Deals ORDER BY DealId'):
+            tape.add_deal(Deal(deal_id, int(pool_id[5:]), int(loan_id), float(sql_real(price))))
+        assert len(tape.deals) > 0
+        return tape
+
+    def load_constraints(self, table):
+        '''Reads the constraints of a table like ConstraintA, with the types of tape.load_constraints'''
+        constraints = {}
+        for name, value_string in self.connection.execute(f'SELECT field1, field2 FROM {table}'):
+            value = float(value_string)
+            constraints[name] = value if int(value) != value else int(value)
+        return constraints
+
+    def scoring_tables(self):
+        '''Returns the ScoringTables of the raw tables, like report.load_scoring_tables on the raw files'''
+        from . import raw
+        from .report import ScoringTables
+
+        def rows(query):
+            cursor = self.connection.execute(query)
+            names = [column[0] for column in cursor.description]
+            return (dict(zip(names, row)) for row in cursor)
+
+        loans = {}
+        for row in rows('SELECT LoanID, Amount, HighBalFlag, FICO, DTI, PropState, Purpose, PropOcc, PropType FROM LoanData'):
+            loans[row['LoanID']] = raw.Loan(row)
+        pools = {}
+        for row in rows('''SELECT PoolOptionj AS "Pool Option, j", PoolType AS "Pool Type", PoolBalanceType AS "Pool Balance Type",
+                Agency FROM PoolOptionData'''):
+            pools[row['Pool Option, j']] = raw.Pool(row)
+        combs = {(loan_id, pool_id, servicer): price for loan_id, pool_id, servicer, price in
+            self.connection.execute('SELECT LoanID, PoolOptonj, Servicerk, PriceP_ijk FROM EligiblePricingCombinations')}
+        return ScoringTables(loans, pools, combs)
+
+    def deals(self, by=None, key=None):
+        '''Returns the (deal id, pool, loan, price) rows of all deals, or of those whose column by equals key'''
+        if by is None:
+            return self.connection.execute('SELECT DealId, Pool, Loan, Price FROM Deals ORDER BY DealId').fetchall()
+        if by not in deal_groups:
+            raise ValueError(f'Deals cannot be selected by {by}, only by one of {deal_groups}')
+        return self.connection.execute(f'SELECT DealId, Pool, Loan, Price FROM Deals WHERE {by} = ? ORDER BY DealId', (key,)).fetchall()
+
+    def group_totals(self, by):
+        '''Returns for every value of the column by the number of deals and the sum and maximum of their prices'''
+        if by not in deal_groups:
+            raise ValueError(f'Deals cannot be grouped by {by}, only by one of {deal_groups}')
+        return {key: (count, total, highest) for key, count, total, highest in
+            self.connection.execute(f'SELECT {by}, COUNT(*), SUM(Price), MAX(Price) FROM Deals GROUP BY {by}')}
+
+    def save_run(self, constraints, rows, report, description=''):
+        '''Stores the (loan, pool, servicer) rows of a solution with its ScoreReport; returns the new run id'''
+        with self.connection:
+            cursor = self.connection.execute('''INSERT INTO Runs (Created, Constraints, Description, Score, NormalizedScore, Violations)
+                VALUES (?, ?, ?, ?, ?, ?)''', (time.strftime('%Y-%m-%d %H:%M:%S'), constraints, description, report.score,
+                report.normalized_score, len(report.violations)))
+            run_id = cursor.lastrowid
+            self.connection.executemany('INSERT INTO RunSolutions (RunId, Loan, Pool, Servicer) VALUES (?, ?, ?, ?)',
+                [(run_id, loan_id, pool_id, servicer) for loan_id, pool_id, servicer in rows])
+        return run_id
+
+    def runs(self):
+        '''Returns the (run id, created, constraints, description, score, normalized score, violations) rows'''
+        return self.connection.execute('SELECT RunId, Created, Constraints, Description, Score, NormalizedScore, Violations FROM Runs ORDER BY RunId').fetchall()
+
+    def run_solution(self, run_id):
+        return self.connection.execute('SELECT Loan, Pool, Servicer FROM RunSolutions WHERE RunId = ?', (run_id,)).fetchall()
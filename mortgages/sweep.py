@@ -0,0 +1,132 @@
+import os
+import time
+import logging
+import multiprocessing
+import numpy
+from .shared import SharedTape, attach_tape
+from .prune import prune, prune_arrays
+from .parametric import ParametricModel
+
+# the thresholds of Constraints.pdf that a sweep can move
+parameter_names = [f'c{number}' for number in range(1, 19)]
+
+class SweepPoint:
+    '''One point of the grid of a sweep: the values of the swept thresholds, the constraints they make and
+    what became of their solve'''
+
+    def __init__(self, values, constraints):
+        self.values = values
+        self.constraints = constraints
+        self.status = None
+        self.objective = None
+        self.taken_deal_ids = None
+        self.build_seconds = None
+        self.solve_seconds = None
+        self.error = None
+        self.report = None
+
+    def row(self):
+        normalized = f'{self.report.normalized_score:.3f}' if self.report is not None else ''
+        violations = len(self.report.violations) if self.report is not None else ''
+        build_seconds = f'{self.build_seconds:.3f}' if self.build_seconds is not None else ''
+        solve_seconds = f'{self.solve_seconds:.1f}' if self.solve_seconds is not None else ''
+        return [*self.values.values(), self.error or self.status, self.objective if self.objective is not None else '',
+            normalized, violations, build_seconds, solve_seconds]
+
+def grid_points(constraints, axes):
+    '''Returns the SweepPoints of the grid of axes, a list of one or two (name, values)
+
+    The points are in snake order: the values of the second threshold run forward and backward in turn, so
+    that every point is a neighbour of the one before it.'''
+    points = []
+    (first_name, first_values), *rest = axes
+    for position, first_value in enumerate(first_values):
+        combinations = [{first_name: first_value}]
+        if rest:
+            second_name, second_values = rest[0]
+            second_values = second_values if position % 2 == 0 else second_values[::-1]
+            combinations = [{first_name: first_value, second_name: second_value} for second_value in second_values]
+        for values in combinations:
+            points.append(SweepPoint(values, {**constraints, **values}))
+    return points
+
+def sweep_worker(descriptor, constraints_list, start, time_limit=None, relative_gap=None):
+    '''Solves the constraints one after the other on the shared tape, updating one ParametricModel and starting
+    every solve from the solution of the one before; returns (status, objective, taken deal ids, build seconds,
+    solve seconds, error) per constraints
+
+    The first constraints and every change of c2 prune the tape again and start from the greedy assignment.'''
+    from .heuristic import greedy_assignment
+    from .extract import column_values
+
+    tape_arrays = attach_tape(descriptor)
+    model = None
+    results = []
+    for constraints in constraints_list:
+        build_seconds = solve_seconds = None
+        started = time.time()
+        try:
+            initial_values = None
+            if model is None or constraints['c2'] != model.constraints['c2']:
+                pruned = prune_arrays(tape_arrays, constraints)
+                # the greedy assignment is the only stage here that needs the records
+                records = pruned.to_tape()
+                initial_values = column_values(records, greedy_assignment(records, constraints).taken_deal_ids)
+                del records
+                model = ParametricModel(pruned, constraints, start)
+            else:
+                model.update(constraints)
+            build_seconds = time.time() - started
+            started = time.time()
+            solution = model.solve(time_limit, relative_gap, initial_values)
+            solve_seconds = time.time() - started
+            results.append((solution.status, solution.objective, solution.taken_deal_ids, build_seconds, solve_seconds, None))
+        except Exception as e:
+            if build_seconds is not None:
+                solve_seconds = time.time() - started
+            results.append((None, None, None, build_seconds, solve_seconds, f'{type(e).__name__}: {e}'))
+    return results
+
+def run_sweep(tape, constraints, axes, start=None, processes=None, time_limit=None, relative_gap=None, tables=None):
+    '''Solves the constraints at every point of the grid of axes, see grid_points, in parallel worker processes
+    that read the tape from shared memory
+
+    The points are cut into one run of neighbours per worker, which solves them one after the other on one
+    model. Without start, c13 to c18 of every point are centered on the greedy assignment of the constraints
+    before the sweep. Given the ScoringTables, every solution is scored. Returns the SweepPoints.'''
+    from .extract import solution_rows
+
+    points = grid_points(constraints, axes)
+    if start is None:
+        from .heuristic import greedy_assignment
+        from .extract import comparability_centers
+
+        pruned = tape.copy()
+        prune(pruned, constraints)
+        start = comparability_centers(pruned, greedy_assignment(pruned, constraints).taken_deal_ids, constraints, centered=True)
+    processes = min(processes or os.cpu_count(), len(points))
+    runs = [run.tolist() for run in numpy.array_split(numpy.arange(len(points)), processes)]
+    # spawned workers start clean instead of inheriting the solver threads of this process
+    context = multiprocessing.get_context('spawn')
+    with SharedTape(tape) as shared, context.Pool(processes) as pool:
+        results = pool.starmap(sweep_worker, [(shared.descriptor, [points[number].constraints for number in run], start,
+            time_limit, relative_gap) for run in runs])
+
+    for run, run_results in zip(runs, results):
+        for number, result in zip(run, run_results):
+            point = points[number]
+            point.status, point.objective, point.taken_deal_ids, point.build_seconds, point.solve_seconds, point.error = result
+            if tables is not None and point.taken_deal_ids is not None:
+                point.report = tables.report(point.constraints, solution_rows(tape, point.taken_deal_ids))
+            logging.info(f'{point.values}: {point.error or point.status}, objective {point.objective}')
+    return points
+
+def sweep_rows(points):
+    header = [*points[0].values, 'Status', 'Objective', 'Normalized', 'Violations', 'BuildSeconds', 'SolveSeconds']
+    return [header] + [point.row() for point in points]
+
+def format_sweep(points):
+    '''Returns the sweep rows as a text table with aligned columns'''
+    rows = [[str(value) for value in row] for row in sweep_rows(points)]
+    widths = [max(len(row[column]) for row in rows) for column in range(len(rows[0]))]
+    return '\n'.join('  '.join(value.ljust(width) for value, width in zip(row, widths)).rstrip() for row in rows)
@@ -0,0 +1,87 @@
+import os
+import csv
+import logging
+import numpy
+from .ingest import raw_files
+
+# the real instance that the synthetic tapes are drawn from
+source_directory = 'data'
+# synthetic loan ids start above the ids of the real tape
+first_loan_id = 200000000
+
+def read_source(directory=source_directory):
+    '''Reads the loan rows, pool rows and combinations of the real tape; the combinations are grouped
+    by the position of their loan as (offsets, pool positions, prices)'''
+    with open(os.path.join(directory, raw_files[0]), newline='') as loans_file:
+        loan_rows = list(csv.DictReader(loans_file))
+    with open(os.path.join(directory, raw_files[1]), newline='') as pools_file:
+        pool_rows = list(csv.DictReader(pools_file))
+    loan_positions = {row['LoanID']: position for position, row in enumerate(loan_rows)}
+    pool_positions = {row['Pool Option, j']: position for position, row in enumerate(pool_rows)}
+
+    loan_combs = [[] for _ in loan_rows]
+    with open(os.path.join(directory, raw_files[2]), newline='') as combs_file:
+        for row in csv.DictReader(combs_file):
+            loan_combs[loan_positions[row['LoanID']]].append((pool_positions[row['Pool Opton, j']], float(row['Price, P_ijk'])))
+    offsets = numpy.cumsum([0] + [len(combs) for combs in loan_combs])
+    comb_pools = numpy.array([pool for combs in loan_combs for pool, _ in combs], dtype=numpy.int64)
+    comb_prices = numpy.array([price for combs in loan_combs for _, price in combs], dtype=numpy.float64)
+    return loan_rows, pool_rows, offsets, comb_pools, comb_prices
+
+def generate(directory, num_loans, seed=0, source=source_directory, chunk_size=50000):
+    '''Writes LoanData.csv, PoolOptionData.csv and EligiblePricingCombinations.csv of a synthetic tape with
+    num_loans loans into directory
+
+    Every synthetic loan is drawn from a real loan, whose categorical fields it keeps together, so that the
+    joint distribution of state, occupancy, property type and purpose stays the empirical one. Its FICO score,
+    DTI ratio and amount are jittered within the real ranges. The pools are copied once for every as many
+    loans as the real tape has. Each loan is eligible for the same pools as its real loan, all in one copy
+    of the pools, at jittered prices. The combinations are written in chunks of loans, so that memory stays
+    bounded.'''
+    loan_rows, pool_rows, offsets, comb_pools, comb_prices = read_source(source)
+    random = numpy.random.default_rng(seed)
+    num_copies = max(1, round(num_loans / len(loan_rows)))
+    os.makedirs(directory, exist_ok=True)
+
+    with open(os.path.join(directory, raw_files[1]), 'w', newline='') as pools_file:
+        pools_csv = csv.writer(pools_file, lineterminator='\n')
+        pools_csv.writerow(['Pool Option, j', 'Pool Type', 'Pool Balance Type', 'Agency', 'Servicer'])
+        for copy in range(num_copies):
+            for position, row in enumerate(pool_rows):
+                pools_csv.writerow([f'pool_{copy * len(pool_rows) + position + 1}', row['Pool Type'], row['Pool Balance Type'],
+                    row['Agency'], row['Servicer']])
+
+    fico = numpy.array([float(row['FICO']) for row in loan_rows])
+    dti = numpy.array([float(row['DTI']) for row in loan_rows])
+    amount = numpy.array([float(row['Amount'].replace(',', '')) for row in loan_rows])
+    num_combs = 0
+    with open(os.path.join(directory, raw_files[0]), 'w', newline='') as loans_file, \
+            open(os.path.join(directory, raw_files[2]), 'w', newline='') as combs_file:
+        loans_csv = csv.writer(loans_file, lineterminator='\n')
+        combs_csv = csv.writer(combs_file, lineterminator='\n')
+        loans_csv.writerow(['LoanID', 'Amount', 'FICO', 'DTI', 'HighBalFlag', 'PropOcc', 'PropState', 'PropType', 'Purpose'])
+        combs_csv.writerow(['LoanID', 'Price, P_ijk', 'Pool Opton, j', 'Servicer, k'])
+        for chunk_start in range(0, num_loans, chunk_size):
+            size = min(chunk_size, num_loans - chunk_start)
+            sources = random.integers(len(loan_rows), size=size)
+            loan_ids = numpy.arange(chunk_start, chunk_start + size) + first_loan_id
+            loan_fico = numpy.clip(numpy.rint(fico[sources] + random.normal(0, 5, size)), fico.min(), fico.max())
+            loan_dti = numpy.clip(dti[sources] + random.normal(0, 1, size), dti.min(), dti.max())
+            loan_amount = numpy.rint(amount[sources] * random.lognormal(0, 0.05, size))
+            for loan_id, source_position, loan_amount_value, loan_fico_value, loan_dti_value in zip(loan_ids.tolist(),
+                    sources.tolist(), loan_amount.tolist(), loan_fico.tolist(), loan_dti.tolist()):
+                row = loan_rows[source_position]
+                loans_csv.writerow([loan_id, int(loan_amount_value), int(loan_fico_value), f'{loan_dti_value:.3f}', row['HighBalFlag'],
+                    row['PropOcc'], row['PropState'], row['PropType'], row['Purpose']])
+
+            # the combinations of the chunk: those of the real loans, moved to one copy of the pools per loan
+            counts = offsets[sources + 1] - offsets[sources]
+            combs = numpy.repeat(offsets[sources] - numpy.cumsum(counts) + counts, counts) + numpy.arange(counts.sum())
+            copies = numpy.repeat(random.integers(num_copies, size=size), counts)
+            pools = copies * len(pool_rows) + comb_pools[combs]
+            prices = comb_prices[combs] + random.normal(0, 0.05, len(combs))
+            for loan_id, pool, price in zip(numpy.repeat(loan_ids, counts).tolist(), pools.tolist(), prices.tolist()):
+                combs_csv.writerow([loan_id, f'{price:.13f}', f'pool_{pool + 1}', pool_rows[pool % len(pool_rows)]['Servicer']])
+            num_combs += len(combs)
+    logging.info(f'Generated {num_loans} loans, {num_copies * len(pool_rows)} pools and {num_combs} combinations in {directory}')
+    return num_loans, num_copies * len(pool_rows), num_combs
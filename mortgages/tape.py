@@ -0,0 +1,264 @@
+import sys
+import csv
+from collections import defaultdict
+from .trace import traced
+
+agencies = ['Fannie Mae', 'Freddie Mac']
+
+# the loan categories compared between the agencies by constraints c15 to c18
+comparable_categories = [
+    ('c15', 'location', 'bound to a residence in {}'),
+    ('c16', 'occupancy', 'bound to a {} residence'),
+    ('c17', 'purpose', 'given out as a {}'),
+    ('c18', 'property_type', 'bound to a residence of type {}')]
+
+loan_string = '''Loan {}
+    Amount: {}
+    FICO credit score: {}
+    Debt-To-Income ratio: {}
+    Is expensive: {}
+    Is in California: {}
+    Is paid by cashout: {}
+    Is primary residence: {}'''
+
+pool_string = '''Pool {}
+    Is standard: {}
+    Is single: {}
+    Servicer: {}'''
+
+buyer_string = '''Deal {}
+    Pool: {}
+    Loan: {}
+    Price: {}'''
+
+class Loan:
+    __slots__ = ['id', 'amount', 'fico', 'dti', 'is_expensive', 'is_california', 'is_cashout', 'is_primary',
+        'occupancy', 'location', 'property_type', 'purpose']
+
+    def __init__(self, loan_id, amount, fico, dti, is_expensive, is_california, is_cashout, is_primary,
+        occupancy, location, property_type, purpose):
+        self.id = loan_id
+        if int(amount) == amount:
+            self.amount = int(amount)
+        else:
+            self.amount = amount
+        self.fico = fico
+        self.dti = dti
+        self.is_expensive = is_expensive
+        self.is_california = is_california
+        self.is_cashout = is_cashout
+        self.is_primary = is_primary
+
+        self.occupancy = occupancy
+        self.location = location
+        self.property_type = property_type
+        self.purpose = purpose
+
+    def __str__(self):
+        return loan_string.format(self.id, self.amount, self.fico, self.dti,
+                self.is_expensive, self.is_california, self.is_cashout, self.is_primary)
+
+class Pool:
+    __slots__ = ['id', 'is_standard', 'is_single', 'servicer', 'agency']
+
+    def __init__(self, pool_id, is_standard, is_single, servicer, agency):
+        self.id = pool_id
+        self.is_standard = is_standard
+        self.is_single = is_single
+        self.servicer = servicer
+        self.agency = agency
+
+    def __str__(self):
+        return pool_string.format(self.id,
+            self.is_standard, self.is_single, self.servicer)
+
+class Deal:
+    __slots__ = ['id', 'pool_id', 'loan_id', 'price']
+
+    def __init__(self, buyer_id, pool_id, loan_id, price):
+        self.id = buyer_id
+        self.pool_id = pool_id
+        self.loan_id = loan_id
+        self.price = price
+
+    def __str__(self):
+        return buyer_string.format(self.id, self.pool_id, self.loan_id, self.price)
+
+class DealIndex:
+    '''Groups the deals by loan, by pool, by servicer and by agency, so that every constraint family
+    can look up its deals without scanning all of them'''
+
+    def __init__(self):
+        # every group maps a deal id to its deal, so that deals can be removed in constant time
+        self.by_loan = defaultdict(dict)
+        self.by_pool = defaultdict(dict)
+        self.by_servicer = defaultdict(dict)
+        self.by_agency = defaultdict(dict)
+
+    def add(self, deal, pool):
+        self.by_loan[deal.loan_id][deal.id] = deal
+        self.by_pool[deal.pool_id][deal.id] = deal
+        self.by_servicer[pool.servicer][deal.id] = deal
+        self.by_agency[pool.agency][deal.id] = deal
+
+    def remove(self, deal, pool):
+        for group, key in [(self.by_loan, deal.loan_id), (self.by_pool, deal.pool_id),
+                (self.by_servicer, pool.servicer), (self.by_agency, pool.agency)]:
+            del group[key][deal.id]
+            if not group[key]:
+                del group[key]
+
+    def loan_deals(self, loan_id):
+        return list(self.by_loan.get(loan_id, {}).values())
+
+    def pool_deals(self, pool_id):
+        return list(self.by_pool.get(pool_id, {}).values())
+
+    def servicer_deals(self, servicer):
+        return list(self.by_servicer.get(servicer, {}).values())
+
+    def agency_deals(self, agency):
+        return list(self.by_agency.get(agency, {}).values())
+
+def group_deals(my_deals, key):
+    '''Splits the given deals into lists by the value of key(deal), keeping their order'''
+    groups = defaultdict(list)
+    for deal in my_deals:
+        groups[key(deal)].append(deal)
+    return groups
+
+class Tape:
+    '''The loans, pools and deals of one loan tape together with the index of the deals
+
+    Pruning removes loans, pools and deals in place, so every scenario should work on its own copy.'''
+
+    def __init__(self, loans, pools):
+        self.loans = loans
+        self.pools = pools
+        self.deals = {}
+        self.index = DealIndex()
+        # the thresholds that presolve reduced the deals with, see presolve.presolve
+        self.presolved_with = {}
+
+    def add_deal(self, deal):
+        self.deals[deal.id] = deal
+        self.index.add(deal, self.pools[deal.pool_id])
+
+    def remove_deal(self, deal_id):
+        deal = self.deals.pop(deal_id)
+        self.index.remove(deal, self.pools[deal.pool_id])
+
+    def copy(self):
+        '''Returns a tape that can be pruned without touching this one; the loans, pools and deals are shared'''
+        tape = Tape(dict(self.loans), dict(self.pools))
+        for deal in self.deals.values():
+            tape.add_deal(deal)
+        tape.presolved_with = dict(self.presolved_with)
+        return tape
+
+def load_loans(path):
+    loans = {}
+    with open(path) as loans_file:
+        loans_reader = csv.reader(loans_file)
+        next(loans_reader) # consume the column names
+        for loan_id_string, amount_string, fico_string, dti_string,\
+                is_expensive_string, is_california_string,\
+                is_cashout_string, is_primary_string,\
+                occupancy, location, property_type, purpose in loans_reader:
+
+            # parse the loan row
+            loan_id = int(loan_id_string)
+            amount = float(amount_string)
+            fico = float(fico_string)
+            dti = float(dti_string)
+            is_expensive = int(is_expensive_string == '1')
+            is_california = int(is_california_string == '1')
+            is_cashout = int(is_cashout_string == '1')
+            is_primary = int(is_primary_string == '1')
+
+            # the categorical fields share one string per value
+            loan = Loan(loan_id, amount, fico, dti,
+                is_expensive, is_california, is_cashout, is_primary,
+                sys.intern(occupancy), sys.intern(location), sys.intern(property_type), sys.intern(purpose))
+            loans[loan_id] = loan
+
+            assert type(loan.id) == int
+            assert type(loan.amount) in [float, int]
+            assert type(loan.fico) == float
+            assert type(loan.dti) == float
+            assert type(loan.is_expensive) == int, 'is_expensive should be an integer for easy multiplication and addition'
+            assert type(loan.is_california) == int, 'is_california should be an integer for easy multiplication and addition'
+            assert type(loan.is_cashout) == int, 'is_cashout should be an integer for easy multiplication and addition'
+            assert type(loan.is_primary) == int, 'is_primary should be an integer for easy multiplication and addition'
+            assert type(loan.occupancy) == str
+            assert type(loan.location) == str
+            assert type(loan.property_type) == str
+            assert type(loan.purpose) == str
+    return loans
+
+def load_pools(path):
+    pools = {}
+    with open(path) as pools_file:
+        pools_reader = csv.reader(pools_file)
+        next(pools_reader) # consume the column names
+        for pool_id_string, issuer_type, balance_type, agency, servicer in pools_reader:
+
+            # parse the pool row
+            pool_id = int(pool_id_string[5:])
+            is_standard = (balance_type == 'Standard Balance')
+            is_single = (issuer_type == 'Single-Issuer')
+
+            pool = Pool(pool_id, is_standard, is_single, sys.intern(servicer), sys.intern(agency))
+            pools[pool_id] = pool
+
+            assert type(pool.id) == int
+            assert type(pool.is_standard) == bool
+            assert type(pool.is_single) == bool
+            assert type(pool.servicer) == str
+            assert type(pool.agency) == str
+    return pools
+
+def load_deals(path, tape):
+    '''Reads the deals into the given tape, indexing them in the same pass'''
+    with open(path) as choose_pool_file:
+        pool_loans_reader = csv.reader(choose_pool_file)
+        next(pool_loans_reader) # consume the column names
+        for deal_id_string, pool_id_string, loan_id_string, price_string in pool_loans_reader:
+            pool_id = int(pool_id_string[5:])
+            deal_id = int(deal_id_string)
+            # the types of the fields follow from the parsing, so the deals are not checked one by one
+            tape.add_deal(Deal(deal_id, pool_id, int(loan_id_string), float(price_string)))
+
+def load_constraints(path):
+    constraints = {}
+    with open(path) as constraints_file:
+        constraints_reader = csv.reader(constraints_file)
+        for name, value_string in constraints_reader:
+            value = float(value_string)
+            constraints[name] = value if int(value) != value else int(value)
+    return constraints
+
+@traced('parse', lambda tape, *arguments, **keywords: {'loans': len(tape.loans), 'pools': len(tape.pools), 'deals': len(tape.deals)})
+def load_tape(directory='data_processed', cache_directory=None):
+    '''Parses LoansFull.csv, Pools.csv and ChooseLoan.csv from the given directory
+
+    With a cache_directory, the columns of the tape are memory-mapped from the cache entry of the file contents
+    and the files are only parsed when there is no such entry yet.'''
+    if cache_directory is not None:
+        return load_tape_arrays(directory, cache_directory).to_tape()
+    paths = [f'{directory}/LoansFull.csv', f'{directory}/Pools.csv', f'{directory}/ChooseLoan.csv']
+    tape = Tape(load_loans(paths[0]), load_pools(paths[1]))
+    load_deals(paths[2], tape)
+    assert len(tape.deals) > 0
+    return tape
+
+@traced('load arrays', lambda tape_arrays, *arguments, **keywords: {'loans': tape_arrays.num_loans, 'pools': tape_arrays.num_pools, 'deals': tape_arrays.num_deals})
+def load_tape_arrays(directory='data_processed', cache_directory='.cache'):
+    '''Memory-maps the TapeArrays of the tape in the given directory from their cache entry, parsing the files
+    only when there is no such entry yet; the matrix builder needs no Loan, Pool and Deal records, see prune_arrays'''
+    from .cache import cached_arrays
+    from .model import TapeArrays
+
+    paths = [f'{directory}/LoansFull.csv', f'{directory}/Pools.csv', f'{directory}/ChooseLoan.csv']
+    arrays = cached_arrays('tape', paths, lambda: TapeArrays(load_tape(directory)).to_arrays(), cache_directory)
+    return TapeArrays.from_arrays(*arrays)
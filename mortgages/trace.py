@@ -0,0 +1,132 @@
+import os
+import json
+import time
+import resource
+import functools
+import contextlib
+
+# the Trace that spans are recorded into; None while nothing is traced, which makes spans almost free
+active_trace = None
+
+def reset_peak_memory():
+    '''Resets the peak resident set size of this process, which Linux allows through clear_refs; returns
+    whether it was reset, otherwise the peaks of the stages include those of the stages before'''
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+        return True
+    except OSError:
+        return False
+
+def peak_memory():
+    '''Returns the peak resident set size of this process in bytes, including what the solvers allocate'''
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+class Span:
+    '''One stage or constraint family: its start relative to the trace, wall and CPU seconds, the peak
+    memory at its end and the counts that were recorded for it'''
+
+    def __init__(self, name, category, depth, start):
+        self.name = name
+        self.category = category
+        self.depth = depth
+        self.start = start
+        self.wall_seconds = 0
+        self.cpu_seconds = 0
+        self.peak_bytes = 0
+        self.counts = {}
+
+    def to_dict(self):
+        return {'name': self.name, 'category': self.category, 'depth': self.depth, 'start': round(self.start, 6),
+            'wall_seconds': round(self.wall_seconds, 6), 'cpu_seconds': round(self.cpu_seconds, 6),
+            'peak_megabytes': round(self.peak_bytes / 2**20, 1), 'counts': self.counts}
+
+    def chrome_event(self, process_id):
+        '''Returns the complete event of the Chrome trace event format, with times in microseconds'''
+        return {'name': self.name, 'cat': self.category, 'ph': 'X', 'ts': round(self.start * 1e6), 'dur': round(self.wall_seconds * 1e6),
+            'pid': process_id, 'tid': 0, 'args': {'cpu_seconds': round(self.cpu_seconds, 6),
+            'peak_megabytes': round(self.peak_bytes / 2**20, 1), **self.counts}}
+
+class Trace:
+    '''The spans of one run of a tool
+
+    The peak memory is reset when an outermost span starts, so the peak of a nested span is the peak since
+    its outermost span started.'''
+
+    def __init__(self, tool):
+        self.tool = tool
+        self.started = time.time()
+        self.depth = 0
+        self.spans = []
+
+    @contextlib.contextmanager
+    def span(self, name, category):
+        if self.depth == 0:
+            reset_peak_memory()
+        span = Span(name, category, self.depth, time.time() - self.started)
+        cpu_started = time.process_time()
+        self.depth += 1
+        try:
+            yield span.counts
+        finally:
+            self.depth -= 1
+            span.wall_seconds = time.time() - self.started - span.start
+            span.cpu_seconds = time.process_time() - cpu_started
+            span.peak_bytes = peak_memory()
+            self.spans.append(span)
+
+    def write(self, path, chrome=False):
+        '''Writes the spans in the order they started as JSON, or as a Chrome trace that chrome://tracing
+        and Perfetto open'''
+        spans = sorted(self.spans, key=lambda span: (span.start, span.depth))
+        if chrome:
+            trace = {'traceEvents': [span.chrome_event(os.getpid()) for span in spans], 'displayTimeUnit': 'ms',
+                'otherData': {'tool': self.tool}}
+        else:
+            trace = {'tool': self.tool, 'started': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.started)),
+                'spans': [span.to_dict() for span in spans]}
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w') as trace_file:
+            json.dump(trace, trace_file, indent=4)
+
+def start_trace(tool):
+    '''Starts recording the spans of this process'''
+    global active_trace
+    active_trace = Trace(tool)
+    return active_trace
+
+def tracing():
+    return active_trace is not None
+
+@contextlib.contextmanager
+def span(name, category='stage'):
+    '''Records the enclosed code as a span of the active trace and yields the dict of its counts, which the
+    code may fill in; without an active trace the counts are thrown away'''
+    if active_trace is None:
+        yield {}
+    else:
+        with active_trace.span(name, category) as counts:
+            yield counts
+
+def traced(name, counts=None, category='stage'):
+    '''Decorates a function to record every call as a span; counts(result, *arguments, **keywords) returns the
+    counts of a call'''
+    def decorate(function):
+        @functools.wraps(function)
+        def traced_function(*arguments, **keywords):
+            if active_trace is None:
+                return function(*arguments, **keywords)
+            with active_trace.span(name, category) as span_counts:
+                result = function(*arguments, **keywords)
+                if counts is not None:
+                    span_counts.update(counts(result, *arguments, **keywords))
+            return result
+        return traced_function
+    return decorate
@@ -0,0 +1,71 @@
+import os
+import csv
+import json
+import logging
+import argparse
+from mortgages import load_tape, load_constraints
+from mortgages.cache import default_cache_directory
+from mortgages.portfolio import Scenario, run_portfolio, summary_rows, format_summary
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--verbose', '-v', action='count')
+parser.add_argument('--constraints-paths', '-c', type=str, nargs='+',
+    default=['data/Constraints.csv', 'data/ConstraintsAlt.csv', 'data/ConstraintsComparability.csv'],
+    help='one scenario per constraints file, named after the file')
+parser.add_argument('--configurations', type=str, nargs='+', default=['matrix/highs+warm'],
+    help='solver configurations that race on every scenario, as BUILDER/BACKEND with optional +presolve and +warm')
+parser.add_argument('--race', choices=['first', 'best'], default='best',
+    help='keep the first solution of every scenario and stop the other configurations, or wait for all and keep the best')
+parser.add_argument('--processes', type=int, help='worker processes, one per core by default')
+parser.add_argument('--time-limit', type=float, help='seconds every solve may spend')
+parser.add_argument('--start-path', type=str,
+    help='json file with the c13 to c18 centers for the configurations without +warm, e.g. start.json')
+parser.add_argument('--no-score', action='store_true', help='do not score the solutions against the raw data files')
+parser.add_argument('--summary-path', type=str, help='csv file for the summary table')
+
+log_levels = {
+    None: logging.WARNING,
+    1: logging.INFO,
+    2: logging.DEBUG
+}
+
+def parse_configuration(configuration):
+    solver, *flags = configuration.split('+')
+    builder, _, backend = solver.partition('/')
+    if builder not in ['matrix', 'pulp'] or set(flags) - {'presolve', 'warm'}:
+        parser.error(f'Cannot read the configuration {configuration}')
+    return {'builder': builder, 'backend': backend or None, 'presolve': 'presolve' in flags, 'warm_start': 'warm' in flags}
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    if args.verbose is not None and args.verbose >= len(log_levels):
+        args.verbose = len(log_levels)-1
+    logging.basicConfig(format='%(message)s', level=log_levels[args.verbose])
+    start = None
+    if args.start_path:
+        with open(args.start_path) as start_file:
+            start = json.load(start_file)
+    scenarios = []
+    for constraints_path in args.constraints_paths:
+        name = os.path.splitext(os.path.basename(constraints_path))[0]
+        constraints = load_constraints(constraints_path)
+        for configuration in args.configurations:
+            settings = parse_configuration(configuration)
+            # only the greedy assignment of +warm can stand in for the c13 to c18 centers of start.json
+            if start is None and not settings['warm_start'] and constraints.keys() & {'c13', 'c14', 'c15', 'c16', 'c17', 'c18'}:
+                parser.error(f'{configuration} needs --start-path or +warm for the c13 to c18 constraints of {constraints_path}')
+            scenarios.append(Scenario(name, constraints, start, time_limit=args.time_limit, **settings))
+
+    tables = None
+    if not args.no_score:
+        from mortgages.report import load_scoring_tables
+
+        tables = load_scoring_tables('data', default_cache_directory)
+
+    outcomes = run_portfolio(load_tape(cache_directory=default_cache_directory), scenarios, args.processes, args.race, tables)
+    print(format_summary(outcomes))
+    if args.summary_path:
+        os.makedirs(os.path.dirname(args.summary_path) or '.', exist_ok=True)
+        with open(args.summary_path, 'w') as summary_file:
+            csv.writer(summary_file).writerows(summary_rows(outcomes))
+        logging.info(f'Summary written to {args.summary_path}')
@@ -1,3 +1,3 @@
 #!/bin/bash
 
-python genilp.py -vv && python sol2csv.py < MortgagesProblem.sol > solution/MortgagesSolution.csv && python scorer.py
+python genilp.py -vv && python sol2csv.py < MortgagesProblem.sol > solution/MortgagesSolution.csv && python scorer.py -s solution/MortgagesSolution.csv -c data/ConstraintsComparability.csv
@@ -0,0 +1,79 @@
+import os
+import csv
+import json
+import logging
+import argparse
+import numpy
+from mortgages import load_tape, load_constraints
+from mortgages.cache import default_cache_directory
+from mortgages.sweep import parameter_names, run_sweep, sweep_rows, format_sweep
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--verbose', '-v', action='count')
+parser.add_argument('--constraints-path', '-c', type=str, default='data/ConstraintsComparability.csv',
+    help='the thresholds that are not swept')
+parser.add_argument('--parameter', '-p', type=str, nargs='+', action='append', required=True, metavar=('NAME', 'VALUES'),
+    help='a threshold c1 to c18 and its values, either listed or as a range FIRST:LAST:COUNT; at most twice for a grid')
+parser.add_argument('--processes', type=int, help='worker processes, one per core by default')
+parser.add_argument('--time-limit', type=float, help='seconds every point may spend in the solver')
+parser.add_argument('--relative-gap', type=float, help='relative MIP gap at which the solve of a point stops')
+parser.add_argument('--start-path', type=str,
+    help='json file with the c13 to c18 centers, e.g. start.json; by default the greedy assignment before the sweep')
+parser.add_argument('--no-score', action='store_true', help='do not score the solutions against the raw data files')
+parser.add_argument('--results-path', type=str, help='csv file for the objective, score and seconds of every point')
+
+log_levels = {
+    None: logging.WARNING,
+    1: logging.INFO,
+    2: logging.DEBUG
+}
+
+def parse_values(value_strings):
+    '''Reads listed values or the range FIRST:LAST:COUNT, keeping whole numbers as integers like load_constraints'''
+    if len(value_strings) == 1 and value_strings[0].count(':') == 2:
+        first, last, count = value_strings[0].split(':')
+        values = numpy.linspace(float(first), float(last), int(count)).tolist()
+    else:
+        values = [float(value_string) for value_string in value_strings]
+    return [value if int(value) != value else int(value) for value in values]
+
+def parse_axes(parameters):
+    if len(parameters) > 2:
+        parser.error('At most two parameters can be swept')
+    axes = []
+    for name, *value_strings in parameters:
+        if name not in parameter_names or not value_strings:
+            parser.error(f'Cannot sweep {" ".join([name] + value_strings)}: expected one of c1 to c18 followed by values')
+        try:
+            axes.append((name, parse_values(value_strings)))
+        except ValueError:
+            parser.error(f'Cannot read the values {" ".join(value_strings)} of {name}')
+    if len(axes) == 2 and axes[0][0] == axes[1][0]:
+        parser.error(f'{axes[0][0]} is swept twice')
+    return axes
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    if args.verbose is not None and args.verbose >= len(log_levels):
+        args.verbose = len(log_levels)-1
+    logging.basicConfig(format='%(message)s', level=log_levels[args.verbose])
+    axes = parse_axes(args.parameter)
+    start = None
+    if args.start_path:
+        with open(args.start_path) as start_file:
+            start = json.load(start_file)
+
+    tables = None
+    if not args.no_score:
+        from mortgages.report import load_scoring_tables
+
+        tables = load_scoring_tables('data', default_cache_directory)
+
+    points = run_sweep(load_tape(cache_directory=default_cache_directory), load_constraints(args.constraints_path), axes, start,
+        args.processes, args.time_limit, args.relative_gap, tables)
+    print(format_sweep(points))
+    if args.results_path:
+        os.makedirs(os.path.dirname(args.results_path) or '.', exist_ok=True)
+        with open(args.results_path, 'w') as results_file:
+            csv.writer(results_file).writerows(sweep_rows(points))
+        logging.info(f'Sweep written to {args.results_path}')
@@ -0,0 +1,37 @@
+import os
+import sys
+import pytest
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+
+from mortgages import load_tape, load_constraints, load_scoring_tables, prune
+
+raw_directory = os.path.join(root, 'data')
+processed_directory = os.path.join(root, 'data_processed')
+
+@pytest.fixture(scope='session')
+def constraints():
+    return load_constraints(os.path.join(raw_directory, 'ConstraintsComparability.csv'))
+
+@pytest.fixture(scope='session')
+def parsed_tape():
+    return load_tape(processed_directory)
+
+@pytest.fixture
+def tape(parsed_tape, constraints):
+    '''A pruned copy of the real tape, which the test may change'''
+    tape = parsed_tape.copy()
+    prune(tape, constraints)
+    return tape
+
+@pytest.fixture
+def small_tape(parsed_tape, constraints):
+    '''A pruned copy of every fifth deal of the real tape, which the test may change'''
+    tape = parsed_tape.copy()
+    prune(tape, constraints, take_every_deal=5)
+    return tape
+
+@pytest.fixture(scope='session')
+def tables():
+    return load_scoring_tables(raw_directory)
@@ -0,0 +1,43 @@
+import os
+import numpy
+import pytest
+from mortgages import load_tape_arrays, prune_arrays
+from mortgages.raw import load_loans, load_pools, load_combs
+from mortgages.report import scoring_arrays, streamed_scoring_arrays
+from mortgages.chunked import build_combination_store, store_tape_arrays, load_combination_store
+from conftest import raw_directory, processed_directory
+
+def test_streamed_scoring_arrays_match_load_combs():
+    loans = load_loans(os.path.join(raw_directory, 'LoanData.csv'))
+    pools = load_pools(os.path.join(raw_directory, 'PoolOptionData.csv'))
+    combinations_path = os.path.join(raw_directory, 'EligiblePricingCombinations.csv')
+    arrays, labels = scoring_arrays(loans, pools, load_combs(combinations_path))
+    # a small budget makes many chunks
+    streamed_arrays, streamed_labels = streamed_scoring_arrays(loans, pools, combinations_path, memory_budget=2**20)
+    assert streamed_labels == labels
+    assert arrays.keys() == streamed_arrays.keys()
+    for name, array in arrays.items():
+        assert numpy.array_equal(streamed_arrays[name], array), name
+
+def test_store_matches_the_processed_tape(tmp_path, constraints):
+    build_combination_store(raw_directory, tmp_path / 'store', memory_budget=2**20)
+    stored = prune_arrays(store_tape_arrays(raw_directory, tmp_path / 'store'), constraints)
+    processed = prune_arrays(load_tape_arrays(processed_directory, tmp_path / 'cache'), constraints)
+    for name in ['loan_ids', 'pool_ids', 'deal_ids', 'deal_loan', 'deal_pool']:
+        assert numpy.array_equal(getattr(stored, name), getattr(processed, name)), name
+    # ChooseLoan.csv holds the prices with 15 significant digits
+    assert numpy.allclose(stored.price, processed.price, rtol=1e-14, atol=0)
+
+def test_top_k_keeps_the_best_prices_within_budget(tmp_path):
+    build_combination_store(raw_directory, tmp_path / 'all', memory_budget=2**20)
+    build_combination_store(raw_directory, tmp_path / 'top', memory_budget=2**20, top_k=2)
+    everything, _ = load_combination_store(tmp_path / 'all')
+    top, _ = load_combination_store(tmp_path / 'top')
+    assert numpy.bincount(top['comb_loan']).max() == 2
+    best = numpy.full(everything['comb_loan'].max() + 1, -numpy.inf)
+    numpy.maximum.at(best, everything['comb_loan'], everything['comb_price'])
+    kept_best = numpy.full(len(best), -numpy.inf)
+    numpy.maximum.at(kept_best, top['comb_loan'], top['comb_price'])
+    assert numpy.array_equal(kept_best, best)
+    with pytest.raises(ValueError):
+        build_combination_store(raw_directory, tmp_path / 'small', memory_budget=2**16, top_k=2)
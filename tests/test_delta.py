@@ -0,0 +1,49 @@
+import copy
+import random
+import numpy
+import pytest
+from mortgages import DeltaEvaluator, greedy_assignment
+from mortgages.report import servicers
+
+def positions(tables, tape, deal):
+    return tables.loan_index[str(deal.loan_id)], tables.pool_index[f'pool_{deal.pool_id}'], servicers.index(tape.pools[deal.pool_id].servicer)
+
+@pytest.fixture
+def evaluator(tape, tables, constraints):
+    taken = numpy.array([positions(tables, tape, tape.deals[deal_id]) for deal_id in greedy_assignment(tape, constraints).taken_deal_ids])
+    return DeltaEvaluator(tables, constraints, taken[:, 0], taken[:, 1], taken[:, 2])
+
+def assignment(evaluator):
+    return list(evaluator.pool_of), list(evaluator.servicer_of), evaluator.objective, evaluator.num_violations
+
+def state(evaluator):
+    return copy.deepcopy((evaluator.pool_of, evaluator.servicer_of, evaluator.objective, evaluator.num_violations,
+        evaluator.pool_sums, evaluator.servicer_sums, evaluator.agency_sums, [histogram.tolist() for histogram in evaluator.histograms]))
+
+def test_moves_match_a_full_rescore(tape, tables, constraints, evaluator):
+    options = {}
+    for deal in tape.deals.values():
+        loan, pool, servicer = positions(tables, tape, deal)
+        options.setdefault(loan, []).append((pool, servicer))
+    loans = sorted(options)
+    choices = random.Random(0)
+    for number in range(300):
+        loan = choices.choice(loans)
+        pool, servicer = choices.choice(options[loan]) if choices.random() < 0.8 else (-1, -1)
+        before = assignment(evaluator)
+        delta = evaluator.delta(loan, pool, servicer)
+        assert assignment(evaluator) == before
+        assert evaluator.move(loan, pool, servicer) == pytest.approx(delta)
+
+        if number % 50 == 0:
+            report = tables.report_arrays(constraints, *evaluator.solution())
+            assert evaluator.objective == pytest.approx(report.score, rel=1e-9)
+            assert evaluator.num_violations == len(report.violations)
+
+def test_ineligible_move_changes_nothing(tables, evaluator):
+    loan = next(loan for loan, pool in enumerate(evaluator.pool_of) if pool >= 0)
+    pool = next(pool for pool in range(len(tables.pool_ids)) if tables.key(loan, pool, 0) not in evaluator.prices)
+    before = state(evaluator)
+    with pytest.raises(ValueError):
+        evaluator.move(loan, pool, 0)
+    assert state(evaluator) == before
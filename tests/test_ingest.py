@@ -0,0 +1,15 @@
+import os
+from mortgages.ingest import ingest, up_to_date, processed_files
+from conftest import raw_directory, processed_directory
+
+def test_ingest_reproduces_the_processed_files(tmp_path):
+    '''The committed data_processed files were written by process.sql in SQLite'''
+    assert ingest(raw_directory, tmp_path)
+    for name in processed_files:
+        with open(tmp_path / name, 'rb') as written, open(os.path.join(processed_directory, name), 'rb') as committed:
+            assert written.read() == committed.read(), name
+    assert up_to_date(raw_directory, tmp_path)
+    assert not ingest(raw_directory, tmp_path)
+
+def test_committed_files_are_up_to_date():
+    assert up_to_date(raw_directory, processed_directory)
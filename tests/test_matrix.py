@@ -0,0 +1,122 @@
+import numpy
+import pulp
+import pytest
+import scipy.sparse
+from mortgages import TapeArrays, greedy_assignment, column_values, comparability_centers
+from mortgages.tape import agencies, comparable_categories
+from mortgages.build import build_program
+from mortgages.matrix import build_matrix, exact_column_values
+
+def pulp_rows(program, column_index):
+    '''The constraints of the program as sparse rows over column_index with their lower and upper bounds'''
+    rows, columns, coefficients, lower, upper = [], [], [], [], []
+    for row, constraint in enumerate(program.constraints.values()):
+        for variable, coefficient in constraint.items():
+            rows.append(row)
+            columns.append(column_index[variable.name])
+            coefficients.append(coefficient)
+        bound = -constraint.constant
+        lower.append(bound if constraint.sense != pulp.LpConstraintLE else -numpy.inf)
+        upper.append(bound if constraint.sense != pulp.LpConstraintGE else numpy.inf)
+    matrix = scipy.sparse.csr_matrix((coefficients, (rows, columns)), shape=(len(program.constraints), len(column_index)))
+    return matrix, numpy.array(lower), numpy.array(upper)
+
+def test_matrix_matches_the_pulp_program(small_tape, constraints):
+    start = comparability_centers(small_tape, greedy_assignment(small_tape, constraints).taken_deal_ids, constraints, centered=True)
+    program = build_program(small_tape, constraints, start).program
+    model = build_matrix(TapeArrays(small_tape), constraints, start)
+
+    # the loan count column of each agency stands for the sum of the agency's deals, as the row that defines it says
+    count_rows = [model.row_labels.index(f'Number of loans sold to {agency}') for agency in agencies]
+    num_binaries = model.num_binaries
+    count_definitions = model.matrix[count_rows, :num_binaries]
+    assert numpy.array_equal(model.matrix[count_rows, num_binaries:].toarray(), -numpy.eye(len(agencies)))
+    matrix = model.matrix[:, :num_binaries] + model.matrix[:, num_binaries:] @ count_definitions
+    kept_rows = numpy.setdiff1d(numpy.arange(model.num_rows), count_rows)
+
+    # the named constraints of the program carry the label of their row, the unnamed c13 and c14 rows come in the same order
+    column_names = model.column_names[:num_binaries]
+    pulp_matrix, pulp_lower, pulp_upper = pulp_rows(program, {name: column for column, name in enumerate(column_names)})
+    names = list(program.constraints)
+    pulp_labels = [pulp.LpAffineExpression(name=model.row_labels[row]).name for row in kept_rows.tolist()]
+    unnamed = iter(row for row, name in enumerate(names) if name.startswith('_C'))
+    pulp_row = {name: row for row, name in enumerate(names)}
+    order = [pulp_row[label] if label in pulp_row else next(unnamed) for label in pulp_labels]
+    assert sorted(order) == list(range(len(names)))
+
+    # rows may have been multiplied by -1, which swaps and negates their bounds
+    pulp_matrix, pulp_lower, pulp_upper = pulp_matrix[order], pulp_lower[order], pulp_upper[order]
+    row_lower, row_upper = model.row_lower[kept_rows], model.row_upper[kept_rows]
+    same_sense = numpy.isinf(row_lower) == numpy.isinf(pulp_lower)
+    sign = numpy.where(same_sense, 1.0, -1.0)
+    assert numpy.allclose(row_lower, numpy.where(same_sense, pulp_lower, -pulp_upper), rtol=1e-12, atol=1e-9)
+    assert numpy.allclose(row_upper, numpy.where(same_sense, pulp_upper, -pulp_lower), rtol=1e-12, atol=1e-9)
+    difference = abs(matrix[kept_rows] - scipy.sparse.diags(sign) @ pulp_matrix).max(axis=1).toarray().ravel()
+    scale = abs(matrix[kept_rows]).max(axis=1).toarray().ravel()
+    assert numpy.all(difference <= 1e-9 * scale)
+
+    variables = {variable.name: variable for variable in program.variables()}
+    assert set(column_names) == set(variables)
+    assert numpy.array_equal(model.column_lower[:num_binaries], [variables[name].lowBound for name in column_names])
+    assert numpy.array_equal(model.column_upper[:num_binaries], [variables[name].upBound for name in column_names])
+    assert numpy.all(model.integrality[:num_binaries] == 1) and all(variable.cat == pulp.LpInteger for variable in variables.values())
+    assert numpy.all(model.column_lower[num_binaries:] == 0) and numpy.all(numpy.isinf(model.column_upper[num_binaries:]))
+    objective = {variable.name: coefficient for variable, coefficient in program.objective.items()}
+    assert numpy.allclose(model.objective[:len(model.deal_ids)], [objective[f'Deal_{deal_id}'] for deal_id in model.deal_ids.tolist()])
+
+def agency_distances(tape, taken_deal_ids):
+    '''The distance between the c13 to c18 measures of both agencies, computed directly on the sold loans'''
+    sold = {agency: [] for agency in agencies}
+    for deal_id in taken_deal_ids:
+        deal = tape.deals[deal_id]
+        sold[tape.pools[deal.pool_id].agency].append(tape.loans[deal.loan_id])
+    measures = {name: [] for name in ['c13', 'c14', 'c15', 'c16', 'c17', 'c18']}
+    for agency in agencies:
+        loans = sold[agency]
+        total = sum(loan.amount for loan in loans)
+        measures['c13'].append(sum(loan.fico * loan.amount for loan in loans) / total)
+        measures['c14'].append(sum(loan.dti * loan.amount for loan in loans) / total)
+        for name, field, _ in comparable_categories:
+            values = set(getattr(loan, field) for loan in tape.loans.values())
+            measures[name].append({value: sum(getattr(loan, field) == value for loan in loans) / len(loans) for value in values})
+    distances = {name: abs(measures[name][0] - measures[name][1]) for name in ['c13', 'c14']}
+    for name, _, _ in comparable_categories:
+        distances[name] = max(abs(measures[name][0][value] - measures[name][1][value]) for value in measures[name][0])
+    return distances
+
+def exact_point(tape, arrays, taken_deal_ids, constraints):
+    model = build_matrix(arrays, constraints, None, 'exact')
+    values = column_values(tape, taken_deal_ids)
+    values.update(exact_column_values(arrays, taken_deal_ids, constraints))
+    return model, numpy.array([values.get(name, 0) for name in model.column_names], dtype=numpy.float64)
+
+def violated_rows(model, point, tolerance=1e-6):
+    '''The labels of the rows and the names of the columns whose bounds the point violates'''
+    activity = model.matrix @ point
+    scale = 1 + abs(model.matrix).max(axis=1).toarray().ravel()
+    rows = numpy.flatnonzero((activity < model.row_lower - tolerance * scale) | (activity > model.row_upper + tolerance * scale))
+    columns = numpy.flatnonzero((point < model.column_lower - tolerance) | (point > model.column_upper + tolerance) |
+        ((model.integrality == 1) & (abs(point - numpy.round(point)) > tolerance)))
+    return [model.row_labels[row] for row in rows.tolist()] + [model.column_names[column] for column in columns.tolist()]
+
+def test_exact_comparability_accepts_the_greedy_assignment(small_tape, constraints):
+    arrays = TapeArrays(small_tape)
+    taken_deal_ids = greedy_assignment(small_tape, constraints).taken_deal_ids
+    distances = agency_distances(small_tape, taken_deal_ids)
+    assert all(distances[name] <= constraints[name] for name in distances)
+    model, point = exact_point(small_tape, arrays, taken_deal_ids, constraints)
+    assert violated_rows(model, point) == []
+
+@pytest.mark.parametrize('name', ['c13', 'c14', 'c15', 'c16', 'c17', 'c18'])
+def test_exact_comparability_enforces_the_agency_distance(small_tape, constraints, name):
+    arrays = TapeArrays(small_tape)
+    taken_deal_ids = greedy_assignment(small_tape, constraints).taken_deal_ids
+    distance = agency_distances(small_tape, taken_deal_ids)[name]
+    assert distance > 0
+    # the rows admit the assignment exactly when the threshold reaches the distance between the agencies
+    model, point = exact_point(small_tape, arrays, taken_deal_ids, dict(constraints, **{name: distance * (1 + 1e-9)}))
+    assert violated_rows(model, point) == []
+    model, point = exact_point(small_tape, arrays, taken_deal_ids, dict(constraints, **{name: distance * 0.9}))
+    violated = violated_rows(model, point, tolerance=1e-9)
+    first_row, end_row = model.family_rows['c13-c18']
+    assert violated and set(violated) <= set(model.row_labels[first_row:end_row])
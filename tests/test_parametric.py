@@ -0,0 +1,50 @@
+import numpy
+import pytest
+from mortgages import TapeArrays, greedy_assignment, comparability_centers
+from mortgages.matrix import build_matrix, update_matrix, updatable
+from mortgages.parametric import ParametricModel
+from mortgages.presolve import presolve
+
+def greedy_start(tape, constraints):
+    return comparability_centers(tape, greedy_assignment(tape, constraints).taken_deal_ids, constraints, centered=True)
+
+def assert_same_model(model, expected):
+    assert (model.matrix != expected.matrix).nnz == 0
+    assert numpy.array_equal(model.row_lower, expected.row_lower)
+    assert numpy.array_equal(model.row_upper, expected.row_upper)
+    assert model.row_labels == expected.row_labels
+
+@pytest.mark.parametrize('changes', [{'c3': 120000000}, {'c8': 150000000}, {'c3': 120000000, 'c8': 150000000, 'c5': 710, 'c9': 730}])
+def test_update_matches_a_fresh_build(small_tape, constraints, changes):
+    start = greedy_start(small_tape, constraints)
+    arrays = TapeArrays(small_tape)
+    changed = dict(constraints, **changes)
+    model = build_matrix(arrays, constraints, start)
+    assert updatable(model, changed)
+    assert_same_model(update_matrix(model, arrays, changed), build_matrix(arrays, changed, start))
+
+def test_parametric_model_updates_highs_in_place(small_tape, constraints):
+    start = greedy_start(small_tape, constraints)
+    parametric = ParametricModel(small_tape, constraints, start)
+    changed = dict(constraints, c3=120000000, c8=150000000)
+    bounds, coefficients = parametric.update(changed)
+    # c3 and c8 only move the bound of the first row of their family
+    assert (bounds, coefficients) == (2, 0)
+    expected = build_matrix(TapeArrays(small_tape), changed, start)
+    assert_same_model(parametric.model, expected)
+    lp = parametric.highs.getLp()
+    assert numpy.array_equal(lp.row_lower_, expected.row_lower) and numpy.array_equal(lp.row_upper_, expected.row_upper)
+    assert parametric.updates == 1 and parametric.rebuilds == 0
+
+def test_presolved_model_refuses_another_c1(small_tape, constraints):
+    presolve(small_tape, constraints)
+    start = greedy_start(small_tape, constraints)
+    parametric = ParametricModel(small_tape, constraints, start)
+    changed = dict(constraints, c1=constraints['c1'] / 2)
+    assert not updatable(parametric.model, changed)
+    with pytest.raises(ValueError):
+        update_matrix(parametric.model, parametric.tape_arrays, changed)
+    with pytest.raises(ValueError):
+        parametric.update(changed)
+    # the thresholds that presolve did not use can still move
+    assert parametric.update(dict(constraints, c3=120000000)) == (1, 0)
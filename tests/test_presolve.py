@@ -0,0 +1,43 @@
+import os
+import pytest
+from mortgages import TapeArrays, load_constraints, prune
+from mortgages.matrix import build_matrix
+from mortgages.solve import solve_matrix
+from mortgages.presolve import presolve
+from conftest import raw_directory
+
+take_every_deal = 40
+
+@pytest.fixture
+def tiny_problem(parsed_tape):
+    '''Every 40th deal without c13 to c18, with c3 and c8 scaled down to match and a c2 that some loans reach on their own'''
+    constraints = load_constraints(os.path.join(raw_directory, 'Constraints.csv'))
+    constraints.update(c2=500000, c3=constraints['c3'] / 20, c8=constraints['c8'] / 20)
+    tape = parsed_tape.copy()
+    prune(tape, constraints, take_every_deal)
+    return tape, constraints
+
+def single_deals(tape):
+    return sum(len(tape.index.pool_deals(pool_id)) for pool_id, pool in tape.pools.items() if pool.is_single)
+
+def helper_rows(model):
+    return sum(1 for label in model.row_labels if ' is not empty if loan ' in label)
+
+def test_presolve_keeps_the_optimum(tiny_problem):
+    tape, constraints = tiny_problem
+    presolved = tape.copy()
+    report = presolve(presolved, constraints)
+    assert len(presolved.deals) < len(tape.deals)
+
+    # only the model of the presolved tape leaves out the helper rows of the loans that reach c2 on their own
+    full_model = build_matrix(TapeArrays(tape), constraints, None)
+    presolved_model = build_matrix(TapeArrays(presolved), constraints, None)
+    removed_links = report.removed['single issuer links'][0]
+    assert removed_links > 0
+    assert helper_rows(full_model) == single_deals(tape)
+    assert helper_rows(presolved_model) == single_deals(presolved) - removed_links
+
+    full = solve_matrix(full_model, time_limit=60)
+    reduced = solve_matrix(presolved_model, time_limit=60)
+    # both are optimal up to the relative MIP gap of HiGHS
+    assert reduced.objective == pytest.approx(full.objective, rel=2e-4)
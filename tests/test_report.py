@@ -0,0 +1,33 @@
+import os
+import pytest
+from mortgages import greedy_assignment, solution_rows, load_constraints, prune
+from mortgages.raw import load_loans, load_pools, load_combs
+from mortgages.score import score_solution
+from conftest import raw_directory
+
+@pytest.fixture(scope='module')
+def raw_tape():
+    return (load_loans(os.path.join(raw_directory, 'LoanData.csv')), load_pools(os.path.join(raw_directory, 'PoolOptionData.csv')),
+        load_combs(os.path.join(raw_directory, 'EligiblePricingCombinations.csv')))
+
+@pytest.fixture(scope='module')
+def servicer_constraints():
+    '''The constraints without c13 to c18, for which the greedy assignment is feasible'''
+    return load_constraints(os.path.join(raw_directory, 'Constraints.csv'))
+
+def test_report_scores_like_the_scorer(parsed_tape, tables, raw_tape, servicer_constraints):
+    tape = parsed_tape.copy()
+    prune(tape, servicer_constraints)
+    rows = solution_rows(tape, greedy_assignment(tape, servicer_constraints).taken_deal_ids)
+    report = tables.report(servicer_constraints, rows)
+    assert report.feasible
+    assert report.normalized_score == pytest.approx(score_solution(*raw_tape, servicer_constraints, rows), rel=1e-9)
+
+def test_report_lists_what_the_scorer_rejects(tape, tables, raw_tape, constraints):
+    # every loan sold to its best priced deal breaks some of the constraints
+    best_deals = [max(loan_deals.values(), key=lambda deal: deal.price).id for loan_deals in tape.index.by_loan.values()]
+    rows = solution_rows(tape, best_deals)
+    report = tables.report(constraints, rows)
+    assert not report.feasible
+    with pytest.raises(AssertionError):
+        score_solution(*raw_tape, constraints, rows)
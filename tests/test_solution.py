@@ -0,0 +1,77 @@
+import io
+import pytest
+from mortgages.solution import read_cplex_xml, read_cbc_text, read_highs_text, read_taken_deals
+
+cplex_solution = b'''<?xml version = "1.0" encoding="UTF-8" standalone="yes"?>
+<CPLEXSolution version="1.2">
+ <header problemName="MortgagesProblem.lp" objectiveValue="1234.5" solutionStatusString="integer optimal solution"/>
+ <quality epInt="1.0000000000000001e-05" maxIntInfeas="0"/>
+ <linearConstraints>
+  <constraint name="Mutex_constraint_for_loan_7" index="0" slack="0"/>
+ </linearConstraints>
+ <variables>
+  <variable name="Deal_12" index="0" value="1"/>
+  <variable name="Deal_13" index="1" value="0"/>
+  <variable name="Deal_14" index="2" value="0.99999999"/>
+  <variable name="Deal_15" index="3" value="0.999"/>
+  <variable name="SinglePool_3" index="4" value="1"/>
+  <variable name="Deal_16" index="5" value="1.0000001"/>
+ </variables>
+</CPLEXSolution>
+'''
+
+cbc_solution = b'''Optimal - objective value 1234.50000000
+      0 Deal_12                        1                 -5.5
+      1 Deal_13                        0                 -3.25
+**    2 Deal_14               0.99999999                 -2
+      3 Deal_15                    0.999                  -1
+      4 SinglePool_3                   1                   0
+      5 Deal_16                1.0000001                   0
+'''
+
+highs_solution = b'''Model status
+Optimal
+
+# Primal solution values
+Feasible
+Objective 1234.5
+# Columns 6
+Deal_12 1
+Deal_13 0
+Deal_14 0.99999999
+Deal_15 0.999
+SinglePool_3 1
+Deal_16 1.0000001
+# Rows 1
+Mutex_constraint_for_loan_7 1
+
+# Dual solution values
+None
+'''
+
+# Deal_14 and Deal_16 lie within the default tolerance of one, Deal_15 only within a tolerance of 1e-2
+taken = [12, 14, 16]
+taken_loosely = [12, 14, 15, 16]
+
+def solution_file(contents):
+    return io.BufferedReader(io.BytesIO(contents))
+
+def lines(contents):
+    return (line.decode() for line in solution_file(contents))
+
+def test_read_cplex_xml():
+    assert list(read_cplex_xml(solution_file(cplex_solution))) == taken
+    assert list(read_cplex_xml(solution_file(cplex_solution), tolerance=1e-2)) == taken_loosely
+
+def test_read_cbc_text():
+    assert list(read_cbc_text(lines(cbc_solution))) == taken
+    assert list(read_cbc_text(lines(cbc_solution), tolerance=1e-2)) == taken_loosely
+
+def test_read_highs_text():
+    assert list(read_highs_text(lines(highs_solution))) == taken
+    assert list(read_highs_text(lines(highs_solution), tolerance=1e-2)) == taken_loosely
+
+@pytest.mark.parametrize('contents', [cplex_solution, cbc_solution, highs_solution], ids=['cplex', 'cbc', 'highs'])
+def test_read_taken_deals_recognizes_the_format(contents):
+    assert list(read_taken_deals(solution_file(contents))) == taken
+    assert list(read_taken_deals(solution_file(contents), tolerance=1e-2)) == taken_loosely
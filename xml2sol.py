@@ -1,13 +1,14 @@
-import xml.dom.minidom
 import sys
+import argparse
+from mortgages.solution import read_taken_deals
 
-solution = xml.dom.minidom.parse(sys.stdin)
-variables = solution.getElementsByTagName('variable')
+parser = argparse.ArgumentParser()
+parser.add_argument('--format', '-f', choices=['auto', 'cplex', 'cbc', 'highs'], default='auto',
+    help='CPLEX XML, CBC or HiGHS plain text solution; auto recognizes it from the first line')
+parser.add_argument('--tolerance', '-t', type=float, default=1e-6,
+    help='how far from 1 the value of a taken deal variable may be')
+args = parser.parse_args()
 
 print('TakenDealId')
-deal_prefix = 'Deal_'
-for variable in variables:
-    if variable.attributes['name'].nodeValue.startswith(deal_prefix) and variable.attributes['value'].nodeValue == '1':
-        taken_deal = variable.attributes['name'].nodeValue
-        taken_deal_id = int(taken_deal[len(deal_prefix):])
-        print(taken_deal_id)
+for taken_deal_id in read_taken_deals(sys.stdin.buffer, args.format, args.tolerance):
+    print(taken_deal_id)